@@ -42,6 +42,7 @@ import { NextResponse } from "next/server";
 import prisma from "@/lib/prisma";
 import nodemailer from "nodemailer";
 import bcrypt from "bcryptjs";
+import { invalidateChatbotTickets, toChatbotTicket, updateChatbotContext } from "@/lib/chatbotCache";
 
 export async function POST(req) {
   try {
@@ -90,8 +91,10 @@ export async function POST(req) {
       const ticket = await prisma.ticket.update({
         where: { id: openTickets[i].id },
         data: { agentId: agent.id, status: "IN_PROGRESS" },
-        include: { user: true, service: true },
+        include: { user: true, service: true, agent: true, payment: true, delivery: true },
       });
+      invalidateChatbotTickets({ ticketIds: [ticket.id], userIds: [ticket.userId] });
+      updateChatbotContext(ticket.userId, [toChatbotTicket(ticket)]);
 
       // Log assignment
       await prisma.ticketLog.create({
@@ -1,6 +1,7 @@
 import prisma from "@/lib/prisma";
 import { NextResponse } from "next/server";
 import { assignTicketToAgent } from "@/lib/ticketHelper";
+import { invalidateChatbotTickets, updateChatbotContext } from "@/lib/chatbotCache";
 
 export async function DELETE(req, { params }) {
   // In Next.js App Router, params is a Promise and must be awaited
@@ -36,6 +37,15 @@ export async function DELETE(req, { params }) {
         status: 'OPEN'
       }
     });
+    if (unassignedTickets.length > 0) {
+      invalidateChatbotTickets({
+        ticketIds: unassignedTickets.map(t => t.id),
+        userIds: [...new Set(unassignedTickets.map(t => t.userId))],
+      });
+      for (const ticket of unassignedTickets) {
+        updateChatbotContext(ticket.userId, [{ id: ticket.id, status: "OPEN", agent: null }]);
+      }
+    }
 
     // Delete agent
     await prisma.agent.delete({ where: { id: agentId } });
@@ -1,15 +1,52 @@
 import { NextResponse } from "next/server";
+import { getServerSession } from "next-auth";
 import prisma from "@/lib/prisma";
+import { authOptions } from "@/app/api/auth/[...nextauth]/route";
+import { chatbotHeaders, toChatbotTicket } from "@/lib/chatbotCache";
 
 const FLASK_API_URL = process.env.FLASK_API_URL || "http://localhost:5000";
 
+// Without the shared token the chatbot can't keep a user's ticket context,
+// so dashboard messages carry the tickets themselves every time
+const CONTEXT_STORED = Boolean(process.env.CHATBOT_SERVICE_TOKEN);
+if (!CONTEXT_STORED) {
+  console.warn("CHATBOT_SERVICE_TOKEN is not set: dashboard chats send the user's tickets with every message");
+}
+
+// The user's latest tickets as extra /chat body fields
+async function ticketContext(userId) {
+  try {
+    const userTickets = await prisma.ticket.findMany({
+      where: { userId: parseInt(userId) },
+      include: {
+        service: true,
+        agent: true,
+        payment: true,
+        delivery: true
+      },
+      orderBy: { createdAt: 'desc' },
+      take: 5
+    });
+    // Sent as structured records so the chatbot doesn't re-parse text
+    return { tickets: userTickets.map(toChatbotTicket) };
+  } catch (err) {
+    console.error("Error fetching user tickets:", err);
+    // Answer with no ticket context rather than storing an empty one
+    return { userId: undefined, tickets: [] };
+  }
+}
+
 export async function POST(request) {
   let language = "en"; // Default language
   
   try {
-    const { message, language: reqLanguage = "en", userId, isDashboard = false } = await request.json();
+    const { message, language: reqLanguage = "en", isDashboard = false } = await request.json();
     language = reqLanguage; // Update language from request
 
+    // The user comes from the session, never from the request body
+    const session = await getServerSession(authOptions);
+    const userId = session?.user?.userType === "USER" ? session.user.id : undefined;
+
     if (!message) {
       return NextResponse.json(
         { error: "Message is required" },
@@ -17,50 +54,36 @@ export async function POST(request) {
       );
     }
 
-    // If from dashboard and user is logged in, fetch their tickets for context
-    let userContext = "";
-    if (isDashboard && userId) {
-      try {
-        const tickets = await prisma.ticket.findMany({
-          where: { userId: parseInt(userId) },
-          include: {
-            service: true,
-            agent: true,
-            payment: true,
-            delivery: true
-          },
-          orderBy: { createdAt: 'desc' },
-          take: 5
-        });
+    const forwardedFor = request.headers.get("x-forwarded-for");
+    // Dashboard messages reference the user's ticket context stored in the
+    // chatbot; it is only loaded and sent when the chatbot asks for it (409)
+    const askChatbot = (extra = {}) =>
+      fetch(`${FLASK_API_URL}/chat`, {
+        method: "POST",
+        // Lets the chatbot rate-limit signed-out visitors per browser, not per server.
+        // It trusts only the entry our router appended (its TRUSTED_PROXY_HOPS
+        // counts our router and its own), not what the browser sent.
+        headers: chatbotHeaders(forwardedFor ? { "X-Forwarded-For": forwardedFor } : {}),
+        body: JSON.stringify({ message, language, userId, isDashboard, ...extra }),
+      });
 
-        if (tickets.length > 0) {
-          userContext = `\n\nUser's Recent Tickets:\n`;
-          tickets.forEach(t => {
-            userContext += `- Ticket #${t.id}: ${t.service.name} (${t.status})`;
-            if (t.agent) userContext += ` | Agent: ${t.agent.name}`;
-            if (t.payment) userContext += ` | Payment: ${t.payment.status}`;
-            if (t.delivery) userContext += ` | Delivery: ${t.delivery.status}`;
-            userContext += `\n`;
-          });
-        }
-      } catch (err) {
-        console.error("Error fetching user tickets:", err);
-      }
+    const dashboardUser = isDashboard && userId;
+    let response = await askChatbot(dashboardUser && !CONTEXT_STORED ? await ticketContext(userId) : {});
+    if (response.status === 409 && dashboardUser) {
+      response = await askChatbot(await ticketContext(userId));
     }
 
-    // Call Flask chatbot API
-    const response = await fetch(`${FLASK_API_URL}/chat`, {
-      method: "POST",
-      headers: {
-        "Content-Type": "application/json",
-      },
-      body: JSON.stringify({ 
-        message: message + userContext, 
-        language, 
-        userId,
-        isDashboard 
-      }),
-    });
+    // Rate-limited or shedding load: pass the status and Retry-After through
+    if (response.status === 429 || response.status === 503) {
+      const busy = await response.json();
+      return NextResponse.json({
+        success: false,
+        response: language === "ur"
+          ? "چیٹ بوٹ اس وقت مصروف ہے۔ براہ کرم چند لمحوں بعد دوبارہ کوشش کریں۔"
+          : "The chatbot is busy right now. Please try again in a moment.",
+        error: busy.error,
+      }, { status: response.status, headers: { "Retry-After": response.headers.get("Retry-After") ?? "1" } });
+    }
 
     if (!response.ok) {
       throw new Error("Flask API error");
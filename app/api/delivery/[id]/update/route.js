@@ -1,6 +1,7 @@
 import { NextResponse } from "next/server";
 import prisma from "@/lib/prisma";
 import nodemailer from "nodemailer";
+import { updateChatbotContext } from "@/lib/chatbotCache";
 
 export async function PATCH(req, context) {
   try {
@@ -66,6 +67,10 @@ export async function PATCH(req, context) {
       }
     });
 
+    if (status && status !== delivery.status) {
+      updateChatbotContext(updatedDelivery.ticket.userId, [{ id: updatedDelivery.ticketId, delivery: updatedDelivery.status }]);
+    }
+
     // Send email notification for status changes
     if (status && status !== delivery.status) {
       setImmediate(async () => {
@@ -1,6 +1,7 @@
 import { NextResponse } from "next/server";
 import prisma from "@/lib/prisma";
 import nodemailer from "nodemailer";
+import { updateChatbotContext } from "@/lib/chatbotCache";
 
 export async function POST(req) {
   try {
@@ -105,6 +106,8 @@ export async function POST(req) {
       });
     });
 
+    updateChatbotContext(updatedPayment.userId, [{ id: updatedPayment.ticketId, payment: updatedPayment.status }]);
+
     // Simulate payment processing delay AFTER transaction
     await new Promise((resolve) => setTimeout(resolve, 2000));
 
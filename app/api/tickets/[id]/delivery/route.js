@@ -1,5 +1,6 @@
 import { NextResponse } from "next/server";
 import prisma from "@/lib/prisma";
+import { updateChatbotContext } from "@/lib/chatbotCache";
 
 // POST - Create delivery details for a ticket
 export async function POST(request, context) {
@@ -61,6 +62,7 @@ export async function POST(request, context) {
         status: "PENDING",
       },
     });
+    updateChatbotContext(ticket.userId, [{ id: ticketId, delivery: delivery.status }]);
 
     return NextResponse.json({
       success: true,
@@ -127,7 +129,9 @@ export async function PATCH(request, context) {
     const delivery = await prisma.delivery.update({
       where: { ticketId: ticketId },
       data: { status: status },
+      include: { ticket: { select: { userId: true } } },
     });
+    updateChatbotContext(delivery.ticket.userId, [{ id: ticketId, delivery: delivery.status }]);
 
     return NextResponse.json({
       success: true,
@@ -2,6 +2,7 @@ import { NextResponse } from "next/server";
 import prisma from "@/lib/prisma";
 import nodemailer from "nodemailer";
 import { recalculateQueuePositions } from "@/lib/queueHelper";
+import { invalidateChatbotTickets, updateChatbotContext } from "@/lib/chatbotCache";
 
 export async function PATCH(req, context) {
   const params = await context.params;
@@ -20,6 +21,8 @@ export async function PATCH(req, context) {
       data: { status, closedAt: status === "COMPLETED" ? new Date() : null },
       include: { agent: true, user: true, service: true },
     });
+    invalidateChatbotTickets({ ticketIds: [updated.id], userIds: [updated.userId] });
+    updateChatbotContext(updated.userId, [{ id: updated.id, status: updated.status, agent: updated.agent?.name ?? null }]);
     //also send mail to user about ticket completion
     if (status === "COMPLETED") { 
       setImmediate(async () => {
@@ -63,10 +66,13 @@ export async function PATCH(req, context) {
       return NextResponse.json({ success: true, ticket: updated });
     }
     //updated payment status
-    await prisma.payment.updateMany({
+    const { count: paymentsCompleted } = await prisma.payment.updateMany({
       where: { ticketId: ticketId },
       data: { status: "COMPLETED" },
     });
+    if (paymentsCompleted) {
+      updateChatbotContext(updated.userId, [{ id: updated.id, payment: "COMPLETED" }]);
+    }
     // AUTO-ASSIGN NEXT TICKET
     const autoAssigned = await prisma.$transaction(async (tx) => {
       const agentId = updated.agentId;
@@ -119,6 +125,8 @@ export async function PATCH(req, context) {
 
     // SEND EMAIL (but DO NOT FAIL API if email fails)
     if (autoAssigned) {
+      invalidateChatbotTickets({ ticketIds: [autoAssigned.id], userIds: [autoAssigned.userId] });
+      updateChatbotContext(autoAssigned.userId, [{ id: autoAssigned.id, status: autoAssigned.status, agent: updated.agent?.name ?? null }]);
       setImmediate(async () => {
         try {
           const transporter = nodemailer.createTransport({
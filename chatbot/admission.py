@@ -0,0 +1,174 @@
+"""Admission control for chat requests.
+
+``TokenBucketLimiter`` rate-limits each user (or client IP). ``ConcurrencyLimit``
+caps how many AI calls a worker has in flight. ``LoadShedder`` looks at how
+busy the worker is, and how long a request already queued in front of it,
+and decides whether a new request is served normally, degraded to the rule
+engine, or rejected. Everything is per worker process and non-blocking: a
+request is never made to wait for capacity.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+ADMIT = "admitted"
+DEGRADE = "degraded"
+REJECT = "overloaded"
+RATE_LIMITED = "rate_limited"
+
+
+def retry_after_seconds(seconds):
+    """Whole seconds for a Retry-After header, at least 1"""
+    return max(1, math.ceil(seconds))
+
+
+class TokenBucketLimiter:
+    """One token bucket per key, refilled at ``rate`` tokens a second up to ``burst``.
+
+    Only the ``max_keys`` most recently seen keys are tracked; a key that
+    was pushed out starts again with a full bucket.
+    """
+
+    def __init__(self, rate, burst, max_keys=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.limited = 0
+
+    def acquire(self, key, cost=1):
+        """Take ``cost`` tokens; returns 0 if allowed, else seconds until they would be available"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            if tokens >= cost:
+                tokens -= cost
+                wait = 0.0
+                self.allowed += 1
+            else:
+                wait = (cost - tokens) / self.rate
+                self.limited += 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def stats(self):
+        with self._lock:
+            return {
+                "keys": len(self._buckets),
+                "rate": self.rate,
+                "burst": self.burst,
+                "allowed": self.allowed,
+                "limited": self.limited,
+            }
+
+
+class ConcurrencyLimit:
+    """Soft cap on calls in flight: check ``has_capacity()``, then ``acquire()`` per call started.
+
+    The check and the acquire are separate so a caller can run other checks
+    (like a circuit breaker) in between; two callers racing for the last
+    slot may both get it.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self.peak = 0
+        self.refused = 0
+        self._lock = threading.Lock()
+
+    def has_capacity(self):
+        with self._lock:
+            if self.in_flight >= self.limit:
+                self.refused += 1
+                return False
+            return True
+
+    def acquire(self):
+        with self._lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": self.in_flight, "limit": self.limit, "peak": self.peak, "refused": self.refused}
+
+
+class LoadShedder:
+    """Decide per request whether to serve it fully, degrade it or turn it away.
+
+    A request is degraded (answered without the AI) once more than
+    ``degrade_in_flight`` requests are being served or it queued for longer
+    than ``degrade_queue`` seconds before reaching the worker, and rejected
+    once ``max_in_flight`` are being served or it queued for longer than
+    ``reject_queue``. Degrading sheds the slow part of the work first, so
+    cheap rule-based answers keep flowing while the AI path is saturated.
+    """
+
+    def __init__(self, max_in_flight=64, degrade_in_flight=16, degrade_queue=0.5, reject_queue=5.0):
+        self.max_in_flight = max_in_flight
+        self.degrade_in_flight = degrade_in_flight
+        self.degrade_queue = degrade_queue
+        self.reject_queue = reject_queue
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self.decisions = {ADMIT: 0, DEGRADE: 0, REJECT: 0}
+
+    def admit(self, queued=0.0, weight=1):
+        """Return ADMIT, DEGRADE or REJECT; call ``release(weight)`` after serving anything but REJECT.
+
+        ``weight`` is how many requests' worth of work this one brings (at
+        most ``max_in_flight``), e.g. a batch's concurrent AI calls.
+        """
+        weight = min(weight, self.max_in_flight)
+        with self._lock:
+            if self.in_flight + weight > self.max_in_flight or queued > self.reject_queue:
+                decision = REJECT
+            else:
+                self.in_flight += weight
+                if self.in_flight > self.degrade_in_flight or queued > self.degrade_queue:
+                    decision = DEGRADE
+                else:
+                    decision = ADMIT
+            self.decisions[decision] += 1
+        return decision
+
+    def release(self, weight=1):
+        with self._lock:
+            self.in_flight -= min(weight, self.max_in_flight)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "degrade_in_flight": self.degrade_in_flight,
+                **self.decisions,
+            }
+
+
+def queued_seconds(request_start, now=None):
+    """Time since a router's ``X-Request-Start`` stamp, 0 when there is none"""
+    if not request_start:
+        return 0.0
+    try:
+        stamp = float(request_start.strip().removeprefix("t="))
+    except ValueError:
+        return 0.0
+    # Heroku sends milliseconds since the epoch; nginx setups use seconds
+    # ("t=${msec}") or microseconds
+    if stamp > 1e14:
+        stamp /= 1e6
+    elif stamp > 1e11:
+        stamp /= 1e3
+    return max(0.0, (time.time() if now is None else now) - stamp)
@@ -0,0 +1,179 @@
+"""Request coalescing for upstream AI calls.
+
+``SingleFlight`` lets concurrent identical prompts share one call: the first
+caller starts it and everyone else asking the same thing while it is in
+flight gets the same future. ``MicroBatcher`` and ``AsyncMicroBatcher``
+gather distinct prompts for a few milliseconds and send them upstream as one
+batched inference request.
+"""
+import asyncio
+import threading
+import time
+
+
+class SingleFlight:
+    """Share one in-flight call between callers with the same key.
+
+    Works with both ``concurrent.futures.Future`` and asyncio tasks - anything
+    with ``add_done_callback``. A key is forgotten as soon as its call
+    finishes, so later callers start a fresh one (the response cache takes
+    over from there).
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.started = 0
+        self.shared = 0
+
+    def submit(self, key, start):
+        """Return ``(future, joined)``: the call already running for ``key``, or the one ``start()`` returns.
+
+        ``start()`` may return None to decline starting a call; ``(None, False)``
+        is then returned and nothing is remembered for ``key``.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.shared += 1
+                return future, True
+            future = start()
+            if future is None:
+                return None, False
+            self._calls[key] = future
+            self.started += 1
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return future, False
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+
+    def stats(self):
+        return {"in_flight": len(self._calls), "started": self.started, "shared": self.shared}
+
+
+class _Batch:
+    __slots__ = ("items", "results", "done")
+
+    def __init__(self):
+        self.items = []
+        self.results = None
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    """Collect prompts from concurrent threads into batched upstream calls.
+
+    The first caller into an empty batch becomes its leader: it waits up to
+    ``max_wait`` seconds (less if the batch fills up), then sends the whole
+    batch with ``send_batch(items)`` on its own thread while the other
+    callers wait for their slot of the result list. No extra threads are
+    started, so the batcher is safe to create before gunicorn forks.
+    """
+
+    def __init__(self, send_batch, max_batch_size=8, max_wait=0.01):
+        self.send_batch = send_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._open = None
+        self._cond = threading.Condition()
+        self.batches = 0
+        self.items = 0
+
+    def call(self, item):
+        """Add ``item`` to the current batch and return its result (None on failure)"""
+        with self._cond:
+            batch = self._open
+            leader = batch is None
+            if leader:
+                batch = self._open = _Batch()
+            index = len(batch.items)
+            batch.items.append(item)
+            if len(batch.items) >= self.max_batch_size:
+                self._open = None
+                self._cond.notify_all()
+            if leader:
+                deadline = time.monotonic() + self.max_wait
+                while self._open is batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._open = None
+                        break
+                    self._cond.wait(remaining)
+                self.batches += 1
+                self.items += len(batch.items)
+
+        if leader:
+            try:
+                batch.results = self.send_batch(batch.items)
+            finally:
+                batch.done.set()
+        else:
+            batch.done.wait()
+        return batch.results[index] if batch.results and index < len(batch.results) else None
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0,
+        }
+
+
+class AsyncMicroBatcher:
+    """asyncio counterpart of MicroBatcher; ``send_batch`` is a coroutine function"""
+
+    def __init__(self, send_batch, max_batch_size=8, max_wait=0.01):
+        self.send_batch = send_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._items = []
+        self._futures = []
+        self._timer = None
+        self._tasks = set()
+        self.batches = 0
+        self.items = 0
+
+    async def call(self, item):
+        """Add ``item`` to the current batch and return its result (None on failure)"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._items.append(item)
+        self._futures.append(future)
+        if len(self._items) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        items, futures = self._items, self._futures
+        self._items, self._futures = [], []
+        if not items:
+            return
+        self.batches += 1
+        self.items += len(items)
+        task = asyncio.ensure_future(self._send(items, futures))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, items, futures):
+        try:
+            results = await self.send_batch(items)
+        except Exception:
+            results = None
+        for index, future in enumerate(futures):
+            if not future.done():
+                future.set_result(results[index] if results and index < len(results) else None)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0,
+        }
@@ -1,53 +1,102 @@
-from flask import Flask, request, jsonify
+import time
+
+# Taken before the other imports so the startup stats cover all of them
+IMPORT_STARTED = time.monotonic()
+
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 import os
 from datetime import datetime
-from dotenv import load_dotenv
-import mysql.connector
-import requests
 import json
+import re
+import functools
+import hashlib
+import hmac
+import importlib
+import logging
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, wait, FIRST_COMPLETED
+
+from db_pool import ConnectionPool, connect_mysql, parse_database_url
+import metrics
+from admission import (
+    ADMIT, RATE_LIMITED, REJECT, ConcurrencyLimit, LoadShedder, TokenBucketLimiter, queued_seconds, retry_after_seconds,
+)
+from ai_coalescing import MicroBatcher, SingleFlight
+from circuit_breaker import CircuitBreaker
+from context_store import ContextMissing, UserContextStore
+from inference_client import AsyncInferenceClient, AsyncStubInferenceClient, InferenceClient, StubInferenceClient
+from intents import IntentMatcher, first_intent
+from ticket_cache import SqliteInvalidationLog, TicketStatusCache
+from ticket_context import TICKET_CONTEXT_MARKER, TicketContext, split_ticket_context
+from retrieval import KnowledgeRetriever
+from response_cache import ResponseCache, SqliteCacheBackend, make_cache_key, normalize_message
+from structured_logging import setup_logging, request_id_var, new_request_id, redact, queue_stats
+from warmup import Readiness
+
+readiness = Readiness(IMPORT_STARTED)
+
+def load_env_file():
+    """Load the nearest .env file above this one, as load_dotenv() would.
+    
+    python-dotenv is only imported when there is a file to read, which
+    deployments configured through real environment variables never have.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    while True:
+        path = os.path.join(directory, ".env")
+        if os.path.isfile(path):
+            from dotenv import load_dotenv
+            load_dotenv(path)
+            return path
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
 
 # Load environment variables
-load_dotenv()
+load_env_file()
+
+log = setup_logging()
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for Next.js frontend
 
 # Initialize Hugging Face API (FREE)
 hf_api_key = os.getenv("HUGGINGFACE_API_KEY")
-HF_API_URL = "https://api-inference.huggingface.co/models/microsoft/Phi-3-mini-4k-instruct"
+HF_API_URL = os.getenv("HF_API_URL", "https://api-inference.huggingface.co/models/microsoft/Phi-3-mini-4k-instruct")
 
-if hf_api_key:
-    print("✓ Hugging Face AI enabled (FREE)")
+# AI_BACKEND=stub answers every AI call locally with canned text, so the
+# service can be tested and benchmarked without an inference endpoint
+AI_BACKEND = os.getenv("AI_BACKEND", "http")
+AI_ENABLED = bool(hf_api_key) or AI_BACKEND == "stub"
+
+if AI_BACKEND == "stub":
+    log.info("Using the stub AI backend")
+elif hf_api_key:
+    log.info("Hugging Face AI enabled (FREE)")
 else:
-    print("ℹ️  Using rule-based responses (set HUGGINGFACE_API_KEY for AI features)")
-    print("   Get free key at: https://huggingface.co/settings/tokens")
+    log.info("Using rule-based responses (set HUGGINGFACE_API_KEY for AI features, "
+             "free key at https://huggingface.co/settings/tokens)")
+
+# Database connection pool - connection parameters are parsed once at startup.
+# Sync gunicorn workers serve one request at a time, so a small pool per
+# worker is enough; raise DB_POOL_SIZE when running threaded workers.
+DATABASE_URL = os.getenv("DATABASE_URL", "mysql://root:@localhost:3306/nadradb")
+DB_CONFIG = parse_database_url(DATABASE_URL)
+# Bounds how long warm-up (and a request) waits on an unreachable database
+DB_CONFIG["connection_timeout"] = int(os.getenv("DB_CONNECT_TIMEOUT", "5"))
+db_pool = ConnectionPool(
+    DB_CONFIG,
+    size=int(os.getenv("DB_POOL_SIZE", "2")),
+    timeout=float(os.getenv("DB_POOL_TIMEOUT", "5")),
+    recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+)
 
-# Database connection
 def get_db_connection():
-    """Get database connection for tracking queries"""
-    try:
-        db_url = os.getenv("DATABASE_URL", "mysql://root:@localhost:3306/nadradb")
-        # Parse database URL
-        parts = db_url.replace('mysql://', '').split('/')
-        host_part = parts[0].split('@')[-1].split(':')[0]
-        port = int(parts[0].split(':')[-1]) if ':' in parts[0].split('@')[-1] else 3306
-        database = parts[1] if len(parts) > 1 else 'nadradb'
-        user_pass = parts[0].split('@')[0].split(':')
-        user = user_pass[0]
-        password = user_pass[1] if len(user_pass) > 1 else ''
-        
-        conn = mysql.connector.connect(
-            host=host_part,
-            port=port,
-            user=user,
-            password=password,
-            database=database
-        )
-        return conn
-    except Exception as e:
-        print(f"Database connection error: {e}")
-        return None
+    """Check out a pooled database connection for tracking queries"""
+    return db_pool.connection()
 
 # NADRA-specific knowledge base for fallback
 NADRA_KNOWLEDGE = {
@@ -85,59 +134,322 @@ NADRA_KNOWLEDGE = {
     }
 }
 
+# Rule-based intent keywords (English and Urdu), matched as substrings of the
+# lowercased message. All lists are compiled into one matcher at import.
+DASHBOARD_TICKET_INTENTS = [
+    # How to upload documents (CHECK THIS FIRST - most specific)
+    ("upload", ['upload', 'document', 'file', 'attach', 'send document', 'add document', 'اپ لوڈ', 'دستاویز']),
+    ("agent", ['agent', 'assigned', 'who is', 'who handling', 'officer', 'ایجنٹ', 'افسر']),
+    ("show", ['show', 'my ticket', 'my application', 'list', 'all ticket', 'میری درخواست', 'دکھائیں']),
+    ("latest", ['latest', 'recent', 'last', 'newest', 'تازہ ترین', 'حالیہ']),
+    ("payment", ['payment', 'pay', 'fee', 'paid', 'ادائیگی', 'فیس']),
+    ("progress", ['progress', 'processing', 'working on', 'جاری', 'عمل']),
+    ("completed", ['completed', 'finished', 'done', 'ready', 'مکمل', 'ختم']),
+    ("delivery", ['delivery', 'deliver', 'ship', 'ڈیلیوری', 'ترسیل']),
+]
+
+DASHBOARD_EMPTY_INTENTS = [
+    ("no_tickets", ['ticket', 'application', 'status', 'track', 'show']),
+    ("help", ['help', 'what can', 'how', 'مدد', 'کیسے']),
+]
+
+# Public chatbot - redirect to login
+PUBLIC_TRACKING_INTENT = ("track_login", ['track', 'status', 'application', 'ticket', 'my application', 'my ticket'])
+
+# Intent names are NADRA_KNOWLEDGE keys
+KNOWLEDGE_INTENTS = [
+    ("greeting", ['hello', 'hi', 'hey', 'salam', 'السلام علیکم', 'assalam']),
+    ("id card", ['id card', 'cnic', 'شناختی کارڈ', 'identity']),
+    ("passport", ['passport', 'پاسپورٹ']),
+    ("verification", ['verify', 'verification', 'تصدیق', 'check']),
+    ("fee", ['fee', 'cost', 'price', 'فیس', 'قیمت']),
+    ("documents", ['document', 'required', 'need', 'دستاویز']),
+    ("tracking", ['track', 'status', 'ٹریک', 'حیثیت']),
+    ("centers", ['center', 'office', 'location', 'مرکز']),
+]
+
+ALL_INTENTS = DASHBOARD_TICKET_INTENTS + DASHBOARD_EMPTY_INTENTS + [PUBLIC_TRACKING_INTENT] + KNOWLEDGE_INTENTS
+INTENT_MATCHER = IntentMatcher(ALL_INTENTS)
+DASHBOARD_TICKET_PRIORITY = [name for name, _ in DASHBOARD_TICKET_INTENTS]
+DASHBOARD_EMPTY_PRIORITY = [name for name, _ in DASHBOARD_EMPTY_INTENTS]
+KNOWLEDGE_PRIORITY = [name for name, _ in KNOWLEDGE_INTENTS]
+
+# Local knowledge retrieval - confident matches are answered without the AI
+RETRIEVAL_MIN_CONFIDENCE = float(os.getenv("RETRIEVAL_MIN_CONFIDENCE", "0.55"))
+RETRIEVAL_MIN_MARGIN = float(os.getenv("RETRIEVAL_MIN_MARGIN", "0.1"))
+
+def knowledge_documents():
+    """Retrieval documents for each NADRA_KNOWLEDGE topic in English and Urdu"""
+    keywords = dict(KNOWLEDGE_INTENTS)
+    documents, answers = [], {}
+    for topic, texts in NADRA_KNOWLEDGE.items():
+        if topic == "greeting":
+            continue
+        doc_id = f"topic:{topic}"
+        documents.append((doc_id, " ".join([topic, texts["en"], texts["ur"], *keywords.get(topic, [])])))
+        answers[doc_id] = texts
+    return documents, answers
+
+def service_documents():
+    """Retrieval documents for each Service row and its required documents"""
+    query = """
+        SELECT s.id, s.name, s.description, s.fee,
+               d.documentName, d.description as documentDescription, d.isMandatory
+        FROM Service s
+        LEFT JOIN RequiredDocument d ON d.serviceId = s.id
+        ORDER BY s.id, d.isMandatory DESC, d.documentName
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(query)
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+    
+    services = {}
+    for row in rows:
+        service = services.setdefault(row['id'], {"row": row, "documents": []})
+        if row['documentName']:
+            service["documents"].append(row)
+    
+    documents, answers = [], {}
+    for service_id, service in services.items():
+        row = service["row"]
+        doc_id = f"service:{service_id}"
+        text = [row['name'], row['description'] or ""]
+        en = f"📄 {row['name']}\n\n"
+        ur = f"📄 {row['name']}\n\n"
+        if row['description']:
+            en += f"{row['description']}\n\n"
+            ur += f"{row['description']}\n\n"
+        en += f"💰 Fee: Rs. {row['fee']:,.0f}"
+        ur += f"💰 فیس: Rs. {row['fee']:,.0f}"
+        if service["documents"]:
+            en += "\n\n✅ Required Documents:"
+            ur += "\n\n✅ مطلوبہ دستاویزات:"
+            for document in service["documents"]:
+                text += [document['documentName'], document['documentDescription'] or ""]
+                en += f"\n• {document['documentName']}" + ("" if document['isMandatory'] else " (optional)")
+                ur += f"\n• {document['documentName']}" + ("" if document['isMandatory'] else " (اختیاری)")
+        documents.append((doc_id, " ".join(text)))
+        answers[doc_id] = {"en": en, "ur": ur}
+    return documents, answers
+
+def build_retriever(include_services=False):
+    """Index the knowledge base, plus the database's services if requested"""
+    documents, answers = knowledge_documents()
+    if include_services:
+        service_docs, service_answers = service_documents()
+        documents += service_docs
+        answers.update(service_answers)
+    return KnowledgeRetriever(documents, answers, RETRIEVAL_MIN_CONFIDENCE, RETRIEVAL_MIN_MARGIN)
+
+knowledge_retriever = build_retriever()
+
+# The database's services are indexed during warm-up (see warm_shared), once
+# in the gunicorn master when the app is preloaded
+RETRIEVAL_SERVICES = os.getenv("RETRIEVAL_SERVICES", "true").lower() not in ("0", "false", "no")
+
+def load_service_knowledge():
+    """Rebuild the retriever with the database's services and required documents"""
+    global knowledge_retriever
+    try:
+        knowledge_retriever = build_retriever(include_services=True)
+        log.info("Retrieval index built", extra={"stage": "retrieval", "documents": len(knowledge_retriever)})
+    except Exception as e:
+        log.warning("Service knowledge not indexed", extra={"stage": "retrieval", "error": str(e)})
+        raise
+    return len(knowledge_retriever)
+
+def answer_from_knowledge(message, language="en"):
+    """Answer from the local retrieval index, or None when it isn't confident"""
+    with metrics.RETRIEVAL_STAGE.time():
+        return knowledge_retriever.answer(message, language)
+
+# Ticket status lookups are cached briefly per worker and dropped early via
+# /tickets/invalidate when a ticket changes. Set TICKET_CACHE_DB to a file
+# shared by the workers so an invalidation reaches all of them.
+ticket_cache_db = os.getenv("TICKET_CACHE_DB")
+ticket_cache = TicketStatusCache(
+    ttl=float(os.getenv("TICKET_CACHE_TTL", "15")),
+    max_entries=int(os.getenv("TICKET_CACHE_SIZE", "10000")),
+    invalidation_log=SqliteInvalidationLog(ticket_cache_db) if ticket_cache_db else None,
+)
+
+# Dashboard users' recent tickets, pushed as snapshots and deltas so a chat
+# message only has to carry the userId. Deltas reach the other workers
+# through the same invalidation log as the ticket cache.
+context_store = UserContextStore(
+    max_users=int(os.getenv("CONTEXT_STORE_SIZE", "10000")),
+    ttl=float(os.getenv("CONTEXT_TTL", "600")),
+    invalidation_log=ticket_cache.invalidation_log,
+)
+TICKET_STATUS_MAX_KEYS = int(os.getenv("TICKET_STATUS_MAX_KEYS", "100"))
+
+# One query per key type, each resolving every requested key with IN (...).
+# CNIC and email lookups return each user's latest 5 tickets through a LATERAL
+# join, so every user is an index range read on Ticket(userId, createdAt)
+# walked backwards - no filesort. Users without tickets still return one row
+# (with a NULL ticket id) so the cache can tie the entry to the user.
+TICKET_STATUS_QUERIES = {
+    "id": """
+        SELECT t.id AS lookupKey, t.id, t.userId, t.status, t.createdAt, s.name as serviceName,
+               u.name as userName, a.name as agentName
+        FROM Ticket t
+        JOIN Service s ON t.serviceId = s.id
+        JOIN User u ON t.userId = u.id
+        LEFT JOIN Agent a ON t.agentId = a.id
+        WHERE t.id IN ({placeholders})
+    """,
+    "cnic": """
+        SELECT u.cnic AS lookupKey, u.id AS userId, latest.id, latest.status, latest.createdAt, latest.serviceName
+        FROM User u
+        LEFT JOIN LATERAL (
+            SELECT t.id, t.status, t.createdAt, s.name as serviceName
+            FROM Ticket t
+            JOIN Service s ON t.serviceId = s.id
+            WHERE t.userId = u.id
+            ORDER BY t.createdAt DESC
+            LIMIT 5
+        ) latest ON TRUE
+        WHERE u.cnic IN ({placeholders})
+    """,
+    "email": """
+        SELECT u.email AS lookupKey, u.id AS userId, latest.id, latest.status, latest.createdAt, latest.serviceName
+        FROM User u
+        LEFT JOIN LATERAL (
+            SELECT t.id, t.status, t.createdAt, s.name as serviceName
+            FROM Ticket t
+            JOIN Service s ON t.serviceId = s.id
+            WHERE t.userId = u.id
+            ORDER BY t.createdAt DESC
+            LIMIT 5
+        ) latest ON TRUE
+        WHERE u.email IN ({placeholders})
+    """,
+}
+
+# LATERAL needs MySQL 8.0.14+, and MariaDB has none. Older servers get the
+# latest 5 tickets through a correlated subquery instead: it finds each
+# user's 5th-newest createdAt (one backward step on Ticket(userId, createdAt))
+# and joins the tickets at or after it. Ties at that cutoff can return a
+# sixth row, which query_ticket_statuses() trims.
+_LATEST_TICKETS_COMPAT = """
+        SELECT u.{column} AS lookupKey, u.id AS userId, t.id, t.status, t.createdAt, s.name as serviceName
+        FROM User u
+        LEFT JOIN Ticket t ON t.userId = u.id AND t.createdAt >= COALESCE((
+            SELECT cutoff.createdAt FROM Ticket cutoff
+            WHERE cutoff.userId = u.id
+            ORDER BY cutoff.createdAt DESC
+            LIMIT 4, 1
+        ), t.createdAt)
+        LEFT JOIN Service s ON t.serviceId = s.id
+        WHERE u.{column} IN ({{placeholders}})
+"""
+TICKET_STATUS_QUERIES_COMPAT = dict(
+    TICKET_STATUS_QUERIES,
+    cnic=_LATEST_TICKETS_COMPAT.format(column="cnic"),
+    email=_LATEST_TICKETS_COMPAT.format(column="email"),
+)
+LATEST_TICKETS = 5
+# Chosen from the server version on the first connection, see ticket_status_queries()
+ticket_queries = None
+
+def supports_lateral(version):
+    """Whether a ``SELECT VERSION()`` string is MySQL 8.0.14 or newer"""
+    numbers = re.match(r"(\d+)\.(\d+)\.(\d+)", version)
+    if not numbers or "mariadb" in version.lower():
+        return False
+    return tuple(int(n) for n in numbers.groups()) >= (8, 0, 14)
+
+def ticket_status_queries(conn):
+    """The lookup queries this database supports, checked once per process"""
+    global ticket_queries
+    if ticket_queries is None:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT VERSION()")
+            version = str(cursor.fetchone()[0])
+        finally:
+            cursor.close()
+        if supports_lateral(version):
+            ticket_queries = TICKET_STATUS_QUERIES
+        else:
+            log.warning("Database has no LATERAL joins, using the correlated-subquery ticket lookups",
+                        extra={"stage": "db", "version": version})
+            ticket_queries = TICKET_STATUS_QUERIES_COMPAT
+    return ticket_queries
+
+def ticket_lookup_key(kind, value):
+    """Cache key for one lookup; emails compare case-insensitively like the database"""
+    if kind == "id":
+        return ("id", int(value))
+    value = str(value).strip()
+    return (kind, value.lower() if kind == "email" else value)
+
+@metrics.DB_STAGE.time()
+def query_ticket_statuses(cursor, kind, values, queries=TICKET_STATUS_QUERIES):
+    """Run one batched lookup, returning ``{cache_key: rows}`` for every value"""
+    query = queries[kind].format(placeholders=", ".join(["%s"] * len(values)))
+    cursor.execute(query, tuple(values))
+    results = {ticket_lookup_key(kind, value): [] for value in values}
+    for row in cursor.fetchall():
+        key = ticket_lookup_key(kind, row.pop('lookupKey'))
+        if key in results:
+            results[key].append(row)
+    for rows in results.values():
+        rows.sort(key=lambda row: row['createdAt'] or datetime.min, reverse=True)
+        if kind != "id":
+            del rows[LATEST_TICKETS:]
+    return results
+
+def get_ticket_statuses(ticket_ids=(), cnics=(), emails=()):
+    """Look up many tickets, CNICs and emails at once, read through the ticket cache.
+    
+    Returns ``{(kind, key): tickets}`` with an entry for every requested key
+    (an empty list when nothing matched). Database errors propagate.
+    """
+    keys = list(dict.fromkeys(
+        [ticket_lookup_key("id", i) for i in ticket_ids]
+        + [ticket_lookup_key("cnic", c) for c in cnics]
+        + [ticket_lookup_key("email", e) for e in emails]
+    ))
+    found, missing = ticket_cache.get_many(keys)
+    
+    if missing:
+        by_kind = {}
+        for kind, value in missing:
+            by_kind.setdefault(kind, []).append(value)
+        with get_db_connection() as conn:
+            queries = ticket_status_queries(conn)
+            cursor = conn.cursor(dictionary=True)
+            try:
+                for kind, values in by_kind.items():
+                    for key, rows in query_ticket_statuses(cursor, kind, values, queries).items():
+                        ticket_cache.set(key, rows)
+                        found[key] = rows
+            finally:
+                cursor.close()
+    
+    # Drop the placeholder row of a user without tickets
+    return {key: [row for row in found[key] if row['id'] is not None] for key in keys}
+
 def get_ticket_status(ticket_id=None, cnic=None, email=None):
     """Get ticket/application status from database"""
-    conn = get_db_connection()
-    if not conn:
+    if ticket_id:
+        key, lookup = ticket_lookup_key("id", ticket_id), {"ticket_ids": [ticket_id]}
+    elif cnic:
+        key, lookup = ticket_lookup_key("cnic", cnic), {"cnics": [cnic]}
+    elif email:
+        key, lookup = ticket_lookup_key("email", email), {"emails": [email]}
+    else:
         return None
     
     try:
-        cursor = conn.cursor(dictionary=True)
-        
-        if ticket_id:
-            query = """
-                SELECT t.id, t.status, t.createdAt, s.name as serviceName, 
-                       u.name as userName, a.name as agentName
-                FROM Ticket t
-                JOIN Service s ON t.serviceId = s.id
-                JOIN User u ON t.userId = u.id
-                LEFT JOIN Agent a ON t.agentId = a.id
-                WHERE t.id = %s
-            """
-            cursor.execute(query, (ticket_id,))
-        elif cnic:
-            query = """
-                SELECT t.id, t.status, t.createdAt, s.name as serviceName
-                FROM Ticket t
-                JOIN Service s ON t.serviceId = s.id
-                JOIN User u ON t.userId = u.id
-                WHERE u.cnic = %s
-                ORDER BY t.createdAt DESC
-                LIMIT 5
-            """
-            cursor.execute(query, (cnic,))
-        elif email:
-            query = """
-                SELECT t.id, t.status, t.createdAt, s.name as serviceName
-                FROM Ticket t
-                JOIN Service s ON t.serviceId = s.id
-                JOIN User u ON t.userId = u.id
-                WHERE u.email = %s
-                ORDER BY t.createdAt DESC
-                LIMIT 5
-            """
-            cursor.execute(query, (email,))
-        else:
-            return None
-        
-        results = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        return results
+        return get_ticket_statuses(**lookup)[key]
     except Exception as e:
-        print(f"Database query error: {e}")
-        if conn:
-            conn.close()
+        log.warning("Database query error", extra={"stage": "db", "error": str(e)})
         return None
 
 def format_ticket_response(tickets, language="en"):
@@ -173,14 +485,64 @@ def format_ticket_response(tickets, language="en"):
     
     return response.strip()
 
-def get_ai_response(message, language="en"):
-    """Get AI-powered response using Hugging Face (FREE)"""
-    if not hf_api_key:
-        return None
+def parse_ticket_status_request(data):
+    """Validate a /tickets/status body, returning (ticket_ids, cnics, emails, language)"""
+    if not isinstance(data, dict):
+        raise ValueError("Request body must be an object")
+    lookups = []
+    for field in ("ticketIds", "cnics", "emails"):
+        values = data.get(field) or []
+        if not isinstance(values, list):
+            raise ValueError(f"{field} must be a list")
+        lookups.append(values)
+    ticket_ids, cnics, emails = lookups
     
     try:
-        # Create NADRA context for AI
-        system_message = """You are a helpful NADRA (National Database and Registration Authority of Pakistan) assistant. 
+        ticket_ids = [int(i) for i in ticket_ids]
+    except (TypeError, ValueError):
+        raise ValueError("ticketIds must be integers")
+    if not all(isinstance(value, str) and value.strip() for value in cnics + emails):
+        raise ValueError("cnics and emails must be non-empty strings")
+    total = len(ticket_ids) + len(cnics) + len(emails)
+    if not total:
+        raise ValueError("Provide ticketIds, cnics or emails")
+    if total > TICKET_STATUS_MAX_KEYS:
+        raise ValueError(f"At most {TICKET_STATUS_MAX_KEYS} lookups per request")
+    return ticket_ids, cnics, emails, data.get('language', 'en')
+
+def ticket_status_results(statuses, language="en"):
+    """Shape get_ticket_statuses() output for /tickets/status, one result per lookup"""
+    results = []
+    for (kind, key), tickets in statuses.items():
+        results.append({
+            "type": kind,
+            "key": key,
+            "found": bool(tickets),
+            "tickets": [{
+                "id": ticket['id'],
+                "service": ticket['serviceName'],
+                "status": ticket['status'],
+                "agent": ticket.get('agentName'),
+                "createdAt": ticket['createdAt'].isoformat() if ticket['createdAt'] else None,
+            } for ticket in tickets],
+            "response": format_ticket_response(tickets, language),
+        })
+    return results
+
+def parse_ticket_invalidation(data):
+    """Validate a /tickets/invalidate body, returning (ticket_ids, user_ids)"""
+    if not isinstance(data, dict):
+        raise ValueError("Request body must be an object")
+    ids = []
+    for field in ("ticketIds", "userIds"):
+        values = data.get(field) or []
+        if not isinstance(values, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in values):
+            raise ValueError(f"{field} must be a list of integers")
+        ids.append(values)
+    return ids[0], ids[1]
+
+# NADRA context for AI
+AI_SYSTEM_MESSAGE = """You are a helpful NADRA (National Database and Registration Authority of Pakistan) assistant. 
         Help users with:
         - National ID Card (CNIC) applications and renewals
         - Passport services and tracking
@@ -192,87 +554,219 @@ def get_ai_response(message, language="en"):
         
         Be helpful, professional, and provide accurate information about NADRA services.
         Keep responses concise and under 150 words."""
-        
-        if language == "ur":
-            system_message += "\nPlease respond in Urdu language using proper Urdu script."
-        
-        # Prepare prompt for Hugging Face
-        prompt = f"<|system|>{system_message}<|end|><|user|>{message}<|end|><|assistant|>"
-        
-        # Call Hugging Face API (FREE)
-        headers = {"Authorization": f"Bearer {hf_api_key}"}
-        payload = {
-            "inputs": prompt,
-            "parameters": {
-                "max_new_tokens": 250,
-                "temperature": 0.7,
-                "return_full_text": False
-            }
-        }
-        
-        response = requests.post(HF_API_URL, headers=headers, json=payload, timeout=10)
-        
-        if response.status_code == 200:
-            result = response.json()
-            if isinstance(result, list) and len(result) > 0:
-                return result[0].get('generated_text', '').strip()
-        
+
+# Cached answers are tied to the prompt they were generated with, so editing
+# the prompt or model invalidates them automatically
+PROMPT_VERSION = hashlib.sha256(f"{HF_API_URL}\n{AI_SYSTEM_MESSAGE}".encode("utf-8")).hexdigest()[:12]
+
+# AI response cache - set AI_CACHE_DB to a file path to share entries
+# between all gunicorn workers on the dyno
+ai_cache_db = os.getenv("AI_CACHE_DB")
+ai_cache = ResponseCache(
+    max_entries=int(os.getenv("AI_CACHE_SIZE", "1024")),
+    max_bytes=int(os.getenv("AI_CACHE_MAX_BYTES", str(4 * 1024 * 1024))),
+    ttl=int(os.getenv("AI_CACHE_TTL", "3600")),
+    backend=SqliteCacheBackend(ai_cache_db, int(os.getenv("AI_CACHE_DB_SIZE", "10000"))) if ai_cache_db else None,
+)
+
+# Circuit breaker for the AI path - while it is open requests go straight to
+# the rule engine instead of waiting on a slow or failing model
+ai_breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv("AI_BREAKER_FAILURES", "5")),
+    slow_call_seconds=int(os.getenv("AI_BREAKER_SLOW_MS", "5000")) / 1000,
+    reset_timeout=float(os.getenv("AI_BREAKER_RESET", "30")),
+    half_open_calls=int(os.getenv("AI_BREAKER_HALF_OPEN_CALLS", "2")),
+)
+
+# AI calls run on a small thread pool so a request can stop waiting once its
+# latency budget is spent and answer from the rule engine instead
+AI_LATENCY_BUDGET = int(os.getenv("AI_LATENCY_BUDGET_MS", "3000")) / 1000
+AI_WORKERS = int(os.getenv("AI_WORKERS", "4"))
+ai_executor = ThreadPoolExecutor(max_workers=AI_WORKERS, thread_name_prefix="ai")
+
+# Concurrent identical prompts share one upstream call
+AI_SINGLE_FLIGHT = os.getenv("AI_SINGLE_FLIGHT", "true").lower() not in ("0", "false", "no")
+ai_flights = SingleFlight()
+
+# Distinct prompts arriving within AI_BATCH_MAX_WAIT_MS of each other go
+# upstream as one batched request. Off (1) by default since not every
+# inference backend accepts a list of inputs.
+AI_BATCH_MAX_SIZE = int(os.getenv("AI_BATCH_MAX_SIZE", "1"))
+AI_BATCH_MAX_WAIT = int(os.getenv("AI_BATCH_MAX_WAIT_MS", "10")) / 1000
+
+# Admission control, per worker. Each user (or client IP) may send
+# RATE_LIMIT_BURST messages at once, refilled at RATE_LIMIT_PER_MINUTE. Past
+# AI_MAX_IN_FLIGHT AI calls, or once the worker is busy or requests have
+# queued in front of it, new messages are answered without the AI; only
+# past CHAT_MAX_IN_FLIGHT (or QUEUE_REJECT_MS of queueing) are they refused.
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "30"))
+rate_limiter = TokenBucketLimiter(
+    rate=RATE_LIMIT_PER_MINUTE / 60,
+    burst=float(os.getenv("RATE_LIMIT_BURST", "10")),
+) if RATE_LIMIT_PER_MINUTE > 0 else None
+ai_slots = ConcurrencyLimit(int(os.getenv("AI_MAX_IN_FLIGHT", str(4 * AI_WORKERS))))
+load_shedder = LoadShedder(
+    max_in_flight=int(os.getenv("CHAT_MAX_IN_FLIGHT", "64")),
+    degrade_in_flight=int(os.getenv("CHAT_DEGRADE_IN_FLIGHT", "16")),
+    degrade_queue=int(os.getenv("QUEUE_DEGRADE_MS", "500")) / 1000,
+    reject_queue=int(os.getenv("QUEUE_REJECT_MS", "5000")) / 1000,
+)
+OVERLOAD_RETRY_AFTER = int(os.getenv("OVERLOAD_RETRY_AFTER", "2"))
+# Proxies that append the caller's address to X-Forwarded-For on the way
+# from the browser through the Next.js server: its router, then ours
+# (Heroku's). Anything left of what they appended was sent by the client
+# and can't be trusted.
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "2"))
+
+def is_cacheable(message, isDashboard=False):
+    """Only public questions may be cached - dashboard messages carry personal data"""
+    return not isDashboard and TICKET_CONTEXT_MARKER not in message
+
+AI_PARAMETERS = {
+    "max_new_tokens": 250,
+    "temperature": 0.7,
+    "return_full_text": False
+}
+
+# Everything before the user's message is fixed per language, so it is built once
+AI_PROMPT_PREFIXES = {
+    "en": f"<|system|>{AI_SYSTEM_MESSAGE}<|end|><|user|>",
+    "ur": f"<|system|>{AI_SYSTEM_MESSAGE}\nPlease respond in Urdu language using proper Urdu script.<|end|><|user|>",
+}
+AI_PROMPT_SUFFIX = "<|end|><|assistant|>"
+
+# Inference client - one keep-alive connection pool per worker, retrying
+# with jittered backoff while the model is loading (503)
+AI_HTTP_POOL_SIZE = int(os.getenv("AI_HTTP_POOL_SIZE", "100"))
+AI_RETRIES = int(os.getenv("AI_RETRIES", "2"))
+AI_RETRY_BACKOFF = int(os.getenv("AI_RETRY_BACKOFF_MS", "500")) / 1000
+AI_STUB_LATENCY = int(os.getenv("AI_STUB_LATENCY_MS", "0")) / 1000
+
+def create_ai_client(asynchronous=False):
+    """Build the configured inference client; the async one must be built inside the event loop"""
+    if AI_BACKEND == "stub":
+        return (AsyncStubInferenceClient if asynchronous else StubInferenceClient)(AI_STUB_LATENCY)
+    client_class = AsyncInferenceClient if asynchronous else InferenceClient
+    return client_class(
+        HF_API_URL, hf_api_key, pool_size=AI_HTTP_POOL_SIZE, timeout=10,
+        retries=AI_RETRIES, backoff=AI_RETRY_BACKOFF, max_backoff=8 * AI_RETRY_BACKOFF,
+    )
+
+ai_client = create_ai_client()
+
+def build_ai_prompt(message, language="en"):
+    """Build the Phi-3 chat prompt for a user message"""
+    return AI_PROMPT_PREFIXES["ur" if language == "ur" else "en"] + message + AI_PROMPT_SUFFIX
+
+def build_ai_payload(message, language="en"):
+    """Build the Hugging Face request body for a user message"""
+    return {"inputs": build_ai_prompt(message, language), "parameters": AI_PARAMETERS}
+
+def parse_ai_result(result):
+    """Extract the generated answer from a Hugging Face response body"""
+    if isinstance(result, list) and len(result) > 0:
+        return result[0].get('generated_text', '').strip()
+    return None
+
+def parse_ai_batch_result(result, size):
+    """Extract one answer per prompt from a batched response body.
+
+    Each entry is either a generation object or a one-element list of them,
+    depending on the backend. Missing entries come back as None.
+    """
+    answers = [None] * size
+    if isinstance(result, list):
+        for i, entry in enumerate(result[:size]):
+            if isinstance(entry, list):
+                answers[i] = parse_ai_result(entry)
+            elif isinstance(entry, dict):
+                answers[i] = entry.get('generated_text', '').strip() or None
+    return answers
+
+def send_ai_batch(prompts):
+    """Send several prompts upstream in one request, returning an answer (or None) per prompt"""
+    metrics.AI_BATCH_SIZE.observe(len(prompts))
+    try:
+        inputs = prompts[0] if len(prompts) == 1 else prompts
+        result = ai_client.generate({"inputs": inputs, "parameters": AI_PARAMETERS})
+        if result is not None:
+            return [parse_ai_result(result)] if len(prompts) == 1 else parse_ai_batch_result(result, len(prompts))
+    except Exception as e:
+        log.warning("Hugging Face API error", extra={"stage": "ai", "error": str(e), "batch_size": len(prompts)})
+    return [None] * len(prompts)
+
+ai_batcher = MicroBatcher(send_ai_batch, AI_BATCH_MAX_SIZE, AI_BATCH_MAX_WAIT) if AI_BATCH_MAX_SIZE > 1 else None
+
+@metrics.AI_STAGE.time()
+def get_ai_response(message, language="en"):
+    """Get AI-powered response using Hugging Face (FREE)"""
+    if not AI_ENABLED:
         return None
+    
+    if ai_batcher is not None:
+        return ai_batcher.call(build_ai_prompt(message, language))
+    
+    try:
+        # Call Hugging Face API (FREE)
+        return parse_ai_result(ai_client.generate(build_ai_payload(message, language)))
     except Exception as e:
-        print(f"Hugging Face API Error: {e}")
+        log.warning("Hugging Face API error", extra={"stage": "ai", "error": str(e)})
         return None
 
-def get_rule_based_response(message, language="en", isDashboard=False):
-    """Fallback rule-based chatbot response"""
+@metrics.RULE_STAGE.time()
+def get_rule_based_response(message, language="en", isDashboard=False, tickets=None):
+    """Fallback rule-based chatbot response.
+    
+    ``tickets`` is the user's parsed TicketContext; when it is not given, any
+    legacy "User's Recent Tickets:" text block in the message is parsed once.
+    """
     
     # Extract original message (before the context)
-    original_message = message.split("User's Recent Tickets:")[0].strip()
+    if tickets is None:
+        original_message, tickets = split_ticket_context(message)
+    else:
+        original_message = message.strip()
     message_lower = original_message.lower()
     
-    # Debug logging
-    print(f"\n=== DEBUG ===")
-    print(f"Original Message: {original_message}")
-    print(f"Message Lower: {message_lower}")
-    print(f"isDashboard: {isDashboard}")
-    has_tickets = "User's Recent Tickets:" in message
-    print(f"Has tickets context: {has_tickets}")
-    print(f"=============\n")
+    has_tickets = tickets is not None
+    
+    # Every keyword list is matched in a single scan of the message
+    matched = INTENT_MATCHER.match(message_lower)
+    
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Rule match", extra={
+            "stage": "rules",
+            "user_message": redact(original_message),
+            "is_dashboard": isDashboard,
+            "has_tickets": has_tickets,
+            "matched": sorted(matched),
+        })
     
     # Dashboard-specific intelligent responses
     if isDashboard:
-        # Extract ticket data from context if available
-        ticket_data = ""
-        
         if has_tickets:
-            ticket_section = message.split("User's Recent Tickets:")[1].strip()
-            if ticket_section:
-                # Parse ticket information
-                ticket_lines = [line.strip() for line in ticket_section.split('\n') if line.strip()]
-                ticket_count = len(ticket_lines)
+            if tickets.tickets:
+                ticket_lines = [ticket.text for ticket in tickets.tickets]
+                ticket_count = len(tickets)
                 
-                # Analyze tickets for status
-                in_progress_tickets = [t for t in ticket_lines if 'IN_PROGRESS' in t]
-                completed_tickets = [t for t in ticket_lines if 'COMPLETED' in t]
-                open_tickets = [t for t in ticket_lines if 'OPEN' in t]
-                pending_payments = [t for t in ticket_lines if 'Payment: PENDING' in t]
+                intent = first_intent(matched, DASHBOARD_TICKET_PRIORITY)
+                metrics.INTENTS.labels(intent or "overview").inc()
                 
                 # How to upload documents (CHECK THIS FIRST - most specific)
-                if any(word in message_lower for word in ['upload', 'document', 'file', 'attach', 'send document', 'add document', 'اپ لوڈ', 'دستاویز']):
-                    print(f"✓ Matched: UPLOAD keywords")
+                if intent == "upload":
                     return "📤 **How to Upload Documents:**\n\n1️⃣ Go to 'My Tickets' section on this page\n2️⃣ Find your ticket card\n3️⃣ Look for the 'Upload Document' button at the bottom\n4️⃣ Click it and select your file\n5️⃣ Supported: PDF, JPG, PNG, DOC (Max 5MB)\n\n✅ **Required Documents:**\n• CNIC copy (front & back)\n• Photos (passport size)\n• Birth certificate\n• Previous documents (if renewal)\n\n💡 Upload documents as soon as possible to speed up processing!"
                 
                 # Agent / assigned
-                elif any(word in message_lower for word in ['agent', 'assigned', 'who is', 'who handling', 'officer', 'ایجنٹ', 'افسر']):
-                    print(f"✓ Matched: AGENT keywords")
-                    agent_tickets = [t for t in ticket_lines if 'Agent:' in t]
+                elif intent == "agent":
+                    agent_tickets = tickets.assigned
                     # Only show non-completed tickets without agents (exclude completed ones with deleted agents)
-                    no_agent_tickets = [t for t in ticket_lines if 'Agent:' not in t and 'COMPLETED' not in t]
+                    no_agent_tickets = tickets.unassigned
                     
                     response = ""
                     if agent_tickets:
                         response += "👤 **Assigned Agents:**\n\n"
                         for ticket in agent_tickets:
-                            response += f"• {ticket}\n"
+                            response += f"• {ticket.text}\n"
                         response += "\n✅ These tickets are being handled by our agents.\n"
                     
                     if no_agent_tickets:
@@ -280,7 +774,7 @@ def get_rule_based_response(message, language="en", isDashboard=False):
                             response += "\n"
                         response += "⏳ **Waiting for Assignment:**\n\n"
                         for ticket in no_agent_tickets:
-                            response += f"• {ticket}\n"
+                            response += f"• {ticket.text}\n"
                         response += "\n⏱️ These will be assigned to an agent soon."
                     
                     if not agent_tickets and not no_agent_tickets:
@@ -289,68 +783,68 @@ def get_rule_based_response(message, language="en", isDashboard=False):
                     return response
                 
                 # Show my tickets / application status
-                elif any(word in message_lower for word in ['show', 'my ticket', 'my application', 'list', 'all ticket', 'میری درخواست', 'دکھائیں']):
+                elif intent == "show":
                     response = "📋 **Your Applications:**\n\n"
                     for i, ticket in enumerate(ticket_lines, 1):
                         response += f"{i}. {ticket}\n"
                     response += f"\n📊 **Summary:** {ticket_count} total applications"
-                    if in_progress_tickets:
-                        response += f"\n🔄 {len(in_progress_tickets)} in progress"
-                    if completed_tickets:
-                        response += f"\n✅ {len(completed_tickets)} completed"
-                    if pending_payments:
-                        response += f"\n💰 {len(pending_payments)} pending payment"
+                    if tickets.in_progress:
+                        response += f"\n🔄 {len(tickets.in_progress)} in progress"
+                    if tickets.completed:
+                        response += f"\n✅ {len(tickets.completed)} completed"
+                    if tickets.pending_payment:
+                        response += f"\n💰 {len(tickets.pending_payment)} pending payment"
                     return response
                 
                 # Latest / recent status
-                elif any(word in message_lower for word in ['latest', 'recent', 'last', 'newest', 'تازہ ترین', 'حالیہ']):
+                elif intent == "latest":
                     latest = ticket_lines[0] if ticket_lines else "No tickets found"
                     return f"🎫 **Your Latest Application:**\n\n{latest}\n\n💡 This is your most recent request."
                 
                 # Payment status
-                elif any(word in message_lower for word in ['payment', 'pay', 'fee', 'paid', 'ادائیگی', 'فیس']):
-                    if pending_payments:
+                elif intent == "payment":
+                    if tickets.pending_payment:
                         response = "💳 **Payment Status:**\n\n"
-                        for ticket in pending_payments:
-                            response += f"⚠️ {ticket}\n"
+                        for ticket in tickets.pending_payment:
+                            response += f"⚠️ {ticket.text}\n"
                         response += "\n📌 Please complete payment to proceed with processing."
                     else:
                         response = "✅ **All Payments Completed!**\n\nYou have no pending payments."
                     return response
                 
                 # In progress / processing
-                elif any(word in message_lower for word in ['progress', 'processing', 'working on', 'جاری', 'عمل']):
-                    if in_progress_tickets:
+                elif intent == "progress":
+                    if tickets.in_progress:
                         response = "🔄 **Applications Being Processed:**\n\n"
-                        for ticket in in_progress_tickets:
-                            response += f"• {ticket}\n"
+                        for ticket in tickets.in_progress:
+                            response += f"• {ticket.text}\n"
                         response += "\n⏱️ Your documents are being processed by our team."
                     else:
                         response = "📭 No applications are currently in progress.\n\n"
-                        if open_tickets:
+                        if tickets.open:
                             response += "🔔 You have pending applications waiting for assignment."
-                        elif completed_tickets:
+                        elif tickets.completed:
                             response += "✅ Your recent applications are completed!"
                     return response
                 
                 # Completed / finished
-                elif any(word in message_lower for word in ['completed', 'finished', 'done', 'ready', 'مکمل', 'ختم']):
-                    if completed_tickets:
+                elif intent == "completed":
+                    if tickets.completed:
                         response = "✅ **Completed Applications:**\n\n"
-                        for ticket in completed_tickets:
-                            response += f"• {ticket}\n"
+                        for ticket in tickets.completed:
+                            response += f"• {ticket.text}\n"
                         response += "\n🎉 These services are ready for collection/delivery!"
                     else:
                         response = "⏳ No completed applications yet.\n\nYour requests are still being processed."
                     return response
                 
                 # Delivery status
-                elif any(word in message_lower for word in ['delivery', 'deliver', 'ship', 'ڈیلیوری', 'ترسیل']):
-                    delivery_tickets = [t for t in ticket_lines if 'Delivery:' in t]
+                elif intent == "delivery":
+                    delivery_tickets = tickets.with_delivery
                     if delivery_tickets:
                         response = "🚚 **Delivery Status:**\n\n"
                         for ticket in delivery_tickets:
-                            response += f"• {ticket}\n"
+                            response += f"• {ticket.text}\n"
                         response += "\n📦 Check 'My Tickets' section for delivery address details."
                     else:
                         response = "📮 No delivery information available.\n\nYour applications might not require delivery or are not at that stage yet."
@@ -368,107 +862,874 @@ def get_rule_based_response(message, language="en", isDashboard=False):
         
         # No tickets yet
         else:
-            if any(word in message_lower for word in ['ticket', 'application', 'status', 'track', 'show']):
+            intent = first_intent(matched, DASHBOARD_EMPTY_PRIORITY)
+            if intent:
+                metrics.INTENTS.labels(intent).inc()
+            if intent == "no_tickets":
                 return "📭 **No Applications Yet**\n\nYou haven't created any service requests.\n\n✨ **Get Started:**\n1. Use 'Create New Service Request' form above\n2. Select a service (ID Card, Passport, etc.)\n3. Choose priority (Normal/Urgent)\n4. Submit your request\n\n🎯 I'll help you track it once created!"
             
             # Help / what can you do
-            if any(word in message_lower for word in ['help', 'what can', 'how', 'مدد', 'کیسے']):
+            if intent == "help":
                 return "🤖 **I can help you with:**\n\n📊 Check application status\n💳 View payment details\n📤 Guide document upload\n🚚 Track delivery\n👤 Check agent assignment\n⏱️ Processing updates\n\n💬 **Try asking:**\n• 'Show my tickets'\n• 'What's my latest status?'\n• 'Any pending payments?'\n• 'How to upload documents?'"
     
     # Public chatbot - redirect to login
-    tracking_keywords = ['track', 'status', 'application', 'ticket', 'my application', 'my ticket']
-    if any(word in message_lower for word in tracking_keywords) and not isDashboard:
+    if "track_login" in matched and not isDashboard:
+        metrics.INTENTS.labels("track_login").inc()
         if language == "ur":
             return "🔐 اپنی درخواستوں کو ٹریک کرنے کے لیے:\n\n1️⃣ اپنے اکاؤنٹ میں لاگ ان کریں\n2️⃣ اپنے ڈیش بورڈ پر جائیں\n3️⃣ 'My Tickets' سیکشن میں تمام درخواستیں دیکھیں\n\n🔒 سیکیورٹی کی وجہ سے، ذاتی درخواست کی تفصیلات صرف لاگ ان کے بعد دستیاب ہیں۔"
         return "🔐 To track your applications:\n\n1️⃣ Login to your account\n2️⃣ Go to your dashboard\n3️⃣ View all tickets in 'My Tickets' section\n\n🔒 For security reasons, personal application details are only available after login."
     
-    # Greeting detection
-    greetings = ['hello', 'hi', 'hey', 'salam', 'السلام علیکم', 'assalam']
-    if any(word in message_lower for word in greetings):
-        return NADRA_KNOWLEDGE["greeting"][language]
-    
-    # Service detection
-    if any(word in message_lower for word in ['id card', 'cnic', 'شناختی کارڈ', 'identity']):
-        return NADRA_KNOWLEDGE["id card"][language]
+    # Greeting and service detection
+    topic = first_intent(matched, KNOWLEDGE_PRIORITY)
+    if topic:
+        metrics.INTENTS.labels(topic).inc()
+        return NADRA_KNOWLEDGE[topic][language]
     
-    if any(word in message_lower for word in ['passport', 'پاسپورٹ']):
-        return NADRA_KNOWLEDGE["passport"][language]
-    
-    if any(word in message_lower for word in ['verify', 'verification', 'تصدیق', 'check']):
-        return NADRA_KNOWLEDGE["verification"][language]
-    
-    if any(word in message_lower for word in ['fee', 'cost', 'price', 'فیس', 'قیمت']):
-        return NADRA_KNOWLEDGE["fee"][language]
-    
-    if any(word in message_lower for word in ['document', 'required', 'need', 'دستاویز']):
-        return NADRA_KNOWLEDGE["documents"][language]
-    
-    if any(word in message_lower for word in ['track', 'status', 'ٹریک', 'حیثیت']):
-        return NADRA_KNOWLEDGE["tracking"][language]
-    
-    if any(word in message_lower for word in ['center', 'office', 'location', 'مرکز']):
-        return NADRA_KNOWLEDGE["centers"][language]
+    # No keyword matched - try the indexed knowledge before giving up
+    local_answer = answer_from_knowledge(original_message, language)
+    if local_answer:
+        metrics.INTENTS.labels("retrieval").inc()
+        return local_answer
     
     # Default response
+    metrics.INTENTS.labels("unknown").inc()
     if language == "ur":
         return "معذرت، میں یہ سمجھ نہیں سکا۔ کیا آپ یہ دوبارہ پوچھ سکتے ہیں؟\n\nآپ پوچھ سکتے ہیں:\n- شناختی کارڈ کے بارے میں\n- پاسپورٹ کے بارے میں\n- فیس کے بارے میں\n- دستاویزات کے بارے میں"
     else:
         return "I'm sorry, I didn't understand that. Could you rephrase?\n\nYou can ask about:\n- ID Card application\n- Passport services\n- Fees and charges\n- Required documents\n- Application tracking"
 
-def get_response(message, language="en", isDashboard=False):
-    """Main response function - tries AI first, falls back to rules"""
-    # Try AI response first
+def lookup_cached_ai_response(message, language="en", isDashboard=False):
+    """Return ``(cache_key, cached_answer)``; the key is None for uncacheable messages"""
+    if not is_cacheable(message, isDashboard):
+        return None, None
+    cache_key = make_cache_key(message, language, PROMPT_VERSION)
+    return cache_key, ai_cache.get(cache_key)
+
+def record_ai_outcome(ai_response, started, cache_key=None, permit=None):
+    """Feed an AI call's outcome to the circuit breaker and the cache"""
+    duration = time.monotonic() - started
+    ai_breaker.record(bool(ai_response), duration, permit)
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("AI call finished", extra={"stage": "ai", "ok": bool(ai_response), "duration_ms": round(duration * 1000, 1)})
+    metrics.AI_CALLS.labels("success" if ai_response else "failure").inc()
+    if ai_response and cache_key:
+        ai_cache.set(cache_key, ai_response)
+
+def ai_flight_key(message, language="en", cache_key=None):
+    """Prompts with the same key may share one upstream call"""
+    return cache_key or (message, language)
+
+def submit_ai_call(message, language="en", cache_key=None):
+    """Run call_ai_guarded() on the AI thread pool, carrying the request ID along.
+    
+    An identical prompt already in flight is joined instead of sent again.
+    Only a caller that starts a new call asks the circuit breaker, since
+    only that call's outcome is recorded; returns None when it refuses.
+    """
+    def start():
+        permit = ai_breaker_allows()
+        if permit is None:
+            return None
+        ai_slots.acquire()
+        future = ai_executor.submit(contextvars.copy_context().run, call_ai_guarded, message, language, cache_key, permit)
+        future.add_done_callback(lambda _: ai_slots.release())
+        return future
+    
+    if not AI_SINGLE_FLIGHT:
+        return start()
+    future, joined = ai_flights.submit(ai_flight_key(message, language, cache_key), start)
+    if joined:
+        metrics.AI_COALESCED.inc()
+    return future
+
+def ai_call_allowed(allow_ai=True):
+    """Whether this request may use the AI: not shed and under AI_MAX_IN_FLIGHT"""
+    if not allow_ai or not ai_slots.has_capacity():
+        metrics.AI_CALLS.labels("shed").inc()
+        return False
+    return True
+
+def ai_breaker_allows():
+    """Ask the circuit breaker for a new upstream call - only by a caller that will record its outcome.
+    
+    Returns the breaker's permit to record the outcome with, or None when it refuses.
+    """
+    permit = ai_breaker.allow_request()
+    if permit is None:
+        metrics.AI_CALLS.labels("rejected").inc()
+    return permit
+
+def call_ai_guarded(message, language="en", cache_key=None, permit=None):
+    """Call the AI model through the circuit breaker, caching any answer"""
+    started = time.monotonic()
     ai_response = get_ai_response(message, language)
-    if ai_response:
-        return ai_response
+    record_ai_outcome(ai_response, started, cache_key, permit)
+    return ai_response
+
+def get_response(message, language="en", isDashboard=False, tickets=None, allow_ai=True):
+    """Main response function - tries AI first, falls back to rules.
+    
+    With ``allow_ai`` False (a degraded request) only local answers are used.
+    """
+    if not AI_ENABLED:
+        metrics.RESPONSES.labels("rules").inc()
+        return get_rule_based_response(message, language, isDashboard, tickets)
+    
+    # Confident local knowledge matches skip the AI entirely
+    if not isDashboard:
+        local_answer = answer_from_knowledge(message, language)
+        if local_answer:
+            metrics.RESPONSES.labels("retrieval").inc()
+            return local_answer
+    
+    # The AI still reads the user's tickets as text
+    ai_message = message + tickets.as_text() if tickets is not None else message
+    
+    # Try AI response first, serving repeated public questions from cache
+    cache_key, cached = lookup_cached_ai_response(ai_message, language, isDashboard)
+    if cached:
+        metrics.RESPONSES.labels("cache").inc()
+        return cached
+    
+    future = submit_ai_call(ai_message, language, cache_key) if ai_call_allowed(allow_ai) else None
+    if future is not None:
+        try:
+            ai_response = future.result(timeout=AI_LATENCY_BUDGET)
+        except FutureTimeout:
+            # Budget spent - the call keeps running and still caches its answer
+            metrics.AI_CALLS.labels("budget_exceeded").inc()
+            log.info("AI latency budget exceeded", extra={"stage": "ai", "budget_ms": AI_LATENCY_BUDGET * 1000})
+            ai_response = None
+        if ai_response:
+            metrics.RESPONSES.labels("ai").inc()
+            return ai_response
     
     # Fallback to rule-based
-    return get_rule_based_response(message, language, isDashboard)
+    metrics.RESPONSES.labels("rules").inc()
+    return get_rule_based_response(message, language, isDashboard, tickets)
+
+def plan_stream(message, language="en", isDashboard=False, tickets=None, allow_ai=True):
+    """Decide how /chat/stream answers a message, in get_response()'s order.
+    
+    Returns ``(answer, source, ai_message, cache_key, permit)``. ``answer``
+    is None when the AI should stream one - ai_call_allowed() and the
+    circuit breaker have then admitted it, with ``permit``.
+    """
+    if not AI_ENABLED:
+        return get_rule_based_response(message, language, isDashboard, tickets), "rules", None, None, None
+    if not isDashboard:
+        local_answer = answer_from_knowledge(message, language)
+        if local_answer:
+            return local_answer, "retrieval", None, None, None
+    ai_message = message + tickets.as_text() if tickets is not None else message
+    cache_key, cached = lookup_cached_ai_response(ai_message, language, isDashboard)
+    if cached:
+        return cached, "cache", None, None, None
+    permit = ai_breaker_allows() if ai_call_allowed(allow_ai) else None
+    if permit is not None:
+        return None, "ai", ai_message, cache_key, permit
+    return get_rule_based_response(message, language, isDashboard, tickets), "rules", None, None, None
+
+class StreamInterrupted(Exception):
+    """The AI stream failed partway; what was relayed so far is not an answer"""
+
+def finish_ai_stream(pieces, started, cache_key=None, outcome="complete", permit=None):
+    """Record a streamed AI call like call_ai_guarded() does; only complete answers are cached.
+    
+    ``outcome`` is "complete", "error" (the upstream failed or stalled
+    mid-answer) or "cancelled" (the client went away).
+    """
+    duration = time.monotonic() - started
+    if outcome == "complete":
+        metrics.AI_STAGE.observe(duration)
+        record_ai_outcome("".join(pieces).strip() or None, started, cache_key, permit)
+    elif outcome == "error":
+        # A truncated answer is a failed call, however many tokens arrived
+        metrics.AI_CALLS.labels("error").inc()
+        ai_breaker.record(False, duration, permit)
+    else:
+        # The client went away - the breaker only learns whether tokens were flowing
+        metrics.AI_CALLS.labels("cancelled").inc()
+        ai_breaker.record(bool(pieces), duration, permit)
+
+def stream_ai_pieces(message, language="en", cache_key=None, permit=None):
+    """Relay the AI's answer as it is generated; closing this early closes the upstream call.
+    
+    Raises StreamInterrupted on a network error or a stall longer than the
+    latency budget, after the pieces already relayed.
+    """
+    ai_slots.acquire()
+    started = time.monotonic()
+    pieces = []
+    outcome = "cancelled"
+    upstream = ai_client.stream(build_ai_payload(message, language), read_timeout=AI_LATENCY_BUDGET)
+    try:
+        for piece in upstream:
+            pieces.append(piece)
+            yield piece
+        outcome = "complete"
+    except Exception as e:
+        log.warning("Hugging Face API error", extra={"stage": "ai", "error": str(e), "tokens": len(pieces)})
+        outcome = "error"
+        raise StreamInterrupted(str(e)) from e
+    finally:
+        upstream.close()
+        ai_slots.release()
+        finish_ai_stream(pieces, started, cache_key, outcome, permit)
+
+def parse_ticket_items(items):
+    """Parse the optional structured ``tickets`` array of a chat request"""
+    if not items:
+        return None
+    if not isinstance(items, list):
+        raise ValueError("tickets must be a list")
+    return TicketContext.from_dicts(items)
+
+def client_address(remote_addr, forwarded_for=None, via_service=True):
+    """The caller's IP: the X-Forwarded-For entry the outermost trusted proxy appended.
+    
+    TRUSTED_PROXY_HOPS counts the proxies on the path through the Next.js
+    server, which passes on the browser's X-Forwarded-For. A request known
+    not to come that way (``via_service`` False) only passed our own
+    router, so it trusts one hop less. With fewer entries than trusted hops
+    the leftmost is used, since every entry was then appended by a proxy.
+    """
+    trusted = max(0, TRUSTED_PROXY_HOPS - (0 if via_service else 1))
+    hops = [hop.strip() for hop in (forwarded_for or "").split(",") if hop.strip()]
+    if not trusted or not hops:
+        return remote_addr
+    return hops[-min(trusted, len(hops))]
+
+def rate_limit_key(data, remote_addr, forwarded_for=None, authenticated=False):
+    """Rate-limit users named by the Next.js server by userId and everyone else by client IP.
+    
+    Without CHATBOT_SERVICE_TOKEN, calls from the Next.js server can't be
+    told apart, so every caller is assumed to come through it.
+    """
+    if authenticated and data.get('userId'):
+        return f"user:{data['userId']}"
+    return "ip:" + client_address(remote_addr, forwarded_for, authenticated or not CHATBOT_SERVICE_TOKEN)
+
+def admit_chat(client_key, queued=0.0, cost=1, weight=1):
+    """Admission decision for chat work, as ``(decision, retry_after)``.
+    
+    ``cost`` is the rate-limit tokens it spends (at most the bucket's burst)
+    and ``weight`` the load_shedder slots it holds. ``retry_after`` is None
+    for ADMIT and DEGRADE, which hold those slots until the caller releases
+    them once the request is answered, and the Retry-After seconds for
+    RATE_LIMITED and REJECT.
+    """
+    if rate_limiter is not None:
+        wait = rate_limiter.acquire(client_key, min(cost, rate_limiter.burst))
+        if wait:
+            metrics.ADMISSION.labels(RATE_LIMITED).inc()
+            return RATE_LIMITED, retry_after_seconds(wait)
+    decision = load_shedder.admit(queued, weight)
+    metrics.ADMISSION.labels(decision).inc()
+    if decision == REJECT:
+        return decision, OVERLOAD_RETRY_AFTER
+    return decision, None
+
+def admission_rejection(decision, retry_after):
+    """Status code and JSON body for a refused chat message"""
+    if decision == RATE_LIMITED:
+        return 429, {"error": "Too many messages, please wait before sending more", "retryAfter": retry_after}
+    return 503, {"error": "The chatbot is busy, please try again shortly", "retryAfter": retry_after}
+
+# The Next.js server authenticates itself with this shared secret, sent as
+# "Authorization: Bearer <token>". CORS is open, so browsers can call this
+# service directly and a userId in a request body proves nothing: only
+# service calls may name the user whose stored ticket context is read or
+# written, or tickets looked up by ID, CNIC or email. While it is unset
+# every such call is refused.
+CHATBOT_SERVICE_TOKEN = os.getenv("CHATBOT_SERVICE_TOKEN", "")
+if not CHATBOT_SERVICE_TOKEN:
+    log.warning("CHATBOT_SERVICE_TOKEN is not set: the context and ticket routes are disabled, "
+                "and dashboard messages need their tickets sent along")
+
+def is_service_request(headers):
+    """Whether a request carries the service token"""
+    scheme, _, token = headers.get("Authorization", "").partition(" ")
+    return bool(CHATBOT_SERVICE_TOKEN) and scheme.lower() == "bearer" and hmac.compare_digest(
+        token.strip().encode("utf-8"), CHATBOT_SERVICE_TOKEN.encode("utf-8")
+    )
+
+SERVICE_AUTH_ERROR = {"error": "Service authentication required"}
+
+def require_service_auth(view):
+    """Answer 401 unless the request comes from the Next.js server"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not is_service_request(request.headers):
+            return jsonify(SERVICE_AUTH_ERROR), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+def resolve_ticket_context(data, isDashboard=False, authenticated=False):
+    """The ticket context a /chat request should be answered with.
+    
+    A ``tickets`` array is used as sent and, for a dashboard user named by an
+    ``authenticated`` (service) request, stored as their snapshot. Such a
+    request with a ``userId`` but no ``tickets`` uses the stored snapshot,
+    raising ContextMissing when there is none. Stored context is never read
+    for anyone else: their dashboard ``userId`` without ``tickets`` raises
+    ContextMissing too, so the caller sends the tickets along instead of
+    silently losing them. Messages with the legacy inline text block are
+    left to the rule engine.
+    """
+    user_id = data.get('userId') if isDashboard else None
+    items = data.get('tickets')
+    if items is not None:
+        tickets = parse_ticket_items(items)
+        if user_id and authenticated:
+            context_store.put(user_id, items)
+        return tickets
+    if not user_id or TICKET_CONTEXT_MARKER in data.get('message', ''):
+        return None
+    if not authenticated:
+        raise ContextMissing("Stored context needs CHATBOT_SERVICE_TOKEN; send the user's tickets with the message")
+    tickets = context_store.get(user_id)
+    if tickets is None:
+        raise ContextMissing(f"No stored context for user {user_id}")
+    # A user without tickets gets the same answers as before (no context)
+    return tickets if len(tickets) else None
+
+def parse_context_delta(data):
+    """Validate a context delta body, returning (updates, removed ticket IDs)"""
+    if not isinstance(data, dict):
+        raise ValueError("Request body must be an object")
+    updates = data.get('updates') or []
+    removed = data.get('remove') or []
+    if not isinstance(updates, list) or not isinstance(removed, list):
+        raise ValueError("updates and remove must be lists")
+    if not updates and not removed:
+        raise ValueError("Provide updates or remove")
+    try:
+        if not all(isinstance(update, dict) for update in updates):
+            raise ValueError
+        updates = [dict(update, id=int(update['id'])) for update in updates]
+        removed = [int(i) for i in removed]
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("Each update needs an integer id, and remove must list integer ids")
+    return updates, removed
+
+class ChatRefused(Exception):
+    """A chat message turned away before it was answered"""
+    
+    def __init__(self, status, body, headers=None):
+        super().__init__(body.get("error"))
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+
+def admit_chat_request(data, remote_addr, headers):
+    """Validate and admit a /chat or /chat/stream body, resolving its ticket context.
+    
+    Returns ``(message, language, isDashboard, tickets, allow_ai)``; the
+    caller must call load_shedder.release() once the message is answered.
+    Raises ChatRefused for a bad, rate-limited or shed request.
+    """
+    message = data.get('message', '')
+    language = data.get('language', 'en')
+    isDashboard = data.get('isDashboard', False)
+    if not message:
+        raise ChatRefused(400, {"error": "Message is required"})
+    
+    authenticated = is_service_request(headers)
+    decision, retry_after = admit_chat(
+        rate_limit_key(data, remote_addr, headers.get("X-Forwarded-For"), authenticated),
+        queued_seconds(headers.get("X-Request-Start")),
+    )
+    if retry_after is not None:
+        status, body = admission_rejection(decision, retry_after)
+        raise ChatRefused(status, body, {"Retry-After": str(retry_after)})
+    
+    # Structured ticket context, sent along or stored for this user
+    try:
+        tickets = resolve_ticket_context(data, isDashboard, authenticated)
+    except ContextMissing as e:
+        load_shedder.release()
+        raise ChatRefused(409, {"error": str(e), "contextRequired": True})
+    except ValueError as e:
+        load_shedder.release()
+        raise ChatRefused(400, {"error": str(e)})
+    return message, language, isDashboard, tickets, decision == ADMIT
+
+def admit_batch_request(data, remote_addr, headers):
+    """Validate and admit a /chat/batch body, like admit_chat_request() for one message.
+    
+    The batch spends a rate-limit token per item and holds a load_shedder
+    slot per AI call it may have in flight (CHAT_BATCH_FANOUT). Returns
+    ``(items, weight, allow_ai)``; the caller must call
+    load_shedder.release(weight) once the batch is answered.
+    """
+    items = data.get('items') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        raise ChatRefused(400, {"error": "items must be a non-empty list"})
+    if len(items) > CHAT_BATCH_MAX_ITEMS:
+        raise ChatRefused(400, {"error": f"Batch exceeds {CHAT_BATCH_MAX_ITEMS} items"})
+    
+    weight = min(len(items), CHAT_BATCH_FANOUT)
+    authenticated = is_service_request(headers)
+    decision, retry_after = admit_chat(
+        rate_limit_key(data, remote_addr, headers.get("X-Forwarded-For"), authenticated),
+        queued_seconds(headers.get("X-Request-Start")),
+        cost=len(items), weight=weight,
+    )
+    if retry_after is not None:
+        status, body = admission_rejection(decision, retry_after)
+        raise ChatRefused(status, body, {"Retry-After": str(retry_after)})
+    return items, weight, decision == ADMIT
+
+def sse_event(event, data):
+    """One server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def stream_chat(message, language="en", isDashboard=False, tickets=None, allow_ai=True, started=None):
+    """Yield /chat/stream's events: AI tokens as they arrive, then one ``done`` event.
+    
+    Local answers (rules, knowledge base, cache) go out as the ``done``
+    event alone. Writing to a disconnected client makes the server close
+    this generator, which closes the upstream AI call.
+    """
+    first_byte = True
+    try:
+        answer, source, ai_message, cache_key, permit = plan_stream(message, language, isDashboard, tickets, allow_ai)
+        if answer is None:
+            pieces = []
+            upstream = stream_ai_pieces(ai_message, language, cache_key, permit)
+            try:
+                for piece in upstream:
+                    if first_byte:
+                        metrics.STREAM_FIRST_BYTE.labels("ai").observe(time.monotonic() - started)
+                        first_byte = False
+                    pieces.append(piece)
+                    yield sse_event("token", {"text": piece})
+            except StreamInterrupted:
+                # The tokens sent so far are superseded by the done event's answer
+                pieces = []
+            finally:
+                upstream.close()
+            answer = "".join(pieces).strip()
+            if not answer:
+                source = "rules"
+                answer = get_rule_based_response(message, language, isDashboard, tickets)
+        if first_byte:
+            metrics.STREAM_FIRST_BYTE.labels(source).observe(time.monotonic() - started)
+        metrics.RESPONSES.labels(source).inc()
+        yield sse_event("done", {
+            "success": True,
+            "response": answer,
+            "source": source,
+            "timestamp": datetime.now().isoformat(),
+            "language": language
+        })
+    finally:
+        load_shedder.release()
+        metrics.REQUEST_SECONDS.labels("chat_stream").observe(time.monotonic() - started)
+
+# Batch chat limits
+CHAT_BATCH_MAX_ITEMS = int(os.getenv("CHAT_BATCH_MAX_ITEMS", "50"))
+CHAT_BATCH_MAX_BYTES = int(os.getenv("CHAT_BATCH_MAX_BYTES", str(256 * 1024)))
+CHAT_BATCH_FANOUT = int(os.getenv("CHAT_BATCH_FANOUT", "4"))
+
+def parse_batch_item(item):
+    """Validate one /chat/batch item, returning (message, language, isDashboard)"""
+    if not isinstance(item, dict):
+        raise ValueError("Item must be an object")
+    message = item.get('message', '')
+    if not message or not isinstance(message, str):
+        raise ValueError("Message is required")
+    tickets = parse_ticket_items(item.get('tickets'))
+    if tickets is not None:
+        message += tickets.as_text()
+    return message, item.get('language', 'en'), bool(item.get('isDashboard', False))
+
+def batch_result(answer_fn, language):
+    """Run ``answer_fn`` for one batch item, turning failures into an error entry"""
+    try:
+        return {"success": True, "response": answer_fn(), "language": language}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+def plan_batch(items):
+    """Answer what can be answered inline and group the rest for the AI.
+
+    Returns ``(results, pending)``. ``results`` holds a result for every item
+    answered from the rules or the cache and None for AI-bound items.
+    ``pending`` maps a dedupe key to ``[message, language, isDashboard,
+    cache_key, indices]`` so identical questions are sent upstream once.
+    """
+    results = [None] * len(items)
+    pending = {}
+    for i, item in enumerate(items):
+        try:
+            message, language, isDashboard = parse_batch_item(item)
+        except ValueError as e:
+            results[i] = {"success": False, "error": str(e)}
+            continue
+        
+        metrics.count_language(language)
+        if not AI_ENABLED:
+            metrics.RESPONSES.labels("rules").inc()
+            results[i] = batch_result(lambda: get_rule_based_response(message, language, isDashboard), language)
+            continue
+        
+        if not isDashboard:
+            local_answer = answer_from_knowledge(message, language)
+            if local_answer:
+                metrics.RESPONSES.labels("retrieval").inc()
+                results[i] = {"success": True, "response": local_answer, "language": language}
+                continue
+        
+        cache_key, cached = lookup_cached_ai_response(message, language, isDashboard)
+        if cached:
+            metrics.RESPONSES.labels("cache").inc()
+            results[i] = {"success": True, "response": cached, "language": language}
+            continue
+        
+        dedupe_key = (normalize_message(message) if cache_key else message, language, isDashboard)
+        if dedupe_key in pending:
+            pending[dedupe_key][4].append(i)
+        else:
+            pending[dedupe_key] = [message, language, isDashboard, cache_key, [i]]
+    return results, pending
+
+def finish_batch(results, pending, answers):
+    """Fill AI-bound slots from ``answers``, falling back to rules for misses"""
+    for dedupe_key, (message, language, isDashboard, _, indices) in pending.items():
+        ai_response = answers.get(dedupe_key)
+        metrics.RESPONSES.labels("ai" if ai_response else "rules").inc(len(indices))
+        if ai_response:
+            result = {"success": True, "response": ai_response, "language": language}
+        else:
+            result = batch_result(lambda: get_rule_based_response(message, language, isDashboard), language)
+        for i in indices:
+            results[i] = result
+    return results
+
+def get_batch_responses(items, allow_ai=True):
+    """Answer many chat items in order with at most CHAT_BATCH_FANOUT AI calls in flight"""
+    results, pending = plan_batch(items)
+    answers = {}
+    queue = list(pending.items())
+    in_flight = {}  # future -> (dedupe_key, deadline)
+    
+    while queue or in_flight:
+        while queue and len(in_flight) < CHAT_BATCH_FANOUT:
+            dedupe_key, (message, language, _, cache_key, _) = queue.pop(0)
+            future = submit_ai_call(message, language, cache_key) if ai_call_allowed(allow_ai) else None
+            if future is not None:
+                in_flight[future] = (dedupe_key, time.monotonic() + AI_LATENCY_BUDGET)
+        if not in_flight:
+            continue
+        
+        timeout = max(0, min(deadline for _, deadline in in_flight.values()) - time.monotonic())
+        done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+        now = time.monotonic()
+        for future in list(in_flight):
+            dedupe_key, deadline = in_flight[future]
+            if future in done:
+                answers[dedupe_key] = future.result()
+            elif deadline > now:
+                continue
+            else:
+                metrics.AI_CALLS.labels("budget_exceeded").inc()
+            # Finished or out of budget - a late call still caches its answer
+            del in_flight[future]
+    
+    return finish_batch(results, pending, answers)
+
+def get_stats():
+    """Runtime counters for this worker process"""
+    return {
+        "db_pool": db_pool.stats(),
+        "ai_cache": ai_cache.stats(),
+        "ticket_cache": ticket_cache.stats(),
+        "context_store": context_store.stats(),
+        "ai_breaker": ai_breaker.stats(),
+        "ai_in_flight": ai_slots.stats(),
+        "rate_limiter": rate_limiter.stats() if rate_limiter is not None else None,
+        "load_shedding": load_shedder.stats(),
+        "ai_client": ai_client.stats(),
+        "ai_single_flight": ai_flights.stats(),
+        "ai_batching": ai_batcher.stats() if ai_batcher is not None else None,
+        "logging": queue_stats(log),
+        "startup": readiness.stats(),
+    }
+
+# Warm-up, so a worker's first request doesn't open the pool, the inference
+# session or the metric files. Under gunicorn (gunicorn.conf.py) warm_shared()
+# runs once in the master when the app is preloaded, and the forked workers
+# share its imports and retrieval index copy-on-write; warm_up() then runs in
+# each worker before it accepts connections. Anywhere else it runs on a
+# background thread from the first request. /health/ready answers 503 until
+# the worker is warm.
+DB_POOL_WARM = int(os.getenv("DB_POOL_WARM", "1"))
+METRIC_INTENTS = [name for name, _ in ALL_INTENTS] + ["overview", "retrieval", "unknown"]
+
+def warm_shared(sync_ai_client=True):
+    """Warm-up a forked worker can inherit: the slow driver imports and the services index"""
+    if readiness.shared_warm:
+        return
+    if db_pool.connect is connect_mysql:
+        readiness.step("import_mysql", importlib.import_module, "mysql.connector")
+    if sync_ai_client and AI_ENABLED and AI_BACKEND != "stub":
+        readiness.step("import_requests", importlib.import_module, "requests")
+    if RETRIEVAL_SERVICES:
+        readiness.step("retrieval_index", load_service_knowledge)
+    # Connections opened here must not outlive the master's warm-up
+    db_pool.close()
+    readiness.shared_warm = True
+
+def warm_ticket_queries():
+    """Check the server version now rather than on the first ticket lookup"""
+    with get_db_connection() as conn:
+        ticket_status_queries(conn)
+
+def warm_worker(sync_ai_client=True):
+    """Per-process warm-up: metric series, pooled connections and the inference session"""
+    readiness.step("metrics", metrics.warm, METRIC_INTENTS)
+    if DB_POOL_WARM > 0:
+        readiness.step("db_pool", db_pool.warm, DB_POOL_WARM)
+        readiness.step("ticket_queries", warm_ticket_queries)
+    if sync_ai_client and AI_ENABLED:
+        readiness.step("ai_client", ai_client.warm)
+
+def warm_up(sync_ai_client=True):
+    """Warm this process up and mark it ready; does nothing if its warm-up already started"""
+    if not readiness.begin():
+        return
+    warm_shared(sync_ai_client)
+    warm_worker(sync_ai_client)
+    warmup_seconds, ready_seconds = readiness.mark_ready()
+    metrics.STARTUP_SECONDS.labels("import").set(readiness.import_seconds or 0)
+    metrics.STARTUP_SECONDS.labels("warmup").set(warmup_seconds)
+    metrics.STARTUP_SECONDS.labels("ready").set(ready_seconds)
+    failed = [name for name, step in readiness.steps.items() if "error" in step]
+    (log.warning if failed else log.info)("Worker ready", extra={
+        "stage": "startup", "preloaded": readiness.preloaded, "warmup_ms": round(warmup_seconds * 1000, 1),
+        "ready_ms": round(ready_seconds * 1000, 1), "failed_steps": failed,
+    })
+
+def start_warm_up(sync_ai_client=True):
+    """Run warm_up() on a background thread, so the process can answer /health meanwhile"""
+    if readiness.warmup_started is None:
+        threading.Thread(target=warm_up, args=(sync_ai_client,), name="warm-up", daemon=True).start()
+
+def record_first_response():
+    """Log and export the time until this process's first response, once"""
+    seconds = readiness.first_response()
+    if seconds is not None:
+        metrics.STARTUP_SECONDS.labels("first_response").set(seconds)
+        log.info("First response sent", extra={"stage": "startup", "first_response_ms": round(seconds * 1000, 1)})
+
+# Service catalogue served by /services
+SERVICES = [
+    {"id": 1, "name": "National ID Card", "name_ur": "قومی شناختی کارڈ"},
+    {"id": 2, "name": "Passport Services", "name_ur": "پاسپورٹ سروسز"},
+    {"id": 3, "name": "Document Verification", "name_ur": "دستاویز کی تصدیق"},
+    {"id": 4, "name": "Family Registration", "name_ur": "خاندانی رجسٹریشن"},
+    {"id": 5, "name": "Certificates", "name_ur": "سرٹیفکیٹس"},
+]
+
+@app.before_request
+def assign_request_id():
+    """Tag everything logged for this request with one request ID"""
+    request_id_var.set(new_request_id(request.headers.get("X-Request-ID")))
+    start_warm_up()
+
+@app.after_request
+def echo_request_id(response):
+    response.headers["X-Request-ID"] = request_id_var.get() or ""
+    if not request.path.startswith('/health'):
+        record_first_response()
+    return response
 
 @app.route('/health', methods=['GET'])
 def health():
-    """Health check endpoint"""
-    return jsonify({"status": "healthy", "service": "NADRA Chatbot API"})
+    """Liveness: the process answers requests, warmed up or not"""
+    return jsonify({"status": "healthy", "service": "NADRA Chatbot API", "ready": readiness.ready})
+
+@app.route('/health/ready', methods=['GET'])
+def health_ready():
+    """Readiness: 503 until this worker has finished warming up"""
+    return jsonify(dict(readiness.stats(), status="ready" if readiness.ready else "warming_up")), \
+        200 if readiness.ready else 503
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    """Runtime counters for this worker process"""
+    return jsonify(get_stats())
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus scrape endpoint, aggregated across gunicorn workers"""
+    body, content_type = metrics.render_metrics()
+    return Response(body, content_type=content_type)
 
 @app.route('/chat', methods=['POST'])
+@metrics.REQUEST_SECONDS.labels("chat").time()
+@metrics.IN_FLIGHT.labels("chat").track_inprogress()
 def chat():
     """Main chat endpoint"""
     try:
-        data = request.json
-        message = data.get('message', '')
-        language = data.get('language', 'en')
-        user_id = data.get('userId', None)
-        isDashboard = data.get('isDashboard', False)
+        try:
+            message, language, isDashboard, tickets, allow_ai = admit_chat_request(
+                request.json, request.remote_addr, request.headers
+            )
+        except ChatRefused as e:
+            return jsonify(e.body), e.status, e.headers
+        
+        try:
+            # Get chatbot response
+            metrics.count_language(language)
+            response = get_response(message, language, isDashboard, tickets, allow_ai)
+        finally:
+            load_shedder.release()
+        
+        with metrics.SERIALIZATION_STAGE.time():
+            return jsonify({
+                "success": True,
+                "response": response,
+                "timestamp": datetime.now().isoformat(),
+                "language": language
+            })
+    
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Chat endpoint that streams the AI's answer as server-sent events"""
+    started = time.monotonic()
+    try:
+        try:
+            message, language, isDashboard, tickets, allow_ai = admit_chat_request(
+                request.json, request.remote_addr, request.headers
+            )
+        except ChatRefused as e:
+            return jsonify(e.body), e.status, e.headers
+        metrics.count_language(language)
+        # The WSGI server pulls events only as fast as the client reads them,
+        # so a slow reader holds back the upstream read instead of buffering
+        return Response(
+            stream_chat(message, language, isDashboard, tickets, allow_ai, started),
+            content_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/chat/batch', methods=['POST'])
+@metrics.REQUEST_SECONDS.labels("chat_batch").time()
+@metrics.IN_FLIGHT.labels("chat_batch").track_inprogress()
+def chat_batch():
+    """Answer a list of chat items; per-item errors don't fail the batch"""
+    try:
+        size = request.content_length if request.content_length is not None else len(request.get_data())
+        if size > CHAT_BATCH_MAX_BYTES:
+            return jsonify({"error": f"Batch exceeds {CHAT_BATCH_MAX_BYTES} bytes"}), 413
         
-        if not message:
-            return jsonify({"error": "Message is required"}), 400
+        try:
+            items, weight, allow_ai = admit_batch_request(request.json, request.remote_addr, request.headers)
+        except ChatRefused as e:
+            return jsonify(e.body), e.status, e.headers
         
-        # Get chatbot response
-        response = get_response(message, language, isDashboard)
+        try:
+            results = get_batch_responses(items, allow_ai)
+        finally:
+            load_shedder.release(weight)
         
-        return jsonify({
-            "success": True,
-            "response": response,
-            "timestamp": datetime.now().isoformat(),
-            "language": language
-        })
+        with metrics.SERIALIZATION_STAGE.time():
+            return jsonify({
+                "success": True,
+                "results": results,
+                "timestamp": datetime.now().isoformat()
+            })
+    
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/tickets/status', methods=['POST'])
+@metrics.REQUEST_SECONDS.labels("tickets_status").time()
+@require_service_auth
+def tickets_status():
+    """Status of many tickets, CNICs and emails in one call"""
+    try:
+        try:
+            ticket_ids, cnics, emails, language = parse_ticket_status_request(request.json)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        statuses = get_ticket_statuses(ticket_ids, cnics, emails)
+        
+        with metrics.SERIALIZATION_STAGE.time():
+            return jsonify({
+                "success": True,
+                "results": ticket_status_results(statuses, language),
+                "timestamp": datetime.now().isoformat(),
+                "language": language
+            })
     
     except Exception as e:
+        log.warning("Ticket status lookup failed", extra={"stage": "db", "error": str(e)})
         return jsonify({"error": str(e)}), 500
 
+@app.route('/tickets/invalidate', methods=['POST'])
+@require_service_auth
+def tickets_invalidate():
+    """Drop cached lookups for tickets that changed (or all tickets of a user)"""
+    try:
+        ticket_ids, user_ids = parse_ticket_invalidation(request.json)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    ticket_cache.invalidate(ticket_ids, user_ids)
+    return jsonify({"success": True})
+
+@app.route('/context/<user_id>', methods=['PUT'])
+@require_service_auth
+def put_context(user_id):
+    """Store a full snapshot of a dashboard user's recent tickets"""
+    try:
+        data = request.json
+        items = data.get('tickets') if isinstance(data, dict) else None
+        if not isinstance(items, list):
+            return jsonify({"error": "tickets must be a list"}), 400
+        context_store.put(user_id, items)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"success": True})
+
+@app.route('/context/<user_id>', methods=['PATCH'])
+@require_service_auth
+def patch_context(user_id):
+    """Apply ticket changes to a stored context; ``applied`` is false when none was stored"""
+    try:
+        updates, removed = parse_context_delta(request.json)
+        applied = context_store.apply_delta(user_id, updates, removed)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"success": True, "applied": applied})
+
+@app.route('/context/<user_id>', methods=['DELETE'])
+@require_service_auth
+def delete_context(user_id):
+    """Forget a user's stored context, e.g. on logout"""
+    try:
+        context_store.delete(user_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"success": True})
+
 @app.route('/services', methods=['GET'])
 def services():
     """Get available services information"""
-    return jsonify({
-        "services": [
-            {"id": 1, "name": "National ID Card", "name_ur": "قومی شناختی کارڈ"},
-            {"id": 2, "name": "Passport Services", "name_ur": "پاسپورٹ سروسز"},
-            {"id": 3, "name": "Document Verification", "name_ur": "دستاویز کی تصدیق"},
-            {"id": 4, "name": "Family Registration", "name_ur": "خاندانی رجسٹریشن"},
-            {"id": 5, "name": "Certificates", "name_ur": "سرٹیفکیٹس"},
-        ]
-    })
+    return jsonify({"services": SERVICES})
+
+readiness.imported()
 
 if __name__ == '__main__':
+    start_warm_up()
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=False)
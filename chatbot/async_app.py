@@ -0,0 +1,488 @@
+"""Asyncio serving mode for the NADRA Chatbot API.
+
+Serves the same /health, /health/ready, /chat, /chat/stream, /chat/batch, /tickets/status,
+/context, /services, /stats and /metrics endpoints as app.py, but a slow Hugging Face call or
+database query only parks a coroutine instead of pinning a whole gunicorn
+worker. The rule engine, AI cache and circuit breaker are shared with the
+sync app and run in-process; calls into the AI cache and the ticket and
+context stores move to a worker thread when those share sqlite files.
+
+Run with:
+    gunicorn async_app:app --worker-class aiohttp.GunicornWebWorker --bind 0.0.0.0:$PORT
+or locally:
+    python async_app.py
+"""
+import asyncio
+import functools
+import os
+import time
+from datetime import datetime
+
+from aiohttp import web
+
+import app as chatbot
+import metrics
+from ai_coalescing import AsyncMicroBatcher, SingleFlight
+from structured_logging import request_id_var, new_request_id
+
+AI_CLIENT = web.AppKey("ai_client", object)
+AI_TASKS = web.AppKey("ai_tasks", set)
+AI_FLIGHTS = web.AppKey("ai_flights", SingleFlight)
+AI_BATCHER = web.AppKey("ai_batcher", AsyncMicroBatcher)
+
+# The AI cache and the ticket and context stores live in memory unless they
+# share sqlite files with the other workers (AI_CACHE_DB, TICKET_CACHE_DB).
+# Only then can their calls block, so only then do they leave the event loop.
+AI_CACHE_SHARED = chatbot.ai_cache.backend is not None
+TICKET_LOG_SHARED = chatbot.ticket_cache.invalidation_log is not None
+
+async def run_blocking(shared, fn, *args):
+    """Call ``fn`` on a worker thread when ``shared`` says it may wait on a sqlite file"""
+    if shared:
+        return await asyncio.to_thread(fn, *args)
+    return fn(*args)
+
+async def get_ai_response(client, message, language="en"):
+    """Non-blocking counterpart of app.get_ai_response()"""
+    if not chatbot.AI_ENABLED:
+        return None
+
+    try:
+        with metrics.AI_STAGE.time():
+            return chatbot.parse_ai_result(await client.generate(chatbot.build_ai_payload(message, language)))
+    except Exception as e:
+        chatbot.log.warning("Hugging Face API error", extra={"stage": "ai", "error": str(e)})
+        return None
+
+async def send_ai_batch(client, prompts):
+    """Non-blocking counterpart of app.send_ai_batch()"""
+    metrics.AI_BATCH_SIZE.observe(len(prompts))
+    try:
+        inputs = prompts[0] if len(prompts) == 1 else prompts
+        with metrics.AI_STAGE.time():
+            result = await client.generate({"inputs": inputs, "parameters": chatbot.AI_PARAMETERS})
+        if result is not None:
+            if len(prompts) == 1:
+                return [chatbot.parse_ai_result(result)]
+            return chatbot.parse_ai_batch_result(result, len(prompts))
+    except Exception as e:
+        chatbot.log.warning("Hugging Face API error", extra={"stage": "ai", "error": str(e), "batch_size": len(prompts)})
+    return [None] * len(prompts)
+
+async def call_ai_guarded(app, message, language="en", cache_key=None, permit=None):
+    """Call the AI model through the shared circuit breaker, caching any answer"""
+    started = time.monotonic()
+    if AI_BATCHER in app:
+        ai_response = await app[AI_BATCHER].call(chatbot.build_ai_prompt(message, language))
+    else:
+        ai_response = await get_ai_response(app[AI_CLIENT], message, language)
+    await run_blocking(AI_CACHE_SHARED, chatbot.record_ai_outcome, ai_response, started, cache_key, permit)
+    return ai_response
+
+def start_ai_call(app, message, language="en", cache_key=None):
+    """Start call_ai_guarded() as a task, joining an identical prompt already in flight.
+
+    Returns None when the circuit breaker refuses a new call, as app.submit_ai_call() does.
+    """
+    def start():
+        permit = chatbot.ai_breaker_allows()
+        if permit is None:
+            return None
+        chatbot.ai_slots.acquire()
+        task = asyncio.create_task(call_ai_guarded(app, message, language, cache_key, permit))
+        # Hold a reference so a call that outlives its budget still finishes
+        app[AI_TASKS].add(task)
+        task.add_done_callback(app[AI_TASKS].discard)
+        task.add_done_callback(lambda _: chatbot.ai_slots.release())
+        return task
+
+    if not chatbot.AI_SINGLE_FLIGHT:
+        return start()
+    task, joined = app[AI_FLIGHTS].submit(chatbot.ai_flight_key(message, language, cache_key), start)
+    if joined:
+        metrics.AI_COALESCED.inc()
+    return task
+
+async def ask_ai_within_budget(app, message, language="en", cache_key=None):
+    """Wait up to AI_LATENCY_BUDGET for an AI answer, letting a late call finish in the background"""
+    task = start_ai_call(app, message, language, cache_key)
+    if task is None:
+        return None
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), chatbot.AI_LATENCY_BUDGET)
+    except asyncio.TimeoutError:
+        metrics.AI_CALLS.labels("budget_exceeded").inc()
+        chatbot.log.info("AI latency budget exceeded", extra={"stage": "ai", "budget_ms": chatbot.AI_LATENCY_BUDGET * 1000})
+        return None
+
+async def get_response(app, message, language="en", isDashboard=False, tickets=None, allow_ai=True):
+    """Async counterpart of app.get_response() - tries AI first, falls back to rules"""
+    if not chatbot.AI_ENABLED:
+        metrics.RESPONSES.labels("rules").inc()
+        return chatbot.get_rule_based_response(message, language, isDashboard, tickets)
+
+    if not isDashboard:
+        local_answer = chatbot.answer_from_knowledge(message, language)
+        if local_answer:
+            metrics.RESPONSES.labels("retrieval").inc()
+            return local_answer
+
+    ai_message = message + tickets.as_text() if tickets is not None else message
+    cache_key, cached = await run_blocking(AI_CACHE_SHARED, chatbot.lookup_cached_ai_response,
+                                           ai_message, language, isDashboard)
+    if cached:
+        metrics.RESPONSES.labels("cache").inc()
+        return cached
+
+    if chatbot.ai_call_allowed(allow_ai):
+        ai_response = await ask_ai_within_budget(app, ai_message, language, cache_key)
+        if ai_response:
+            metrics.RESPONSES.labels("ai").inc()
+            return ai_response
+
+    metrics.RESPONSES.labels("rules").inc()
+    return chatbot.get_rule_based_response(message, language, isDashboard, tickets)
+
+async def stream_ai_pieces(app, message, language="en", cache_key=None, permit=None):
+    """Async counterpart of app.stream_ai_pieces()"""
+    chatbot.ai_slots.acquire()
+    started = time.monotonic()
+    pieces = []
+    outcome = "cancelled"
+    upstream = app[AI_CLIENT].stream(chatbot.build_ai_payload(message, language), read_timeout=chatbot.AI_LATENCY_BUDGET)
+    try:
+        async for piece in upstream:
+            pieces.append(piece)
+            yield piece
+        outcome = "complete"
+    except Exception as e:
+        chatbot.log.warning("Hugging Face API error", extra={"stage": "ai", "error": str(e), "tokens": len(pieces)})
+        outcome = "error"
+        raise chatbot.StreamInterrupted(str(e)) from e
+    finally:
+        await upstream.aclose()
+        chatbot.ai_slots.release()
+        await run_blocking(AI_CACHE_SHARED, chatbot.finish_ai_stream, pieces, started, cache_key, outcome, permit)
+
+async def get_batch_responses(app, items, allow_ai=True):
+    """Async counterpart of app.get_batch_responses()"""
+    results, pending = await run_blocking(AI_CACHE_SHARED, chatbot.plan_batch, items)
+    fanout = asyncio.Semaphore(chatbot.CHAT_BATCH_FANOUT)
+    answers = {}
+
+    async def answer(dedupe_key, message, language, cache_key):
+        async with fanout:
+            if chatbot.ai_call_allowed(allow_ai):
+                answers[dedupe_key] = await ask_ai_within_budget(app, message, language, cache_key)
+
+    await asyncio.gather(*(
+        answer(dedupe_key, message, language, cache_key)
+        for dedupe_key, (message, language, _, cache_key, _) in pending.items()
+    ))
+    return chatbot.finish_batch(results, pending, answers)
+
+async def get_ticket_status(ticket_id=None, cnic=None, email=None):
+    """Run app.get_ticket_status() on a worker thread so the event loop keeps serving"""
+    return await asyncio.to_thread(chatbot.get_ticket_status, ticket_id, cnic, email)
+
+async def get_ticket_statuses(ticket_ids=(), cnics=(), emails=()):
+    """Run app.get_ticket_statuses() on a worker thread so the event loop keeps serving"""
+    return await asyncio.to_thread(chatbot.get_ticket_statuses, ticket_ids, cnics, emails)
+
+@web.middleware
+async def request_id_middleware(request, handler):
+    """Tag everything logged for this request with one request ID"""
+    request_id = new_request_id(request.headers.get("X-Request-ID"))
+    request_id_var.set(request_id)
+    response = await handler(request)
+    response.headers["X-Request-ID"] = request_id
+    if not request.path.startswith('/health'):
+        chatbot.record_first_response()
+    return response
+
+@web.middleware
+async def cors_middleware(request, handler):
+    """Allow cross-origin calls from the Next.js frontend, like flask-cors does"""
+    if request.method == "OPTIONS":
+        response = web.Response()
+        response.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, PATCH, DELETE, OPTIONS"
+        response.headers["Access-Control-Allow-Headers"] = request.headers.get("Access-Control-Request-Headers", "*")
+    else:
+        response = await handler(request)
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    return response
+
+async def health(request):
+    """Liveness: the process answers requests, warmed up or not"""
+    return web.json_response({"status": "healthy", "service": "NADRA Chatbot API", "ready": chatbot.readiness.ready})
+
+async def health_ready(request):
+    """Readiness: 503 until this worker has finished warming up"""
+    ready = chatbot.readiness.ready
+    return web.json_response(dict(chatbot.readiness.stats(), status="ready" if ready else "warming_up"),
+                             status=200 if ready else 503)
+
+async def stats(request):
+    """Runtime counters for this worker process"""
+    worker_stats = chatbot.get_stats()
+    worker_stats["ai_client"] = request.app[AI_CLIENT].stats()
+    worker_stats["ai_single_flight"] = request.app[AI_FLIGHTS].stats()
+    worker_stats["ai_batching"] = request.app[AI_BATCHER].stats() if AI_BATCHER in request.app else None
+    return web.json_response(worker_stats)
+
+async def prometheus_metrics(request):
+    """Prometheus scrape endpoint, aggregated across gunicorn workers"""
+    body, content_type = metrics.render_metrics()
+    return web.Response(body=body, headers={"Content-Type": content_type})
+
+async def chat(request):
+    """Main chat endpoint"""
+    with metrics.REQUEST_SECONDS.labels("chat").time(), metrics.IN_FLIGHT.labels("chat").track_inprogress():
+        return await handle_chat(request)
+
+async def handle_chat(request):
+    try:
+        try:
+            message, language, isDashboard, tickets, allow_ai = await run_blocking(
+                TICKET_LOG_SHARED, chatbot.admit_chat_request, await request.json(), request.remote, request.headers
+            )
+        except chatbot.ChatRefused as e:
+            return web.json_response(e.body, status=e.status, headers=e.headers)
+
+        try:
+            metrics.count_language(language)
+            response = await get_response(request.app, message, language, isDashboard, tickets, allow_ai)
+        finally:
+            chatbot.load_shedder.release()
+
+        with metrics.SERIALIZATION_STAGE.time():
+            return web.json_response({
+                "success": True,
+                "response": response,
+                "timestamp": datetime.now().isoformat(),
+                "language": language
+            })
+
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+
+async def chat_stream(request):
+    """Chat endpoint that streams the AI's answer as server-sent events"""
+    started = time.monotonic()
+    try:
+        message, language, isDashboard, tickets, allow_ai = await run_blocking(
+            TICKET_LOG_SHARED, chatbot.admit_chat_request, await request.json(), request.remote, request.headers
+        )
+    except chatbot.ChatRefused as e:
+        return web.json_response(e.body, status=e.status, headers=e.headers)
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+
+    metrics.count_language(language)
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream", "Cache-Control": "no-cache", "X-Accel-Buffering": "no",
+    })
+    first_byte = True
+    try:
+        await response.prepare(request)
+        answer, source, ai_message, cache_key, permit = await run_blocking(
+            AI_CACHE_SHARED, chatbot.plan_stream, message, language, isDashboard, tickets, allow_ai
+        )
+        if answer is None:
+            pieces = []
+            upstream = stream_ai_pieces(request.app, ai_message, language, cache_key, permit)
+            try:
+                async for piece in upstream:
+                    if first_byte:
+                        metrics.STREAM_FIRST_BYTE.labels("ai").observe(time.monotonic() - started)
+                        first_byte = False
+                    pieces.append(piece)
+                    # write() waits for the socket to drain, so a slow reader
+                    # slows the upstream read instead of growing a buffer
+                    await response.write(chatbot.sse_event("token", {"text": piece}).encode("utf-8"))
+            except chatbot.StreamInterrupted:
+                # The tokens sent so far are superseded by the done event's answer
+                pieces = []
+            finally:
+                # Also on a client disconnect (the write raises), which cancels the upstream call
+                await upstream.aclose()
+            answer = "".join(pieces).strip()
+            if not answer:
+                source = "rules"
+                answer = chatbot.get_rule_based_response(message, language, isDashboard, tickets)
+        if first_byte:
+            metrics.STREAM_FIRST_BYTE.labels(source).observe(time.monotonic() - started)
+        metrics.RESPONSES.labels(source).inc()
+        await response.write(chatbot.sse_event("done", {
+            "success": True,
+            "response": answer,
+            "source": source,
+            "timestamp": datetime.now().isoformat(),
+            "language": language
+        }).encode("utf-8"))
+        await response.write_eof()
+    except ConnectionResetError:
+        chatbot.log.info("Stream client disconnected", extra={"stage": "stream"})
+    finally:
+        chatbot.load_shedder.release()
+        metrics.REQUEST_SECONDS.labels("chat_stream").observe(time.monotonic() - started)
+    return response
+
+async def chat_batch(request):
+    """Answer a list of chat items; per-item errors don't fail the batch"""
+    with metrics.REQUEST_SECONDS.labels("chat_batch").time(), metrics.IN_FLIGHT.labels("chat_batch").track_inprogress():
+        return await handle_chat_batch(request)
+
+async def handle_chat_batch(request):
+    try:
+        body = await request.read()
+        if len(body) > chatbot.CHAT_BATCH_MAX_BYTES:
+            return web.json_response({"error": f"Batch exceeds {chatbot.CHAT_BATCH_MAX_BYTES} bytes"}, status=413)
+
+        try:
+            items, weight, allow_ai = chatbot.admit_batch_request(await request.json(), request.remote, request.headers)
+        except chatbot.ChatRefused as e:
+            return web.json_response(e.body, status=e.status, headers=e.headers)
+
+        try:
+            results = await get_batch_responses(request.app, items, allow_ai)
+        finally:
+            chatbot.load_shedder.release(weight)
+
+        with metrics.SERIALIZATION_STAGE.time():
+            return web.json_response({
+                "success": True,
+                "results": results,
+                "timestamp": datetime.now().isoformat()
+            })
+
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+
+def require_service_auth(handler):
+    """Answer 401 unless the request comes from the Next.js server, like app.require_service_auth"""
+    @functools.wraps(handler)
+    async def wrapper(request):
+        if not chatbot.is_service_request(request.headers):
+            return web.json_response(chatbot.SERVICE_AUTH_ERROR, status=401)
+        return await handler(request)
+    return wrapper
+
+@require_service_auth
+async def tickets_status(request):
+    """Status of many tickets, CNICs and emails in one call"""
+    with metrics.REQUEST_SECONDS.labels("tickets_status").time():
+        try:
+            try:
+                ticket_ids, cnics, emails, language = chatbot.parse_ticket_status_request(await request.json())
+            except ValueError as e:
+                return web.json_response({"error": str(e)}, status=400)
+
+            statuses = await get_ticket_statuses(ticket_ids, cnics, emails)
+
+            with metrics.SERIALIZATION_STAGE.time():
+                return web.json_response({
+                    "success": True,
+                    "results": chatbot.ticket_status_results(statuses, language),
+                    "timestamp": datetime.now().isoformat(),
+                    "language": language
+                })
+
+        except Exception as e:
+            chatbot.log.warning("Ticket status lookup failed", extra={"stage": "db", "error": str(e)})
+            return web.json_response({"error": str(e)}, status=500)
+
+@require_service_auth
+async def tickets_invalidate(request):
+    """Drop cached lookups for tickets that changed (or all tickets of a user)"""
+    try:
+        ticket_ids, user_ids = chatbot.parse_ticket_invalidation(await request.json())
+    except ValueError as e:
+        return web.json_response({"error": str(e)}, status=400)
+    await run_blocking(TICKET_LOG_SHARED, chatbot.ticket_cache.invalidate, ticket_ids, user_ids)
+    return web.json_response({"success": True})
+
+@require_service_auth
+async def put_context(request):
+    """Store a full snapshot of a dashboard user's recent tickets"""
+    try:
+        data = await request.json()
+        items = data.get('tickets') if isinstance(data, dict) else None
+        if not isinstance(items, list):
+            return web.json_response({"error": "tickets must be a list"}, status=400)
+        await run_blocking(TICKET_LOG_SHARED, chatbot.context_store.put, request.match_info['user_id'], items)
+    except ValueError as e:
+        return web.json_response({"error": str(e)}, status=400)
+    return web.json_response({"success": True})
+
+@require_service_auth
+async def patch_context(request):
+    """Apply ticket changes to a stored context; ``applied`` is false when none was stored"""
+    try:
+        updates, removed = chatbot.parse_context_delta(await request.json())
+        applied = await run_blocking(TICKET_LOG_SHARED, chatbot.context_store.apply_delta,
+                                     request.match_info['user_id'], updates, removed)
+    except ValueError as e:
+        return web.json_response({"error": str(e)}, status=400)
+    return web.json_response({"success": True, "applied": applied})
+
+@require_service_auth
+async def delete_context(request):
+    """Forget a user's stored context, e.g. on logout"""
+    try:
+        await run_blocking(TICKET_LOG_SHARED, chatbot.context_store.delete, request.match_info['user_id'])
+    except ValueError as e:
+        return web.json_response({"error": str(e)}, status=400)
+    return web.json_response({"success": True})
+
+async def services(request):
+    """Get available services information"""
+    return web.json_response({"services": chatbot.SERVICES})
+
+async def ai_client_ctx(app):
+    """Open one keep-alive inference client per worker for the AI endpoint"""
+    app[AI_CLIENT] = chatbot.create_ai_client(asynchronous=True)
+    app[AI_TASKS] = set()
+    app[AI_FLIGHTS] = SingleFlight()
+    if chatbot.AI_BATCH_MAX_SIZE > 1:
+        app[AI_BATCHER] = AsyncMicroBatcher(
+            lambda prompts: send_ai_batch(app[AI_CLIENT], prompts),
+            chatbot.AI_BATCH_MAX_SIZE, chatbot.AI_BATCH_MAX_WAIT,
+        )
+    # Under gunicorn post_worker_init has already warmed the worker up
+    chatbot.start_warm_up(sync_ai_client=False)
+    yield
+    await app[AI_CLIENT].close()
+
+def warm_shared():
+    """gunicorn.conf.py's shared warm-up; this app never uses the sync inference client"""
+    chatbot.warm_shared(sync_ai_client=False)
+
+def warm_up():
+    """gunicorn.conf.py's per-worker warm-up"""
+    chatbot.warm_up(sync_ai_client=False)
+
+def create_app():
+    """Build the aiohttp application"""
+    app = web.Application(middlewares=[request_id_middleware, cors_middleware])
+    app.cleanup_ctx.append(ai_client_ctx)
+    app.router.add_get('/health', health)
+    app.router.add_get('/health/ready', health_ready)
+    app.router.add_get('/stats', stats)
+    app.router.add_get('/metrics', prometheus_metrics)
+    app.router.add_post('/chat', chat)
+    app.router.add_post('/chat/stream', chat_stream)
+    app.router.add_post('/chat/batch', chat_batch)
+    app.router.add_post('/tickets/status', tickets_status)
+    app.router.add_post('/tickets/invalidate', tickets_invalidate)
+    app.router.add_put('/context/{user_id}', put_context)
+    app.router.add_patch('/context/{user_id}', patch_context)
+    app.router.add_delete('/context/{user_id}', delete_context)
+    app.router.add_get('/services', services)
+    return app
+
+app = create_app()
+
+if __name__ == '__main__':
+    port = int(os.environ.get('PORT', 5000))
+    web.run_app(app, host='0.0.0.0', port=port)
@@ -0,0 +1,158 @@
+"""Local-answer latency while the AI path is saturated, with and without admission control.
+
+    python bench_admission.py                  # gunicorn app:app with threads
+    python bench_admission.py --server async   # async app
+
+Each scenario starts fake_inference.py with a slow, narrow upstream and a
+chatbot server, then measures questions the chatbot answers locally (from
+the knowledge base) twice: alone, and while distinct AI-bound questions
+arrive at a fixed rate far above what the upstream can serve. Without
+admission control the flood holds every server thread for the whole AI
+latency budget and the local answers queue behind it; with it, the flood
+is degraded to the rule engine past AI_MAX_IN_FLIGHT and the local
+answers' p99 should stay where it was.
+The per-user rate limit is turned off here, since every simulated client
+shares one address.
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from collections import Counter
+
+import aiohttp
+
+from bench_coalescing import percentile, wait_until_up
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Questions bench_retrieval.py shows are answered from the knowledge base
+LOCAL_QUESTIONS = [
+    ("how many pages are in a passport", "en"),
+    ("can I verify certificates online", "en"),
+    ("how much do I pay for urgent passport", "en"),
+    ("payment via jazzcash or easypaisa", "en"),
+    ("birth certificate and photos needed", "en"),
+    ("nearest registration office with live queue", "en"),
+    ("تصاویر اور فوٹو کاپیاں", "ur"),
+]
+
+UNLIMITED = "1000000"
+SCENARIOS = [
+    ("admission control off", {"AI_MAX_IN_FLIGHT": UNLIMITED, "CHAT_MAX_IN_FLIGHT": UNLIMITED,
+                               "CHAT_DEGRADE_IN_FLIGHT": UNLIMITED, "QUEUE_DEGRADE_MS": UNLIMITED,
+                               "QUEUE_REJECT_MS": UNLIMITED}),
+    ("admission control on", {}),
+]
+
+
+async def probe(session, chat_url, duration, clients, pause):
+    """Ask local questions from ``clients`` loops for ``duration`` seconds"""
+    latencies = []
+    deadline = time.monotonic() + duration
+
+    async def loop(offset):
+        i = offset
+        while time.monotonic() < deadline:
+            question, language = LOCAL_QUESTIONS[i % len(LOCAL_QUESTIONS)]
+            i += 1
+            started = time.perf_counter()
+            async with session.post(chat_url, json={"message": question, "language": language}) as response:
+                await response.read()
+            latencies.append(time.perf_counter() - started)
+            await asyncio.sleep(pause)
+
+    await asyncio.gather(*(loop(offset) for offset in range(clients)))
+    return sorted(latencies)
+
+
+async def flood(session, chat_url, duration, rate):
+    """Send ``rate`` distinct AI-bound questions a second, however fast they are answered.
+
+    Returns status counts and latencies.
+    """
+    statuses = Counter()
+    latencies = []
+
+    async def ask(n):
+        question = f"Question {n}: can my cousin collect the parcel on my behalf?"
+        started = time.perf_counter()
+        async with session.post(chat_url, json={"message": question, "language": "en"}) as response:
+            await response.read()
+            statuses[response.status] += 1
+        latencies.append(time.perf_counter() - started)
+
+    tasks = []
+    started = time.monotonic()
+    for n in range(int(duration * rate)):
+        await asyncio.sleep(max(0, started + n / rate - time.monotonic()))
+        tasks.append(asyncio.create_task(ask(n)))
+    await asyncio.gather(*tasks)
+    return statuses, sorted(latencies)
+
+
+def summary(latencies):
+    return " ".join(f"{percentile(latencies, pct) * 1000:>8.1f}" for pct in (50, 95, 99))
+
+
+async def scenario(name, settings, args):
+    env = dict(os.environ, **settings,
+               PORT=str(args.port), HF_API_URL=f"http://127.0.0.1:{args.upstream_port}/generate",
+               HUGGINGFACE_API_KEY="test", AI_CACHE_TTL="0", AI_BREAKER_SLOW_MS="60000", AI_RETRIES="0",
+               RATE_LIMIT_PER_MINUTE="0", RETRIEVAL_SERVICES="false", LOG_LEVEL="WARNING")
+    upstream = subprocess.Popen([sys.executable, "fake_inference.py", "--port", str(args.upstream_port),
+                                 "--latency-ms", str(args.latency_ms), "--slots", str(args.slots)], cwd=HERE)
+    if args.server == "async":
+        command = [sys.executable, "async_app.py"]
+    else:
+        command = ["gunicorn", "app:app", "--bind", f"127.0.0.1:{args.port}", "--threads", str(args.threads)]
+    server = subprocess.Popen(command, cwd=HERE, env=env, stdout=subprocess.DEVNULL)
+    chat_url = f"http://127.0.0.1:{args.port}/chat"
+    try:
+        connector = aiohttp.TCPConnector(limit=0, force_close=True)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            await wait_until_up(session, f"http://127.0.0.1:{args.upstream_port}/stats")
+            await wait_until_up(session, f"http://127.0.0.1:{args.port}/health/ready")
+            alone = await probe(session, chat_url, args.duration, args.probe_clients, args.pause)
+            (statuses, flooded), loaded = await asyncio.gather(
+                flood(session, chat_url, args.duration, args.flood_rate),
+                probe(session, chat_url, args.duration, args.probe_clients, args.pause),
+            )
+            async with session.get(f"http://127.0.0.1:{args.port}/stats") as response:
+                server_stats = await response.json()
+    finally:
+        server.terminate()
+        upstream.terminate()
+        server.wait()
+        upstream.wait()
+
+    print(f"\n{name}")
+    print(f"  {'':<28} {'n':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    print(f"  {'local answers, alone':<28} {len(alone):>6} {summary(alone)}")
+    print(f"  {'local answers, AI saturated':<28} {len(loaded):>6} {summary(loaded)}")
+    print(f"  {'AI-bound flood':<28} {len(flooded):>6} {summary(flooded)}   statuses {dict(statuses)}")
+    print(f"  load shedding {server_stats['load_shedding']}   AI in flight peak {server_stats['ai_in_flight']['peak']}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--server", choices=["async", "sync"], default="sync")
+    parser.add_argument("--threads", type=int, default=32, help="gunicorn threads for --server sync")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--upstream-port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=2000)
+    parser.add_argument("--slots", type=int, default=2, help="requests the fake model serves at once")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per phase")
+    parser.add_argument("--probe-clients", type=int, default=4)
+    parser.add_argument("--flood-rate", type=float, default=40, help="AI-bound questions a second during the flood")
+    parser.add_argument("--pause", type=float, default=0.05, help="seconds between one probe client's questions")
+    args = parser.parse_args()
+
+    for name, settings in SCENARIOS:
+        await scenario(name, settings, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,129 @@
+"""Bursty /chat load against the fake inference server, with and without coalescing.
+
+    python bench_coalescing.py                  # async app
+    python bench_coalescing.py --server sync    # gunicorn app:app with threads
+
+Each scenario starts fake_inference.py and a chatbot server with its own
+settings, fires bursts of concurrent questions drawn from a small pool (so
+some are asked several times at once), and reports the chatbot's p50/p95
+latency next to how many requests and prompts reached the upstream model.
+The response cache is disabled so only in-flight coalescing is measured.
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SCENARIOS = [
+    ("no coalescing", {"AI_SINGLE_FLIGHT": "false", "AI_BATCH_MAX_SIZE": "1"}),
+    ("single-flight", {"AI_SINGLE_FLIGHT": "true", "AI_BATCH_MAX_SIZE": "1"}),
+    ("single-flight + batching", {"AI_SINGLE_FLIGHT": "true", "AI_BATCH_MAX_SIZE": "8"}),
+]
+
+
+def percentile(sorted_values, pct):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+
+def summarize(latencies, elapsed):
+    """Throughput and p50/p95/p99 (in ms) of per-operation ``latencies`` in seconds"""
+    latencies = sorted(latencies)
+    if not latencies:
+        return {"n": 0, "throughput": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0}
+    return {
+        "n": len(latencies),
+        "throughput": len(latencies) / elapsed,
+        **{f"p{pct}_ms": percentile(latencies, pct) * 1000 for pct in (50, 95, 99)},
+    }
+
+
+async def wait_until_up(session, url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(url) as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up")
+
+
+async def run_load(chat_url, bursts, burst_size, pool_size, pause, seed):
+    rng = random.Random(seed)
+    # Skewed popularity, like real traffic: a few questions are asked a lot
+    weights = [1 / (rank + 1) for rank in range(pool_size)]
+    latencies = []
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0, force_close=True)) as session:
+        async def ask(question):
+            started = time.perf_counter()
+            async with session.post(chat_url, json={"message": question, "language": "en"}) as response:
+                await response.read()
+            latencies.append(time.perf_counter() - started)
+
+        for _ in range(bursts):
+            questions = rng.choices(range(pool_size), weights, k=burst_size)
+            await asyncio.gather(*(ask(f"Question {q}: can my cousin collect the parcel on my behalf?") for q in questions))
+            await asyncio.sleep(pause)
+    return sorted(latencies)
+
+
+async def scenario(name, settings, args):
+    env = dict(os.environ, **settings,
+               PORT=str(args.port), HF_API_URL=f"http://127.0.0.1:{args.upstream_port}/generate",
+               HUGGINGFACE_API_KEY="test", AI_CACHE_TTL="0", AI_LATENCY_BUDGET_MS="30000",
+               AI_BREAKER_SLOW_MS="60000", AI_WORKERS="64", RETRIEVAL_SERVICES="false", LOG_LEVEL="WARNING")
+    upstream = subprocess.Popen([sys.executable, "fake_inference.py", "--port", str(args.upstream_port),
+                                 "--latency-ms", str(args.latency_ms), "--slots", str(args.slots)], cwd=HERE)
+    if args.server == "async":
+        command = [sys.executable, "async_app.py"]
+    else:
+        command = ["gunicorn", "app:app", "--bind", f"127.0.0.1:{args.port}", "--threads", "64"]
+    server = subprocess.Popen(command, cwd=HERE, env=env, stdout=subprocess.DEVNULL)
+    try:
+        async with aiohttp.ClientSession() as session:
+            await wait_until_up(session, f"http://127.0.0.1:{args.upstream_port}/stats")
+            await wait_until_up(session, f"http://127.0.0.1:{args.port}/health/ready")
+            latencies = await run_load(f"http://127.0.0.1:{args.port}/chat", args.bursts, args.burst_size,
+                                       args.pool_size, args.pause, args.seed)
+            async with session.get(f"http://127.0.0.1:{args.upstream_port}/stats") as response:
+                upstream_stats = await response.json()
+    finally:
+        server.terminate()
+        upstream.terminate()
+        server.wait()
+        upstream.wait()
+
+    print(f"{name:<26} {len(latencies):>6} {percentile(latencies, 50) * 1000:>8.0f} {percentile(latencies, 95) * 1000:>8.0f} "
+          f"{upstream_stats['requests']:>9} {upstream_stats['prompts']:>8} {upstream_stats['max_batch']:>9}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--server", choices=["async", "sync"], default="async")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--upstream-port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--slots", type=int, default=4, help="requests the fake model serves at once")
+    parser.add_argument("--bursts", type=int, default=10)
+    parser.add_argument("--burst-size", type=int, default=64)
+    parser.add_argument("--pool-size", type=int, default=40, help="distinct questions to draw from")
+    parser.add_argument("--pause", type=float, default=0.5, help="seconds between bursts")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    print(f"{'scenario':<26} {'chats':>6} {'p50 ms':>8} {'p95 ms':>8} {'upstream':>9} {'prompts':>8} {'max batch':>9}")
+    for name, settings in SCENARIOS:
+        await scenario(name, settings, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,105 @@
+"""Memory and speed of the per-user context store.
+
+    python bench_context_store.py --users 10000
+
+Fills a UserContextStore with synthetic dashboard users (5 tickets each,
+decoded from JSON like a real snapshot request) and reports the traced
+memory per 10k users next to two naive layouts: the decoded ``tickets``
+dicts as sent, and ready-built TicketContext objects. Then times reads
+(which rebuild the TicketContext) and single-field deltas.
+"""
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+from context_store import UserContextStore
+from ticket_context import TicketContext
+
+SERVICES = ["National ID Card", "Passport Services", "Document Verification", "Family Registration",
+            "Certificates", "Smart Card Renewal", "Birth Certificate", "Marriage Certificate"]
+STATUSES = ["OPEN", "IN_PROGRESS", "COMPLETED", "CLOSED"]
+PAYMENTS = [None, "PENDING", "COMPLETED"]
+DELIVERIES = [None, "PENDING", "DISPATCHED", "DELIVERED"]
+
+
+def make_snapshots(users, tickets_per_user, seed):
+    """JSON-encoded snapshot bodies, decoded per user like the endpoint would"""
+    rng = random.Random(seed)
+    agents = [f"Agent {name}" for name in ("Ali", "Sara", "Usman", "Ayesha", "Bilal", "Hina", "Kamran", "Nadia")]
+    snapshots = []
+    next_id = 1
+    for _ in range(users):
+        tickets = []
+        for _ in range(tickets_per_user):
+            tickets.append({
+                "id": next_id,
+                "service": rng.choice(SERVICES),
+                "status": rng.choice(STATUSES),
+                "agent": rng.choice(agents + [None]),
+                "payment": rng.choice(PAYMENTS),
+                "delivery": rng.choice(DELIVERIES),
+            })
+            next_id += 1
+        snapshots.append(json.dumps(tickets))
+    return snapshots
+
+
+def traced(build):
+    """Bytes still allocated after ``build()`` returns, and its result"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--tickets", type=int, default=5, help="tickets per user")
+    parser.add_argument("--reads", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    snapshots = make_snapshots(args.users, args.tickets, args.seed)
+
+    def fill_store():
+        store = UserContextStore(max_users=args.users, ttl=3600, max_tickets=args.tickets)
+        for user_id, body in enumerate(snapshots):
+            store.put(user_id, json.loads(body))
+        return store
+
+    layouts = [
+        ("UserContextStore", fill_store),
+        ("decoded dicts", lambda: {user_id: json.loads(body) for user_id, body in enumerate(snapshots)}),
+        ("TicketContext objects", lambda: {user_id: TicketContext.from_dicts(json.loads(body))
+                                           for user_id, body in enumerate(snapshots)}),
+    ]
+    print(f"{args.users} users x {args.tickets} tickets")
+    print(f"{'layout':<24} {'MiB total':>10} {'MiB / 10k users':>16} {'bytes / user':>13}")
+    for name, build in layouts:
+        size, result = traced(build)
+        if name == "UserContextStore":
+            store = result
+        print(f"{name:<24} {size / 2**20:>10.2f} {size / args.users * 10000 / 2**20:>16.2f} {size / args.users:>13.0f}")
+
+    rng = random.Random(args.seed)
+    user_ids = [rng.randrange(args.users) for _ in range(args.reads)]
+    started = time.perf_counter()
+    for user_id in user_ids:
+        store.get(user_id)
+    read_us = (time.perf_counter() - started) / args.reads * 1e6
+
+    started = time.perf_counter()
+    for user_id in user_ids:
+        ticket_id = user_id * args.tickets + 1
+        store.apply_delta(user_id, [{"id": ticket_id, "status": "COMPLETED"}])
+    delta_us = (time.perf_counter() - started) / args.reads * 1e6
+    print(f"\nget (rebuilds TicketContext): {read_us:.1f} us   apply_delta: {delta_us:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
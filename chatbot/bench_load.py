@@ -0,0 +1,185 @@
+"""End-to-end load test: a chatbot server against the fake model and the seeded SQLite database.
+
+    python bench_load.py                  # gunicorn bench_server:app with threads
+    python bench_load.py --server async   # async app
+    python bench_load.py --error-rate 0.1 --latency-ms 500
+
+Seeds a fake_database.py SQLite file, starts fake_inference.py with the
+given latency and error rate, and starts the chatbot pointed at both
+through bench_server.py. Then
+``--concurrency`` clients send requests back to back for ``--duration``
+seconds (after ``--warmup`` seconds that aren't counted), drawn from a
+seeded mix:
+
+- ``chat_local``: public questions the knowledge base answers (English and Urdu)
+- ``chat_ai``: public questions only the model can answer, from a pool
+  small enough that some repeat and hit the response cache
+- ``chat_dashboard``: dashboard messages with the user's tickets
+- ``tickets_status``: /tickets/status lookups by ticket ID, CNIC and email
+
+Reports throughput, p50/p95/p99 and the non-2xx rate per kind and overall.
+The per-user rate limit is turned off, since every client shares one address.
+Clients call as the Next.js server does, with the service token.
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import aiohttp
+
+import fake_database
+from bench_coalescing import summarize, wait_until_up
+from bench_rules import make_tickets
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SERVICE_TOKEN = "bench-service-token"
+
+LOCAL_QUESTIONS = [
+    ("how many pages are in a passport", "en"),
+    ("can I verify certificates online", "en"),
+    ("how much do I pay for urgent passport", "en"),
+    ("payment via jazzcash or easypaisa", "en"),
+    ("birth certificate and photos needed", "en"),
+    ("what is the fee for residence certificate", "en"),
+    ("تصاویر اور فوٹو کاپیاں", "ur"),
+    ("شناختی کارڈ کی فیس کیا ہے", "ur"),
+]
+DASHBOARD_MESSAGES = ["show my tickets", "who is my agent", "any pending payments?", "what's my latest status",
+                      "where is my delivery", "how do I upload a document"]
+MIX = [("chat_local", 0.4), ("chat_ai", 0.2), ("chat_dashboard", 0.2), ("tickets_status", 0.2)]
+
+
+def next_request(rng, args):
+    """One ``(kind, path, body)`` drawn from MIX"""
+    kind = rng.choices([name for name, _ in MIX], [weight for _, weight in MIX])[0]
+    if kind == "chat_local":
+        question, language = rng.choice(LOCAL_QUESTIONS)
+        return kind, "/chat", {"message": question, "language": language}
+    if kind == "chat_ai":
+        n = rng.randrange(args.ai_questions)
+        return kind, "/chat", {"message": f"Question {n}: can my cousin collect the parcel on my behalf?",
+                               "language": "en"}
+    if kind == "chat_dashboard":
+        user_id = rng.randint(1, args.users)
+        return kind, "/chat", {"message": rng.choice(DASHBOARD_MESSAGES), "language": rng.choice(["en", "ur"]),
+                               "isDashboard": True, "userId": user_id,
+                               "tickets": make_tickets(rng.randint(1, 5), seed=user_id)}
+    users = [rng.randint(1, args.users) for _ in range(rng.randint(1, 5))]
+    return kind, "/tickets/status", {
+        "ticketIds": [rng.randint(1, args.users * 4) for _ in range(rng.randint(0, 3))],
+        "cnics": [fake_database.cnic_for(user) for user in users[:2]],
+        "emails": [fake_database.email_for(user) for user in users[2:]],
+    }
+
+
+async def run_load(base_url, args):
+    """Closed-loop load from ``args.concurrency`` clients; returns per-kind results"""
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    started = time.monotonic()
+    measure_from = started + args.warmup
+    deadline = measure_from + args.duration
+    connector = aiohttp.TCPConnector(limit=0)
+    headers = {"Authorization": f"Bearer {SERVICE_TOKEN}"}
+    async with aiohttp.ClientSession(connector=connector, headers=headers) as session:
+        async def client(n):
+            rng = random.Random(args.seed * 1000 + n)
+            while time.monotonic() < deadline:
+                kind, path, body = next_request(rng, args)
+                sent = time.monotonic()
+                async with session.post(base_url + path, json=body) as response:
+                    await response.read()
+                    failed = response.status >= 300
+                if sent >= measure_from:
+                    latencies[kind].append(time.monotonic() - sent)
+                    errors[kind] += failed
+
+        await asyncio.gather(*(client(n) for n in range(args.concurrency)))
+
+    results = {}
+    everything = []
+    for kind, _ in MIX:
+        results[kind] = dict(summarize(latencies[kind], args.duration),
+                             error_rate=errors[kind] / max(1, len(latencies[kind])))
+        everything += latencies[kind]
+    results["overall"] = dict(summarize(everything, args.duration),
+                              error_rate=sum(errors.values()) / max(1, len(everything)))
+    return results
+
+
+async def run(args):
+    """Start the database, fake model and server, run the load and stop them again"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        fake_database.seed(db_path, args.users, args.seed)
+        env = dict(os.environ,
+                   PORT=str(args.port), DATABASE_URL=f"sqlite:///{db_path}", RETRIEVAL_SERVICES="true",
+                   HF_API_URL=f"http://127.0.0.1:{args.upstream_port}/generate", HUGGINGFACE_API_KEY="test",
+                   AI_RETRIES="0", RATE_LIMIT_PER_MINUTE="0", DB_POOL_SIZE=str(args.threads), LOG_LEVEL="WARNING",
+                   CHATBOT_SERVICE_TOKEN=SERVICE_TOKEN)
+        upstream = subprocess.Popen([sys.executable, "fake_inference.py", "--port", str(args.upstream_port),
+                                     "--latency-ms", str(args.latency_ms), "--slots", str(args.slots),
+                                     "--error-rate", str(args.error_rate), "--seed", str(args.seed)], cwd=HERE)
+        if args.server == "async":
+            command = [sys.executable, "bench_server.py", "--async"]
+        else:
+            command = ["gunicorn", "bench_server:app", "--bind", f"127.0.0.1:{args.port}", "--threads", str(args.threads)]
+        server = subprocess.Popen(command, cwd=HERE, env=env, stdout=subprocess.DEVNULL)
+        base_url = f"http://127.0.0.1:{args.port}"
+        try:
+            async with aiohttp.ClientSession() as session:
+                await wait_until_up(session, f"http://127.0.0.1:{args.upstream_port}/stats")
+                await wait_until_up(session, f"{base_url}/health/ready")
+            results = await run_load(base_url, args)
+            async with aiohttp.ClientSession() as session:
+                async with session.get(f"http://127.0.0.1:{args.upstream_port}/stats") as response:
+                    upstream_stats = await response.json()
+        finally:
+            server.terminate()
+            upstream.terminate()
+            server.wait()
+            upstream.wait()
+    return results, upstream_stats
+
+
+def print_results(results):
+    print(f"{'kind':<16} {'n':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for kind, result in results.items():
+        print(f"{kind:<16} {result['n']:>7} {result['throughput']:>8.1f} "
+              + " ".join(f"{result[f'p{pct}_ms']:>8.1f}" for pct in (50, 95, 99))
+              + f" {result['error_rate']:>7.1%}")
+
+
+def add_arguments(parser):
+    parser.add_argument("--server", choices=["async", "sync"], default="sync")
+    parser.add_argument("--threads", type=int, default=16, help="gunicorn threads for --server sync")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--upstream-port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=200, help="fake model latency")
+    parser.add_argument("--error-rate", type=float, default=0.02, help="fraction of fake model calls that fail")
+    parser.add_argument("--slots", type=int, default=8, help="requests the fake model serves at once")
+    parser.add_argument("--users", type=int, default=2000, help="users seeded into the database")
+    parser.add_argument("--ai-questions", type=int, default=200, help="distinct AI-bound questions")
+    parser.add_argument("--concurrency", type=int, default=16, help="clients sending requests back to back")
+    parser.add_argument("--duration", type=float, default=10, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=2, help="seconds of load before measuring")
+    parser.add_argument("--seed", type=int, default=7)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    args = parser.parse_args()
+    results, upstream_stats = asyncio.run(run(args))
+    print_results(results)
+    print(f"upstream {upstream_stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Replay questions through the retrieval index and report hit rate and latency.
+
+    python bench_retrieval.py                 # built-in sample questions
+    python bench_retrieval.py questions.jsonl # one {"message", "language", "expected"} per line
+
+``expected`` is a NADRA_KNOWLEDGE topic, or null for questions that should
+be left to the AI. Set RETRIEVAL_SERVICES=false to benchmark without the
+database's services.
+"""
+import json
+import sys
+import time
+
+import app
+
+SAMPLE_QUESTIONS = [
+    ("how long does a new identity card take to process", "en", "id card"),
+    ("what is the age requirement for national id", "en", "id card"),
+    ("how many pages are in a passport", "en", "passport"),
+    ("passport renewal processing days", "en", "passport"),
+    ("can I verify certificates online", "en", "verification"),
+    ("how to confirm authenticity of a CNIC", "en", "verification"),
+    ("how much do I pay for urgent passport", "en", "fee"),
+    ("payment via jazzcash or easypaisa", "en", "fee"),
+    ("what papers should I bring, originals and photocopies", "en", "documents"),
+    ("birth certificate and photos needed", "en", "documents"),
+    ("sms whatsapp updates on my request", "en", "tracking"),
+    ("where can I see real-time progress", "en", "tracking"),
+    ("opening hours on saturday", "en", "centers"),
+    ("nearest registration office with live queue", "en", "centers"),
+    ("پاسپورٹ کتنے دن میں بنتا ہے", "ur", "passport"),
+    ("فیس کتنی ہے", "ur", "fee"),
+    ("تصاویر اور فوٹو کاپیاں", "ur", "documents"),
+    ("what is the weather today", "en", None),
+    ("tell me a joke", "en", None),
+    ("who won the cricket match", "en", None),
+    ("can you write me a poem about lahore", "en", None),
+    ("I want to complain about an officer", "en", None),
+    ("what is the capital of pakistan", "en", None),
+    ("how to apply for a driving license", "en", None),
+    ("hello there", "en", None),
+]
+
+
+def load_questions(path):
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                questions.append((item["message"], item.get("language", "en"), item.get("expected")))
+    return questions
+
+
+def percentile(sorted_values, pct):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+
+def main():
+    questions = load_questions(sys.argv[1]) if len(sys.argv) > 1 else SAMPLE_QUESTIONS
+    # Index the database's services, unless RETRIEVAL_SERVICES=false
+    app.warm_shared()
+    retriever = app.knowledge_retriever
+
+    hits = correct = wrong = 0
+    latencies = []
+    for message, language, expected in questions:
+        start = time.perf_counter()
+        answer = retriever.answer(message, language)
+        latencies.append(time.perf_counter() - start)
+        if answer is None:
+            continue
+        hits += 1
+        if expected is None:
+            wrong += 1
+        elif answer == app.NADRA_KNOWLEDGE.get(expected, {}).get(language):
+            correct += 1
+        else:
+            wrong += 1
+
+    # Repeat the replay for stable latency figures
+    rounds = max(1, 20000 // len(questions))
+    for _ in range(rounds):
+        for message, language, _ in questions:
+            start = time.perf_counter()
+            retriever.answer(message, language)
+            latencies.append(time.perf_counter() - start)
+    latencies.sort()
+
+    answerable = sum(1 for _, _, expected in questions if expected is not None)
+    print(f"documents indexed: {len(retriever)}")
+    print(f"questions:         {len(questions)} ({answerable} answerable locally)")
+    print(f"hit rate:          {hits / len(questions):.1%} ({hits} answered without the AI)")
+    print(f"correct hits:      {correct} / {answerable} answerable")
+    print(f"wrong hits:        {wrong}")
+    print(f"latency p50/p95/p99: {percentile(latencies, 50) * 1e6:.1f} / "
+          f"{percentile(latencies, 95) * 1e6:.1f} / {percentile(latencies, 99) * 1e6:.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
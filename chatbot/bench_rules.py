@@ -0,0 +1,193 @@
+"""Micro-benchmarks for the rule engine: intent matching, rule answers and ticket formatting.
+
+    python bench_rules.py
+    python bench_rules.py --iterations 20000 --case match_ur
+
+Times every call of ``INTENT_MATCHER.match()``, ``get_rule_based_response()``
+and ``format_ticket_response()`` separately on English, Urdu and large
+(long message or many tickets) inputs, and reports calls per second and
+the p50/p95/p99 of a single call. The ``match_keywords_*`` and
+``scan_keywords_*`` cases match the same messages against 10, 100 and
+1000 generated keywords, with ``IntentMatcher`` and with the per-keyword
+``keyword in text`` scan it replaced: the scan grows with the keyword
+count, the matcher should not. Messages rotate through a fixed list per
+case so the numbers don't depend on one lucky input. Each case keeps the
+best throughput and percentiles of ``--repeat`` rounds, as timeit keeps
+the fastest run, and the rounds of all cases
+are interleaved, so a few seconds of noise from elsewhere on the machine
+slow one round of several cases rather than every round of one. bench_suite.py runs
+these together with the end-to-end load test and compares them against
+a baseline.
+"""
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault("RETRIEVAL_SERVICES", "false")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import app  # noqa: E402
+from bench_coalescing import summarize  # noqa: E402
+from intents import IntentMatcher  # noqa: E402
+from ticket_context import TicketContext  # noqa: E402
+
+ENGLISH = [
+    "hello",
+    "how much is the fee for a new id card",
+    "what documents are required for passport",
+    "where is the nearest nadra office",
+    "can I verify my family registration certificate online",
+    "track my application status",
+    "my cousin wants to know about something unrelated",
+]
+URDU = [
+    "السلام علیکم",
+    "شناختی کارڈ کی فیس کیا ہے",
+    "پاسپورٹ کے لیے کون سی دستاویز چاہیے",
+    "قریبی مرکز کہاں ہے",
+    "میری درخواست کی حیثیت ٹریک کریں",
+    "تصدیق کیسے کریں",
+]
+DASHBOARD = [
+    "show my tickets",
+    "who is my agent",
+    "any pending payments?",
+    "what's my latest status",
+    "which ones are completed",
+    "where is my delivery",
+    "how do I upload a document",
+    "anything else?",
+]
+KEYWORD_COUNTS = (10, 100, 1000)
+SERVICES = ["National ID Card", "Passport Services", "Document Verification", "Family Registration",
+            "Birth Certificate", "Marriage Certificate", "CNIC Renewal", "Residence Certificate"]
+
+
+def make_tickets(count, seed=7):
+    """Structured dashboard tickets, newest first"""
+    rng = random.Random(seed)
+    return [{
+        "id": 1000 + i,
+        "service": rng.choice(SERVICES),
+        "status": rng.choice(["OPEN", "IN_PROGRESS", "COMPLETED", "CLOSED"]),
+        "agent": rng.choice([None, "Ali Raza", "Sara Khan", "Usman Tariq"]),
+        "payment": rng.choice([None, "PENDING", "COMPLETED"]),
+        "delivery": rng.choice([None, "PENDING", "DISPATCHED", "DELIVERED"]),
+    } for i in range(count)]
+
+
+def make_rows(count, seed=7):
+    """Ticket rows shaped like get_ticket_statuses() returns them"""
+    rng = random.Random(seed)
+    now = datetime(2025, 11, 1)
+    return [{
+        "id": 1000 + i,
+        "status": rng.choice(["OPEN", "IN_PROGRESS", "COMPLETED", "CLOSED"]),
+        "serviceName": rng.choice(SERVICES),
+        "createdAt": now - timedelta(days=i),
+        "agentName": rng.choice([None, "Ali Raza", "Sara Khan"]),
+    } for i in range(count)]
+
+
+def make_intents(count, seed=7):
+    """``count`` generated lowercase keywords, ten to an intent"""
+    rng = random.Random(seed)
+    keywords = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(4, 10)))
+                for _ in range(count)]
+    return [(f"intent_{i // 10}", keywords[i:i + 10]) for i in range(0, count, 10)]
+
+
+def scan_intents(intents):
+    """The per-keyword ``keyword in text`` scan IntentMatcher replaced"""
+    def scan(text):
+        return {name for name, keywords in intents if any(keyword in text for keyword in keywords)}
+
+    return scan
+
+
+def large_message(seed=7):
+    """A ~5 KB message: a long question with the legacy ticket block appended"""
+    rng = random.Random(seed)
+    words = " ".join(rng.choice(ENGLISH).split()[-1] for _ in range(400))
+    return f"I have a long question about my case, {words}, so what should I do next?" \
+        + TicketContext.from_dicts(make_tickets(50, seed)).as_text()
+
+
+def cases(context_tickets):
+    """``{name: (function, inputs)}`` for every benchmark case"""
+    large = large_message()
+    context = TicketContext.from_dicts(make_tickets(context_tickets))
+    rows = make_rows(5)
+    many_rows = make_rows(100)
+    selected = {
+        "match_en": (app.INTENT_MATCHER.match, ENGLISH),
+        "match_ur": (app.INTENT_MATCHER.match, URDU),
+        "match_large": (app.INTENT_MATCHER.match, [large.lower()]),
+        "rules_en": (lambda m: app.get_rule_based_response(m, "en"), ENGLISH),
+        "rules_ur": (lambda m: app.get_rule_based_response(m, "ur"), URDU),
+        "rules_dashboard_large": (lambda m: app.get_rule_based_response(m, "en", True, context), DASHBOARD),
+        "rules_legacy_context": (lambda m: app.get_rule_based_response(m, "en", True), [
+            m + context.as_text() for m in DASHBOARD
+        ]),
+        "format_en": (lambda r: app.format_ticket_response(r, "en"), [rows]),
+        "format_ur": (lambda r: app.format_ticket_response(r, "ur"), [rows]),
+        "format_large": (lambda r: app.format_ticket_response(r, "en"), [many_rows]),
+    }
+    for count in KEYWORD_COUNTS:
+        intents = make_intents(count)
+        messages = [m.lower() for m in ENGLISH]
+        selected[f"match_keywords_{count}"] = (IntentMatcher(intents).match, messages)
+        selected[f"scan_keywords_{count}"] = (scan_intents(intents), messages)
+    return selected
+
+
+def run_round(function, inputs, iterations):
+    latencies = []
+    clock = time.perf_counter
+    started = clock()
+    for i in range(iterations):
+        value = inputs[i % len(inputs)]
+        call_started = clock()
+        function(value)
+        latencies.append(clock() - call_started)
+    return summarize(latencies, clock() - started)
+
+
+def run(iterations=500, repeat=20, context_tickets=50, only=None, warmup=200):
+    """Run the benchmark cases (or just those in ``only``); returns ``{case: summary}``"""
+    selected = {name: case for name, case in cases(context_tickets).items() if not only or name in only}
+    for function, inputs in selected.values():
+        for i in range(warmup):
+            function(inputs[i % len(inputs)])
+    results = {}
+    for _ in range(repeat):
+        for name, (function, inputs) in selected.items():
+            result = run_round(function, inputs, iterations)
+            best = results.setdefault(name, result)
+            best["throughput"] = max(best["throughput"], result["throughput"])
+            for pct in (50, 95, 99):
+                best[f"p{pct}_ms"] = min(best[f"p{pct}_ms"], result[f"p{pct}_ms"])
+    return results
+
+
+def print_results(results):
+    print(f"{'case':<24} {'calls/s':>10} {'p50 us':>8} {'p95 us':>8} {'p99 us':>8}")
+    for name, result in results.items():
+        print(f"{name:<24} {result['throughput']:>10.0f} "
+              + " ".join(f"{result[f'p{pct}_ms'] * 1000:>8.1f}" for pct in (50, 95, 99)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=500, help="timed calls per round")
+    parser.add_argument("--repeat", type=int, default=20, help="rounds per case; the best is kept")
+    parser.add_argument("--context-tickets", type=int, default=50, help="tickets in the large dashboard context")
+    parser.add_argument("--case", action="append", help="run only this case (repeatable)")
+    args = parser.parse_args()
+    print_results(run(args.iterations, args.repeat, args.context_tickets, args.case))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""Serve the chatbot against fake_database.py's SQLite stand-in, for benchmarks only.
+
+    DATABASE_URL=sqlite:///bench.db gunicorn bench_server:app --threads 16
+    DATABASE_URL=sqlite:///bench.db python bench_server.py           # Flask dev server
+    DATABASE_URL=sqlite:///bench.db python bench_server.py --async   # async_app.py
+
+Imports app.py, installs the stand-in named by the ``sqlite://``
+``DATABASE_URL`` into its connection pool and serves it unchanged, so
+app.py and async_app.py never import benchmark code themselves.
+gunicorn.conf.py finds the warm-up hooks here as it does in app.py.
+"""
+import os
+import sys
+
+import app as chatbot
+import fake_database
+
+fake_database.install(chatbot, os.environ["DATABASE_URL"])
+
+app = chatbot.app
+warm_shared = chatbot.warm_shared
+warm_up = chatbot.warm_up
+
+if __name__ == "__main__":
+    port = int(os.environ.get("PORT", 5000))
+    if "--async" in sys.argv[1:]:
+        from aiohttp import web
+
+        import async_app
+
+        web.run_app(async_app.app, host="0.0.0.0", port=port)
+    else:
+        chatbot.start_warm_up()
+        app.run(host="0.0.0.0", port=port, debug=False)
@@ -0,0 +1,44 @@
+"""Compare the sync and async serving modes at 50-500 concurrent clients.
+
+    python bench_serving.py
+    python bench_serving.py --clients 50 500 --duration 20 --latency-ms 500
+
+Runs bench_load.py's request mix against the sync app under gunicorn
+(one worker with ``--threads`` threads) and against async_app.py (one
+event loop), both served by bench_server.py and pointed at the same
+fake_inference.py model and seeded SQLite database, once per
+``--clients`` level. Reports overall requests per second, p50/p99 and
+the non-2xx rate for each mode, and the async mode's throughput relative
+to sync. Every other bench_load.py option applies to both modes.
+"""
+import argparse
+import asyncio
+import copy
+
+import bench_load
+
+SERVERS = ("sync", "async")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    bench_load.add_arguments(parser)
+    parser.add_argument("--clients", type=int, nargs="+", default=[50, 100, 200, 500],
+                        help="concurrent client levels to compare")
+    args = parser.parse_args()
+
+    print(f"{'clients':>7} {'server':<6} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7} {'vs sync':>8}")
+    for clients in args.clients:
+        overall = {}
+        for server in SERVERS:
+            run_args = copy.copy(args)
+            run_args.server, run_args.concurrency = server, clients
+            results, _ = asyncio.run(bench_load.run(run_args))
+            overall[server] = result = results["overall"]
+            ratio = result["throughput"] / overall["sync"]["throughput"] if overall["sync"]["throughput"] else 0
+            print(f"{clients:>7} {server:<6} {result['throughput']:>8.1f} {result['p50_ms']:>8.1f} "
+                  f"{result['p99_ms']:>8.1f} {result['error_rate']:>7.1%} {ratio:>7.2f}x", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Measure import time, time until ready and per-worker memory, with and without preload.
+
+    python bench_startup.py
+    python bench_startup.py --workers 4 --runs 5
+
+First imports app.py in ``--runs`` fresh interpreters and reports the
+median import time, and checks that the slow optional imports
+(mysql.connector, requests, python-dotenv) stay out of it. Then, for
+``PRELOAD_APP`` on and off, starts gunicorn with ``--workers`` workers
+of bench_server.py against a seeded fake_database.py file and the stub
+AI backend, and reports the time from launch until /health answers (live), until
+/health/ready does (warm) and until the first /chat answer, along with
+each worker's own startup stats and its memory from
+/proc/<pid>/smaps_rollup: private memory is what the worker alone holds,
+PSS also counts a share of the pages it still shares with the master and
+the other workers. Linux only.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+import fake_database
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+LAZY_MODULES = ("mysql.connector", "requests", "dotenv")
+
+IMPORT_SCRIPT = f"""
+import json, sys, time
+started = time.perf_counter()
+import app
+print(time.perf_counter() - started, json.dumps([m for m in {LAZY_MODULES!r} if m in sys.modules]))
+"""
+
+
+def measure_import(runs, env):
+    """Median seconds to import app.py, and the lazy modules any run imported anyway"""
+    durations, loaded = [], set()
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT], cwd=HERE, env=env, capture_output=True,
+                                text=True, check=True).stdout.splitlines()[-1].split(" ", 1)
+        durations.append(float(output[0]))
+        loaded.update(json.loads(output[1]))
+    return statistics.median(durations), sorted(loaded)
+
+
+def get(url, data=None):
+    """``(status, parsed JSON body)``, or None while the server isn't listening"""
+    headers = {"Content-Type": "application/json"} if data is not None else {}
+    request = urllib.request.Request(url, json.dumps(data).encode() if data is not None else None, headers)
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, None
+    except OSError:
+        return None
+
+
+def wait_for(url, started, timeout=30):
+    """Seconds since ``started`` until ``url`` answers 200"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = get(url)
+        if result is not None and result[0] == 200:
+            return time.monotonic() - started, result[1]
+        time.sleep(0.005)
+    raise RuntimeError(f"{url} did not answer within {timeout}s")
+
+
+def worker_pids(master_pid):
+    with open(f"/proc/{master_pid}/task/{master_pid}/children") as f:
+        return [int(pid) for pid in f.read().split()]
+
+
+def memory_kb(pid):
+    """``{"private": kB, "pss": kB}`` for one process"""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return {"private": fields["Private_Clean"] + fields["Private_Dirty"], "pss": fields["Pss"]}
+
+
+def measure_server(args, env, preload):
+    """Start gunicorn, time it until live, ready and first answer, then read its workers' memory"""
+    env = dict(env, PRELOAD_APP="true" if preload else "false")
+    base_url = f"http://127.0.0.1:{args.port}"
+    started = time.monotonic()
+    server = subprocess.Popen(["gunicorn", "bench_server:app", "--bind", f"127.0.0.1:{args.port}",
+                               "--workers", str(args.workers)], cwd=HERE, env=env, stderr=subprocess.DEVNULL)
+    try:
+        live, _ = wait_for(f"{base_url}/health", started)
+        ready, _ = wait_for(f"{base_url}/health/ready", started)
+        status, _ = get(f"{base_url}/chat", {"message": "how many pages are in a passport", "language": "en"})
+        first_response = time.monotonic() - started
+        if status != 200:
+            raise RuntimeError(f"/chat answered {status}")
+        # Every worker warm and serving before its memory is read
+        deadline = time.monotonic() + 30
+        workers = {}
+        while len(workers) < args.workers and time.monotonic() < deadline:
+            _, stats = get(f"{base_url}/health/ready")
+            workers[stats["pid"]] = stats
+            get(f"{base_url}/chat", {"message": "what is the fee for residence certificate", "language": "en"})
+        memory = [memory_kb(pid) for pid in worker_pids(server.pid)]
+    finally:
+        server.terminate()
+        server.wait()
+    return {
+        "live_s": live, "ready_s": ready, "first_response_s": first_response,
+        "worker_ready_s": statistics.median(w["ready_seconds"] for w in workers.values()),
+        "worker_warmup_s": statistics.median(w["warmup_seconds"] for w in workers.values()),
+        "private_mb": statistics.mean(m["private"] for m in memory) / 1024,
+        "pss_mb": statistics.mean(m["pss"] for m in memory) / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters / server starts; medians are kept")
+    parser.add_argument("--port", type=int, default=5056)
+    parser.add_argument("--users", type=int, default=2000, help="users seeded into the database")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        fake_database.seed(db_path, args.users)
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{db_path}", AI_BACKEND="stub", RETRIEVAL_SERVICES="true",
+                   RATE_LIMIT_PER_MINUTE="0", LOG_LEVEL="WARNING")
+
+        import_seconds, loaded = measure_import(args.runs, env)
+        print(f"import app: {import_seconds * 1000:.0f} ms (median of {args.runs})")
+        print(f"lazy modules imported anyway: {', '.join(loaded) or 'none'}")
+
+        print(f"\ngunicorn, {args.workers} workers, median of {args.runs} starts")
+        print(f"{'preload':<8} {'live ms':>8} {'ready ms':>9} {'1st answer ms':>14} {'worker ready ms':>16} "
+              f"{'warmup ms':>10} {'private MB':>11} {'PSS MB':>7}")
+        for preload in (True, False):
+            runs = [measure_server(args, env, preload) for _ in range(args.runs)]
+            result = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+            print(f"{'on' if preload else 'off':<8} {result['live_s'] * 1000:>8.0f} {result['ready_s'] * 1000:>9.0f} "
+                  f"{result['first_response_s'] * 1000:>14.0f} {result['worker_ready_s'] * 1000:>16.1f} "
+                  f"{result['worker_warmup_s'] * 1000:>10.1f} {result['private_mb']:>11.1f} {result['pss_mb']:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Run the benchmark suite, save the results as JSON and compare them against a baseline.
+
+    python bench_suite.py                          # compare with bench_baseline.json
+    python bench_suite.py --output results.json --skip-load
+    python bench_suite.py --update-baseline        # accept the current numbers
+
+Runs bench_rules.py's micro-benchmarks and bench_load.py's end-to-end load
+test (which starts its own fake model, SQLite database and server), writes
+every result to ``--output``, then compares each one with the same entry in
+``--baseline``. A result is a regression when its throughput fell, or its
+p50/p95 rose, by more than ``--tolerance``; p99 gets the looser
+``--tail-tolerance`` and the load test's error rate may rise by at most
+``--error-tolerance``. Latency changes under NOISE_FLOOR_MS never count.
+Any regression is printed in a banner and the script exits with status 1,
+so a CI step running it fails.
+
+Numbers only compare on the same machine and settings: regenerate the
+baseline with ``--update-baseline`` after moving to other hardware or
+changing the load settings.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+
+import bench_load
+import bench_rules
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Latency changes smaller than this are scheduling noise, not regressions.
+# The load test's floor is coarse; the micro-benchmarks catch small slowdowns.
+NOISE_FLOOR_MS = {"micro": 0.005, "load": 10.0}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance, tail_tolerance, error_tolerance):
+    """Rows of ``(name, metric, baseline, current, change, regressed)`` for every shared result"""
+    rows = []
+    for name, current in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        floor = NOISE_FLOOR_MS[name.split(".", 1)[0]]
+        for metric in ("throughput", "p50_ms", "p95_ms", "p99_ms", "error_rate"):
+            if metric not in current or metric not in before:
+                continue
+            old, new = before[metric], current[metric]
+            if metric == "error_rate":
+                change = new - old
+                regressed = change > error_tolerance
+            else:
+                change = (new - old) / old if old else 0.0
+                if metric == "throughput":
+                    regressed = change < -tolerance
+                else:
+                    allowed = tail_tolerance if metric == "p99_ms" else tolerance
+                    regressed = change > allowed and new - old > floor
+            rows.append((name, metric, old, new, change, regressed))
+    return rows
+
+
+def print_comparison(rows):
+    print(f"\n{'result':<32} {'metric':<11} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, metric, old, new, change, regressed in rows:
+        if metric == "error_rate":
+            values = f"{old:>10.1%} {new:>10.1%} {change * 100:>+7.1f}pt"
+        else:
+            values = f"{old:>10.4g} {new:>10.4g} {change:>+8.0%}"
+        print(f"{name:<32} {metric:<11} {values}{'   <-- REGRESSION' if regressed else ''}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", default=os.path.join(HERE, "bench_baseline.json"))
+    parser.add_argument("--update-baseline", action="store_true", help="save the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed throughput/p50/p95 change")
+    parser.add_argument("--tail-tolerance", type=float, default=0.5, help="allowed p99 change")
+    parser.add_argument("--error-tolerance", type=float, default=0.02, help="allowed error rate increase")
+    parser.add_argument("--iterations", type=int, default=500, help="timed calls per micro-benchmark round")
+    parser.add_argument("--repeat", type=int, default=20, help="micro-benchmark rounds; the best is kept")
+    parser.add_argument("--skip-micro", action="store_true")
+    parser.add_argument("--skip-load", action="store_true")
+    bench_load.add_arguments(parser)
+    args = parser.parse_args()
+
+    results = {}
+    if not args.skip_micro:
+        print("micro-benchmarks")
+        micro = bench_rules.run(args.iterations, args.repeat)
+        bench_rules.print_results(micro)
+        results.update((f"micro.{name}", result) for name, result in micro.items())
+    if not args.skip_load:
+        print(f"\nload test ({args.server}, {args.concurrency} clients, {args.duration:g}s)")
+        load, _ = asyncio.run(bench_load.run(args))
+        bench_load.print_results(load)
+        results.update((f"load.{name}", result) for name, result in load.items())
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()}, {os.cpu_count()} CPUs",
+        "settings": {key: getattr(args, key) for key in (
+            "iterations", "repeat", "server", "threads", "latency_ms", "error_rate", "slots", "users",
+            "ai_questions", "concurrency", "duration", "seed",
+        )},
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nresults written to {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"baseline updated: {args.baseline}")
+        return
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print(f"no baseline at {args.baseline}; run with --update-baseline to create one")
+        return
+    if baseline.get("settings") != report["settings"] or baseline.get("machine") != report["machine"]:
+        print(f"warning: baseline was recorded with other settings or on another machine "
+              f"({baseline.get('machine')}, {baseline.get('settings')})")
+
+    rows = compare(results, baseline["results"], args.tolerance, args.tail_tolerance, args.error_tolerance)
+    print_comparison(rows)
+    regressions = [row for row in rows if row[5]]
+    if regressions:
+        banner = "!" * 72
+        print(f"\n{banner}\nPERFORMANCE REGRESSION: {len(regressions)} metric(s) worse than "
+              f"{args.baseline} (commit {baseline.get('commit')})", file=sys.stderr)
+        for name, metric, old, new, change, _ in regressions:
+            print(f"  {name} {metric}: {old:.4g} -> {new:.4g}", file=sys.stderr)
+        print(banner, file=sys.stderr)
+        sys.exit(1)
+    print(f"\nno regressions against {args.baseline} (commit {baseline.get('commit')})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Circuit breaker for calls to the remote AI model"""
+import threading
+import time
+from collections import deque
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class Permit:
+    """A call ``CircuitBreaker.allow_request`` let through; ``probe_window`` is set for half-open probes"""
+
+    __slots__ = ("probe_window",)
+
+    def __init__(self, probe_window=None):
+        self.probe_window = probe_window
+
+
+class CircuitBreaker:
+    """Stop calling a failing dependency until it has had time to recover.
+
+    The breaker opens after ``failure_threshold`` consecutive failures, where
+    a call slower than ``slow_call_seconds`` counts as a failure even if it
+    eventually succeeded. While open every request is refused. After
+    ``reset_timeout`` seconds it goes half-open and lets up to
+    ``half_open_calls`` probes through; if they all succeed it closes again,
+    and any failed probe re-opens it. Probes that haven't all reported back
+    within ``probe_timeout`` (by default the longer of ``reset_timeout`` and
+    ``slow_call_seconds``) re-open it too, so a probe whose outcome is never
+    recorded can't leave it half-open for good.
+
+    ``allow_request`` hands each call it lets through a ``Permit`` to pass
+    back to ``record``. While half-open only the current window's probes
+    decide whether it closes or re-opens, so a slow call admitted before the
+    breaker opened can't close it by finishing late.
+    """
+
+    def __init__(self, failure_threshold=5, slow_call_seconds=5.0, reset_timeout=30.0, half_open_calls=1,
+                 probe_timeout=None):
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self.probe_timeout = max(reset_timeout, slow_call_seconds) if probe_timeout is None else probe_timeout
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._half_opened_at = 0.0
+        self._probes_started = 0
+        self._probes_succeeded = 0
+        self._probe_window = 0
+        self._transitions = deque(maxlen=20)
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.slow_calls = 0
+        self.rejected = 0
+
+    def _transition(self, state, reason):
+        self._transitions.append({"at": time.time(), "from": self._state, "to": state, "reason": reason})
+        self._state = state
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        elif state == HALF_OPEN:
+            self._half_opened_at = time.monotonic()
+            self._probe_window += 1
+            self._probes_started = 0
+            self._probes_succeeded = 0
+        else:
+            self._consecutive_failures = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def allow_request(self):
+        """Return a ``Permit`` if a call may go through now, else None"""
+        with self._lock:
+            now = time.monotonic()
+            if self._state == HALF_OPEN and now - self._half_opened_at >= self.probe_timeout:
+                self._transition(OPEN, f"{self.half_open_calls - self._probes_succeeded} probe(s) unfinished "
+                                       f"after {self.probe_timeout:g}s")
+            elif self._state == OPEN and now - self._opened_at >= self.reset_timeout:
+                self._transition(HALF_OPEN, "reset timeout elapsed")
+            if self._state == CLOSED:
+                self.calls += 1
+                return Permit()
+            if self._state == HALF_OPEN and self._probes_started < self.half_open_calls:
+                self._probes_started += 1
+                self.calls += 1
+                return Permit(self._probe_window)
+            self.rejected += 1
+            return None
+
+    def record(self, ok, duration, permit=None):
+        """Record the outcome of a call, given the ``permit`` ``allow_request`` let it through with"""
+        slow = duration >= self.slow_call_seconds
+        with self._lock:
+            probe = self._state == HALF_OPEN and permit is not None and permit.probe_window == self._probe_window
+            if slow:
+                self.slow_calls += 1
+            if ok and not slow:
+                self.successes += 1
+                if probe:
+                    self._probes_succeeded += 1
+                    if self._probes_succeeded >= self.half_open_calls:
+                        self._transition(CLOSED, "probe calls succeeded")
+                elif self._state == CLOSED:
+                    self._consecutive_failures = 0
+                return
+
+            self.failures += 1
+            reason = f"slow call ({duration:.2f}s)" if ok else "call failed"
+            if probe:
+                self._transition(OPEN, f"probe {reason}")
+            elif self._state == CLOSED:
+                self._consecutive_failures += 1
+                if self._consecutive_failures >= self.failure_threshold:
+                    self._transition(OPEN, f"{self._consecutive_failures} consecutive failures, last {reason}")
+
+    def stats(self):
+        """Snapshot of breaker state, counters and recent transitions"""
+        with self._lock:
+            retry_in = None
+            if self._state == OPEN:
+                retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+            return {
+                "state": self._state,
+                "consecutive_failures": self._consecutive_failures,
+                "retry_in_seconds": retry_in,
+                "calls": self.calls,
+                "successes": self.successes,
+                "failures": self.failures,
+                "slow_calls": self.slow_calls,
+                "rejected": self.rejected,
+                "transitions": list(self._transitions),
+            }
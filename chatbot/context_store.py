@@ -0,0 +1,185 @@
+"""Per-user dashboard ticket context kept on the chatbot side.
+
+The Next.js route used to load and send a user's recent tickets with every
+dashboard message. The store keeps that snapshot per ``userId`` instead,
+so a message only has to carry the ID. Callers push a full snapshot when a
+user has none stored (or it expired) and small deltas when a ticket changes.
+
+Entries are compact: one tuple of ``(id, service, status, agent, payment,
+delivery)`` tuples per user, with the repeated strings interned, and the
+TicketContext the rule engine uses is rebuilt on read. The store is
+bounded by ``max_users`` (least recently used users go first) and every
+entry expires ``ttl`` seconds after its last snapshot or delta, which also
+caps how long a missed delta can leave a stale answer.
+
+With several gunicorn workers each keeps its own store. A delta updates the
+worker that received it and, through an optional ``SqliteInvalidationLog``,
+makes the other workers drop that user, so their next message asks for a
+fresh snapshot instead of answering from an old one.
+"""
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from ticket_context import TicketContext, TicketRecord
+
+TICKET_FIELDS = ("id", "service", "status", "agent", "payment", "delivery")
+
+
+class ContextMissing(Exception):
+    """No stored context for the user - the caller has to send a snapshot"""
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def compact_ticket(record):
+    """One ticket as a tuple in TICKET_FIELDS order, sharing repeated strings"""
+    return tuple(_intern(getattr(record, field)) for field in TICKET_FIELDS)
+
+
+def user_key(user_id):
+    """Store key for a ``userId`` sent as a number or numeric string"""
+    try:
+        return int(user_id)
+    except (TypeError, ValueError):
+        raise ValueError("userId must be an integer")
+
+
+class UserContextStore:
+    """Bounded LRU of users' recent tickets with a per-entry TTL.
+
+    ``max_tickets`` matches what a snapshot holds (the Next.js route sends
+    the latest 5), so a delta that adds a new ticket pushes the oldest out.
+    """
+
+    def __init__(self, max_users=10000, ttl=600, max_tickets=5, invalidation_log=None, poll_interval=0.25):
+        self.max_users = max_users
+        self.ttl = ttl
+        self.max_tickets = max_tickets
+        self.invalidation_log = invalidation_log
+        self.poll_interval = poll_interval
+        self._entries = OrderedDict()  # user id -> (tickets, expires_at)
+        self._lock = threading.Lock()
+        self._log_seq = invalidation_log.latest() if invalidation_log else 0
+        self._next_poll = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.snapshots = 0
+        self.deltas = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _store(self, key, tickets, now):
+        self._entries[key] = (tickets, now + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _poll_log(self, now):
+        # Drop users whose tickets another worker saw change
+        if self.invalidation_log is None or now < self._next_poll:
+            return
+        self._next_poll = now + self.poll_interval
+        try:
+            seq, _, user_ids = self.invalidation_log.since(self._log_seq)
+        except sqlite3.Error:
+            return
+        with self._lock:
+            self._log_seq = max(self._log_seq, seq)
+            for user_id in user_ids:
+                if self._entries.pop(user_id, None) is not None:
+                    self.invalidations += 1
+
+    def get(self, user_id):
+        """The user's TicketContext, or None when nothing (unexpired) is stored"""
+        key = user_key(user_id)
+        now = time.monotonic()
+        self._poll_log(now)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            tickets = entry[0]
+        return TicketContext([TicketRecord(*ticket) for ticket in tickets])
+
+    def put(self, user_id, items):
+        """Replace the user's context with a snapshot of ``tickets`` items, newest first"""
+        key = user_key(user_id)
+        tickets = tuple(compact_ticket(record) for record in TicketContext.from_dicts(items).tickets[:self.max_tickets])
+        with self._lock:
+            self._store(key, tickets, time.monotonic())
+            self.snapshots += 1
+
+    def apply_delta(self, user_id, updates=(), removed=()):
+        """Apply changed fields to stored tickets; returns False when nothing is stored.
+
+        Each update is a dict with the ticket ``id`` and the fields that
+        changed, e.g. ``{"id": 12, "status": "COMPLETED"}``. An update for a
+        ticket that isn't stored adds it as the newest one if it has at least
+        ``service`` and ``status``, and is ignored otherwise (it's older than
+        the tickets the snapshot kept). ``removed`` lists ticket IDs to drop.
+        """
+        key = user_key(user_id)
+        now = time.monotonic()
+        applied = False
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                tickets = {ticket[0]: ticket for ticket in entry[0]}
+                order = [ticket[0] for ticket in entry[0]]
+                for update in updates:
+                    ticket_id = update["id"]
+                    if ticket_id in tickets:
+                        fields = dict(zip(TICKET_FIELDS, tickets[ticket_id]))
+                        fields.update((field, update[field]) for field in TICKET_FIELDS[1:] if field in update)
+                        tickets[ticket_id] = tuple(_intern(fields[field]) for field in TICKET_FIELDS)
+                    elif update.get("service") and update.get("status"):
+                        tickets[ticket_id] = compact_ticket(TicketRecord.from_dict(update))
+                        order.insert(0, ticket_id)
+                for ticket_id in removed:
+                    if tickets.pop(ticket_id, None) is not None:
+                        order.remove(ticket_id)
+                self._store(key, tuple(tickets[i] for i in order[:self.max_tickets]), now)
+                self.deltas += 1
+                applied = True
+            elif entry is not None:
+                del self._entries[key]
+        if self.invalidation_log is not None:
+            self.invalidation_log.append((), [key])
+        return applied
+
+    def delete(self, user_id):
+        key = user_key(user_id)
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.invalidation_log is not None:
+            self.invalidation_log.append((), [key])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "users": len(self._entries),
+                "max_users": self.max_users,
+                "ttl": self.ttl,
+                "shared_invalidation": self.invalidation_log is not None,
+                "hits": self.hits,
+                "misses": self.misses,
+                "snapshots": self.snapshots,
+                "deltas": self.deltas,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,190 @@
+"""Process-wide MySQL connection pool for the chatbot's ticket lookups"""
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from urllib.parse import urlparse, unquote
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes free within the checkout timeout"""
+
+
+def connect_mysql(**config):
+    """``mysql.connector.connect``, imported on first use since the driver is slow to import"""
+    import mysql.connector
+
+    return mysql.connector.connect(**config)
+
+
+def parse_database_url(db_url):
+    """Parse a mysql:// URL into mysql.connector keyword arguments"""
+    parsed = urlparse(db_url)
+    return {
+        "host": parsed.hostname or "localhost",
+        "port": parsed.port or 3306,
+        "user": unquote(parsed.username or "root"),
+        "password": unquote(parsed.password or ""),
+        "database": parsed.path.lstrip("/") or "nadradb",
+    }
+
+
+class ConnectionPool:
+    """Bounded pool of MySQL connections.
+
+    Connections are opened lazily, validated with a ping on checkout and
+    recycled once they are older than ``recycle`` seconds. The pool is
+    bound to the process that created its connections, so a pool
+    inherited by a forked gunicorn worker starts empty instead of sharing
+    sockets with its parent. ``connect`` opens one connection from
+    ``config`` and defaults to ``connect_mysql``.
+    """
+
+    def __init__(self, config, size=2, timeout=5.0, recycle=1800, connect=None):
+        self.config = dict(config)
+        self.connect = connect or connect_mysql
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self._cond = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = deque()  # (connection, created_at)
+        self._open = 0
+        self._in_use = 0
+        self._created = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._recycled = 0
+        self._discarded = 0
+
+    def _connect(self):
+        conn = self.connect(autocommit=True, **self.config)
+        with self._cond:
+            self._created += 1
+        return conn, time.monotonic()
+
+    def _is_usable(self, conn, created_at):
+        if time.monotonic() - created_at > self.recycle:
+            with self._cond:
+                self._recycled += 1
+            return False
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            with self._cond:
+                self._discarded += 1
+            return False
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        """Check out a connection, waiting up to ``timeout`` seconds for one"""
+        entry = None
+        with self._cond:
+            if self._pid != os.getpid():
+                self._reset()
+            deadline = time.monotonic() + self.timeout
+            waited = False
+            while True:
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._open < self.size:
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(f"No database connection free after {self.timeout}s")
+                if not waited:
+                    self._waits += 1
+                    waited = True
+                self._cond.wait(remaining)
+            self._in_use += 1
+
+        try:
+            if entry is not None and not self._is_usable(*entry):
+                self._close_quietly(entry[0])
+                entry = None
+            if entry is None:
+                entry = self._connect()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return entry
+
+    def release(self, entry, discard=False):
+        """Return a connection to the pool, or close it if ``discard`` is set"""
+        with self._cond:
+            self._in_use -= 1
+            if discard or self._pid != os.getpid():
+                self._open -= 1
+            else:
+                self._idle.append(entry)
+            self._cond.notify()
+        if discard:
+            self._close_quietly(entry[0])
+
+    @contextmanager
+    def connection(self):
+        """Context manager yielding a pooled connection.
+
+        The connection is discarded rather than reused if the block raises,
+        since it may be left mid-result or broken.
+        """
+        entry = self.acquire()
+        try:
+            yield entry[0]
+        except Exception:
+            self.release(entry, discard=True)
+            raise
+        else:
+            self.release(entry)
+
+    def warm(self, count=1):
+        """Open up to ``count`` connections ahead of the first request and leave them idle"""
+        entries = []
+        try:
+            for _ in range(min(count, self.size)):
+                entries.append(self.acquire())
+        finally:
+            for entry in entries:
+                self.release(entry)
+        return len(entries)
+
+    def close(self):
+        """Close every idle connection"""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._open -= len(idle)
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    def stats(self):
+        """Snapshot of pool usage counters"""
+        with self._cond:
+            return {
+                "size": self.size,
+                "open": self._open,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "created": self._created,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "recycled": self._recycled,
+                "discarded": self._discarded,
+            }
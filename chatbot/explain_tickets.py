@@ -0,0 +1,67 @@
+"""Print MySQL's plans for the batched /tickets/status queries.
+
+    DATABASE_URL=mysql://... python explain_tickets.py
+
+Samples a few real ticket IDs, CNICs and emails, runs EXPLAIN on each
+lookup query the server will actually use (the LATERAL form on MySQL
+8.0.14+, the correlated-subquery form before that) and flags plans that
+sort rows or scan a whole table, which means an index from the README's
+"Ticket status indexes" section is missing.
+"""
+import os
+
+import mysql.connector
+
+import app
+from db_pool import parse_database_url
+
+SAMPLES = {
+    "id": "SELECT id FROM Ticket ORDER BY id DESC LIMIT 5",
+    "cnic": "SELECT cnic FROM User WHERE cnic IS NOT NULL LIMIT 5",
+    "email": "SELECT email FROM User WHERE email IS NOT NULL LIMIT 5",
+}
+
+
+def tabular_plan(cursor, query, values):
+    """Classic EXPLAIN for servers without FORMAT=TREE, worded like the tree plan's problems"""
+    cursor.execute("EXPLAIN " + query, tuple(values))
+    columns = [column[0] for column in cursor.description]
+    lines = []
+    for row in cursor.fetchall():
+        step = dict(zip(columns, row))
+        lines.append(f"{step['table']}: type={step['type']} key={step['key']} extra={step['Extra']}")
+        if "filesort" in (step["Extra"] or ""):
+            lines.append("    Sort")
+        if step["type"] == "ALL":
+            lines.append(f"    Table scan on {step['table']} ")
+    return "\n".join(lines)
+
+
+def main():
+    conn = mysql.connector.connect(**parse_database_url(os.getenv("DATABASE_URL", "mysql://root:@localhost:3306/nadradb")))
+    queries = app.ticket_status_queries(conn)
+    cursor = conn.cursor()
+    warnings = 0
+    for kind, sample_query in SAMPLES.items():
+        cursor.execute(sample_query)
+        values = [row[0] for row in cursor.fetchall()] or [0]
+        query = queries[kind].format(placeholders=", ".join(["%s"] * len(values)))
+        if queries is app.TICKET_STATUS_QUERIES:
+            cursor.execute("EXPLAIN FORMAT=TREE " + query, tuple(values))
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+        else:
+            plan = tabular_plan(cursor, query, values)
+        print(f"--- {kind} lookup ({len(values)} keys)\n{plan}\n")
+        # A sort, or a full scan of Ticket (t) or User (u), means the lookup
+        # is not using the (userId, createdAt) or unique cnic/email indexes
+        for problem in ("Sort", "Table scan on t ", "Table scan on u "):
+            if problem in plan:
+                warnings += 1
+                print(f"!!  {kind} lookup plan contains '{problem.strip()}'\n")
+    cursor.close()
+    conn.close()
+    print("no sorts or full scans" if not warnings else f"{warnings} plan warning(s)")
+
+
+if __name__ == "__main__":
+    main()
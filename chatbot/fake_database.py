@@ -0,0 +1,224 @@
+"""Seeded SQLite stand-in for the MySQL database, for benchmarks and load tests.
+
+    python fake_database.py bench.db --users 2000 --seed 7
+    DATABASE_URL=sqlite:///bench.db RETRIEVAL_SERVICES=true python bench_server.py --async
+
+Creates the tables and indexes the chatbot reads (User, Agent, Service,
+RequiredDocument, Ticket) with the services from prisma/seed.js and
+``--users`` synthetic users holding 0-8 tickets each, generated from
+``--seed`` so every run sees the same data. ``connect()`` wraps sqlite3 in
+the small part of the mysql.connector API the chatbot uses (dictionary
+cursors, ``%s`` placeholders, ``ping``), and ``install()`` hands it to an
+imported app.py's ``ConnectionPool``, so the pool opens SQLite connections
+instead. app.py itself never imports this module: the benchmarks serve
+bench_server.py, which installs it first.
+
+SQLite has no LATERAL joins, so the CNIC and email ticket lookups run the
+equivalent queries in ``TICKET_STATUS_QUERIES`` instead. Timings against
+the stand-in cover the pool, the cache and the formatting around the
+database, not MySQL's query plans - use explain_tickets.py for those.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, unquote
+
+SCHEMA = """
+CREATE TABLE User (id INTEGER PRIMARY KEY, name TEXT NOT NULL, cnic TEXT UNIQUE, email TEXT UNIQUE COLLATE NOCASE);
+CREATE TABLE Agent (id INTEGER PRIMARY KEY, name TEXT NOT NULL);
+CREATE TABLE Service (id INTEGER PRIMARY KEY, name TEXT NOT NULL, description TEXT, fee REAL NOT NULL DEFAULT 0);
+CREATE TABLE RequiredDocument (
+    id INTEGER PRIMARY KEY, serviceId INTEGER NOT NULL REFERENCES Service(id),
+    documentName TEXT NOT NULL, description TEXT, isMandatory INTEGER NOT NULL DEFAULT 1
+);
+CREATE TABLE Ticket (
+    id INTEGER PRIMARY KEY, userId INTEGER NOT NULL REFERENCES User(id), agentId INTEGER REFERENCES Agent(id),
+    serviceId INTEGER NOT NULL REFERENCES Service(id), status TEXT NOT NULL DEFAULT 'OPEN', createdAt TIMESTAMP NOT NULL
+);
+CREATE INDEX Ticket_userId_createdAt_idx ON Ticket(userId, createdAt);
+CREATE INDEX RequiredDocument_serviceId_idx ON RequiredDocument(serviceId);
+"""
+
+# (name, description, fee, [(documentName, description, isMandatory)]) as in prisma/seed.js
+SERVICES = [
+    ("New CNIC Registration", "Fresh CNIC issuance for first time", 0, [
+        ("Birth Certificate", "Original or certified copy", True),
+        ("Passport Size Photos", "2 recent color photos", True),
+        ("Guardian's CNIC", "Parent or guardian CNIC copy", True)]),
+    ("CNIC Renewal", "Renew expired CNIC", 1000, [
+        ("Expired CNIC", "Original expired CNIC", True),
+        ("Proof of Address", "Utility bill or rental agreement", False)]),
+    ("CNIC Correction", "Correct name, address, DOB or family info", 800, [
+        ("Current CNIC", "Original CNIC with errors", True),
+        ("Affidavit", "Sworn statement for name/DOB change", False)]),
+    ("Lost CNIC Replacement", "Reissue lost CNIC", 1500, [
+        ("FIR Copy", "Police report for lost CNIC", True),
+        ("Affidavit", "Sworn statement of lost CNIC", True)]),
+    ("Urgent CNIC Processing", "Fast-track CNIC processing", 2500, [
+        ("Urgency Proof", "Travel tickets, visa, emergency documents", True)]),
+    ("Family Registration Certificate (FRC)", "Issue family certificate for visa or legal needs", 600, [
+        ("CNIC of Head", "Family head CNIC copy", True),
+        ("Children's B-Forms", "Birth certificates of children", False)]),
+    ("Birth Certificate Issuance", "Issue birth certificate", 500, [
+        ("Hospital Birth Record", "Birth notification from hospital", True),
+        ("Parents' CNICs", "Both parents' CNIC copies", True)]),
+    ("Marriage Certificate Issuance", "Issue marriage certificate", 700, [
+        ("Nikah Nama", "Original Islamic marriage contract", True),
+        ("Witnesses' CNICs", "Two witnesses' CNIC copies", True)]),
+    ("Death Certificate Issuance", "Issue death certificate", 500, [
+        ("Hospital Death Report", "Medical death notification", True),
+        ("Relationship Proof", "Document proving relationship", False)]),
+    ("Document Verification", "Verify CNIC / family record", 300, [
+        ("Original Document", "Document to be verified", True)]),
+    ("Passport Issuance", "Apply for new passport", 3000, [
+        ("CNIC", "Original valid CNIC", True),
+        ("Previous Passport", "If renewal or lost passport", False)]),
+    ("Urgent Passport Issuance", "Fast-track urgent passport", 5000, [
+        ("Travel Documents", "Tickets, visa, or urgent travel proof", True)]),
+    ("Residence Certificate", "Certificate for address proof", 400, [
+        ("Proof of Residence", "Utility bills (gas, electric, water)", True)]),
+]
+
+AGENTS = ["Ali Raza", "Sara Khan", "Usman Tariq", "Ayesha Malik", "Bilal Ahmed", "Hina Shah", "Kamran Akmal", "Nadia Hussain"]
+STATUSES = ["OPEN", "IN_PROGRESS", "COMPLETED", "CLOSED"]
+
+# SQLite versions of app.TICKET_STATUS_QUERIES' LATERAL lookups: the latest 5
+# tickets per user through a correlated LIMIT subquery on Ticket(userId, createdAt)
+_LATEST_TICKETS = """
+        SELECT u.{column} AS lookupKey, u.id AS userId, t.id, t.status, t.createdAt, s.name as serviceName
+        FROM User u
+        LEFT JOIN Ticket t ON t.id IN (
+            SELECT latest.id FROM Ticket latest
+            WHERE latest.userId = u.id
+            ORDER BY latest.createdAt DESC
+            LIMIT 5
+        )
+        LEFT JOIN Service s ON t.serviceId = s.id
+        WHERE u.{column} IN ({{placeholders}})
+"""
+TICKET_STATUS_QUERIES = {
+    "cnic": _LATEST_TICKETS.format(column="cnic"),
+    "email": _LATEST_TICKETS.format(column="email"),
+}
+
+
+def cnic_for(user_id):
+    return f"35202-{user_id:07d}-{user_id % 10}"
+
+
+def email_for(user_id):
+    return f"citizen{user_id}@example.pk"
+
+
+def seed(path, users=2000, seed=7, max_tickets=8):
+    """Create a fresh database at ``path``; returns (user count, ticket count)"""
+    if os.path.exists(path):
+        os.remove(path)
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    try:
+        conn.executescript(SCHEMA)
+        conn.executemany("INSERT INTO Agent (id, name) VALUES (?, ?)", list(enumerate(AGENTS, 1)))
+        for service_id, (name, description, fee, documents) in enumerate(SERVICES, 1):
+            conn.execute("INSERT INTO Service (id, name, description, fee) VALUES (?, ?, ?, ?)",
+                         (service_id, name, description, fee))
+            conn.executemany(
+                "INSERT INTO RequiredDocument (serviceId, documentName, description, isMandatory) VALUES (?, ?, ?, ?)",
+                [(service_id, *document) for document in documents],
+            )
+        # Fixed epoch so the seed alone decides the data
+        now = datetime(2025, 11, 1)
+        tickets = []
+        for user_id in range(1, users + 1):
+            conn.execute("INSERT INTO User (id, name, cnic, email) VALUES (?, ?, ?, ?)",
+                         (user_id, f"Citizen {user_id}", cnic_for(user_id), email_for(user_id)))
+            for _ in range(rng.randint(0, max_tickets)):
+                status = rng.choice(STATUSES)
+                agent_id = rng.randint(1, len(AGENTS)) if status != "OPEN" else None
+                created_at = now - timedelta(minutes=rng.randint(0, 365 * 24 * 60))
+                tickets.append((user_id, agent_id, rng.randint(1, len(SERVICES)), status,
+                                created_at.strftime("%Y-%m-%d %H:%M:%S")))
+        conn.executemany("INSERT INTO Ticket (userId, agentId, serviceId, status, createdAt) VALUES (?, ?, ?, ?, ?)",
+                         tickets)
+        conn.commit()
+    finally:
+        conn.close()
+    return users, len(tickets)
+
+
+def path_from_url(db_url):
+    """File path of a ``sqlite:///relative.db`` or ``sqlite:////absolute.db`` URL"""
+    return unquote(urlparse(db_url).path[1:])
+
+
+def _dict_row(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+class Cursor:
+    """mysql.connector-style cursor over a sqlite3 cursor"""
+
+    def __init__(self, cursor, dictionary=False):
+        self._cursor = cursor
+        if dictionary:
+            self._cursor.row_factory = _dict_row
+
+    def execute(self, query, params=()):
+        self._cursor.execute(query.replace("%s", "?"), params)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def close(self):
+        self._cursor.close()
+
+
+class Connection:
+    """The part of a mysql.connector connection that ConnectionPool and the chatbot use"""
+
+    def __init__(self, path):
+        # Pooled connections move between a worker's threads, one at a time
+        self._conn = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False,
+                                     isolation_level=None)
+
+    def cursor(self, dictionary=False):
+        return Cursor(self._conn.cursor(), dictionary)
+
+    def ping(self, reconnect=False):
+        self._conn.execute("SELECT 1")
+
+    def close(self):
+        self._conn.close()
+
+
+sqlite3.register_converter("TIMESTAMP", lambda value: datetime.fromisoformat(value.decode()))
+
+
+def connect(path, **_):
+    """Open a connection to the database at ``path``; extra mysql options are ignored"""
+    return Connection(path)
+
+
+def install(chatbot, db_url):
+    """Point an imported app.py's connection pool and ticket queries at the database at ``db_url``"""
+    chatbot.db_pool.close()
+    chatbot.db_pool.config = {"path": path_from_url(db_url)}
+    chatbot.db_pool.connect = connect
+    chatbot.ticket_queries = dict(chatbot.TICKET_STATUS_QUERIES, **TICKET_STATUS_QUERIES)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    started = time.perf_counter()
+    users, tickets = seed(args.path, args.users, args.seed)
+    print(f"{args.path}: {users} users, {tickets} tickets in {time.perf_counter() - started:.2f}s")
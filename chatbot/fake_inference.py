@@ -0,0 +1,118 @@
+"""Local stand-in for the Hugging Face inference endpoint, for load tests.
+
+    python fake_inference.py --port 8089 --latency-ms 300 --slots 4 --error-rate 0.02
+    HF_API_URL=http://127.0.0.1:8089/generate HUGGINGFACE_API_KEY=test python async_app.py
+
+Every request takes ``--latency-ms`` however many prompts it carries, and at
+most ``--slots`` requests are served at once, like a GPU server that runs a
+fixed number of batches in parallel. ``--error-rate`` of the requests
+(drawn from a ``--seed``-ed generator) fail with a 500 after the same
+latency, like a model server that falls over now and then. ``inputs`` may be a single prompt or a
+list of them. With ``"stream": true`` the answer comes back as
+text-generation-inference style server-sent events, one word per event,
+spread over the same latency; a client that disconnects mid-stream is
+counted as ``cancelled``. GET /stats returns upstream request, prompt,
+error and cancellation counts and POST /stats/reset clears them.
+"""
+import argparse
+import asyncio
+import json
+import random
+
+from aiohttp import web
+
+COUNTERS = web.AppKey("counters", dict)
+SLOTS = web.AppKey("slots", asyncio.Semaphore)
+LATENCY = web.AppKey("latency", float)
+ERROR_RATE = web.AppKey("error_rate", float)
+RNG = web.AppKey("rng", random.Random)
+
+
+def answer(prompt):
+    question = prompt.rsplit("<|user|>", 1)[-1].split("<|end|>", 1)[0]
+    return {"generated_text": f"Fake answer to: {question[:80]}"}
+
+
+async def stream(request, prompt):
+    text = answer(prompt)["generated_text"]
+    words = text.split(" ")
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await response.prepare(request)
+    try:
+        for i, word in enumerate(words):
+            await asyncio.sleep(request.app[LATENCY] / len(words))
+            event = {"token": {"id": i, "text": word if i == 0 else " " + word, "special": False},
+                     "generated_text": text if i == len(words) - 1 else None}
+            await response.write(f"data:{json.dumps(event)}\n\n".encode("utf-8"))
+    except ConnectionResetError:
+        request.app[COUNTERS]["cancelled"] += 1
+        return response
+    except asyncio.CancelledError:
+        request.app[COUNTERS]["cancelled"] += 1
+        raise
+    await response.write_eof()
+    return response
+
+
+async def generate(request):
+    payload = await request.json()
+    inputs = payload.get("inputs")
+    if inputs is None:
+        return web.json_response({"error": "inputs is required"}, status=400)
+    failing = request.app[RNG].random() < request.app[ERROR_RATE]
+    if payload.get("stream") and not isinstance(inputs, list) and not failing:
+        counters = request.app[COUNTERS]
+        counters["requests"] += 1
+        counters["prompts"] += 1
+        async with request.app[SLOTS]:
+            return await stream(request, inputs)
+    batch = inputs if isinstance(inputs, list) else [inputs]
+
+    counters = request.app[COUNTERS]
+    counters["requests"] += 1
+    counters["prompts"] += len(batch)
+    counters["max_batch"] = max(counters["max_batch"], len(batch))
+    async with request.app[SLOTS]:
+        await asyncio.sleep(request.app[LATENCY])
+
+    if failing:
+        counters["errors"] += 1
+        return web.json_response({"error": "Internal server error"}, status=500)
+
+    if isinstance(inputs, list):
+        return web.json_response([[answer(prompt)] for prompt in batch])
+    return web.json_response([answer(inputs)])
+
+
+async def stats(request):
+    return web.json_response(request.app[COUNTERS])
+
+
+async def reset(request):
+    request.app[COUNTERS].update(requests=0, prompts=0, max_batch=0, errors=0, cancelled=0)
+    return web.json_response(request.app[COUNTERS])
+
+
+def create_app(latency=0.3, slots=4, error_rate=0.0, seed=None):
+    app = web.Application()
+    app[LATENCY] = latency
+    app[ERROR_RATE] = error_rate
+    app[RNG] = random.Random(seed)
+    app[COUNTERS] = {"requests": 0, "prompts": 0, "max_batch": 0, "errors": 0, "cancelled": 0}
+    app[SLOTS] = asyncio.Semaphore(slots)
+    app.router.add_get("/stats", stats)
+    app.router.add_post("/stats/reset", reset)
+    app.router.add_post("/{tail:.*}", generate)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--slots", type=int, default=4)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with a 500")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    app = create_app(args.latency_ms / 1000, args.slots, args.error_rate, args.seed)
+    web.run_app(app, host="127.0.0.1", port=args.port, print=None)
@@ -0,0 +1,65 @@
+"""Gunicorn settings for the chatbot dyno (loaded automatically from this directory)"""
+import gc
+import importlib
+import os
+import shutil
+import tempfile
+
+# Import the app once in the master and fork the workers from it: they
+# share the imported modules, knowledge base and compiled matchers
+# copy-on-write instead of each building their own. PRELOAD_APP=false
+# imports it in every worker instead, e.g. to reload code with HUP.
+preload_app = os.getenv("PRELOAD_APP", "true").lower() not in ("0", "false", "no")
+if preload_app:
+    # No collections until the shared objects are frozen in when_ready, so
+    # the import doesn't leave freed holes for later allocations to dirty
+    gc.disable()
+
+# Workers share Prometheus samples through files in this directory. It has
+# to exist before the app is imported and is emptied on every start so
+# counters from a previous run don't leak into the new one.
+metrics_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "nadra-chatbot-metrics")
+)
+shutil.rmtree(metrics_dir, ignore_errors=True)
+os.makedirs(metrics_dir, exist_ok=True)
+
+# Ticket cache invalidations and context deltas are shared through this
+# sqlite file so they reach every worker, not just the one serving the call
+ticket_cache_db = os.environ.setdefault(
+    "TICKET_CACHE_DB", os.path.join(tempfile.gettempdir(), "nadra-chatbot-tickets.db")
+)
+for suffix in ("", "-wal", "-shm"):
+    if os.path.exists(ticket_cache_db + suffix):
+        os.remove(ticket_cache_db + suffix)
+
+
+def child_exit(server, worker):
+    """Drop a dead worker's live gauges from the merged metrics"""
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def served_module(app):
+    """The module gunicorn serves, e.g. ``app`` for ``app:app``"""
+    return importlib.import_module(app.app_uri.split(":", 1)[0])
+
+
+def when_ready(server):
+    """Run the shared warm-up in the preloaded master, then freeze what the workers will share"""
+    if server.cfg.preload_app:
+        module = served_module(server.app)
+        if hasattr(module, "warm_shared"):
+            module.warm_shared()
+        # Frozen objects are never visited by the collector, so a worker's
+        # collections don't write to (and copy) the pages it inherited
+        gc.freeze()
+    gc.enable()
+
+
+def post_worker_init(worker):
+    """Warm the worker up before it accepts its first connection"""
+    module = served_module(worker.app)
+    if hasattr(module, "warm_up"):
+        module.warm_up()
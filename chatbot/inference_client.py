@@ -0,0 +1,278 @@
+"""Clients for the text-generation endpoint.
+
+``InferenceClient`` (requests, sync app) and ``AsyncInferenceClient``
+(aiohttp, async app) keep one keep-alive connection pool per worker, send
+pre-built auth headers, and retry 503 "model is loading" responses with
+jittered exponential backoff. The stub clients answer locally in the same
+response format, so the service can be load-tested without any endpoint.
+
+``stream(payload)`` relays a generation token by token from the endpoint's
+server-sent events (the text-generation-inference ``"stream": true``
+format). Closing the stream early closes the upstream connection, which
+stops the generation.
+"""
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+
+
+def backoff_delay(attempt, base, cap):
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**attempt)]"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def parse_stream_line(line):
+    """Text of one streamed token from a ``data:`` line, or None for anything else"""
+    if not line.startswith("data:"):
+        return None
+    try:
+        event = json.loads(line[5:])
+    except ValueError:
+        return None
+    token = event.get("token") if isinstance(event, dict) else None
+    if not token or token.get("special"):
+        return None
+    return token.get("text") or None
+
+
+class InferenceClient:
+    """Blocking client with a persistent, fork-aware ``requests`` session.
+
+    ``generate(payload)`` returns the decoded JSON body of a 200 response,
+    or None for any other status once 503 retries are used up. Network
+    errors propagate to the caller.
+    """
+
+    def __init__(self, url, api_key=None, pool_size=10, timeout=10, retries=2, backoff=0.5, max_backoff=4.0):
+        self.url = url
+        self.headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retried = 0
+        self.failed = 0
+
+    def _get_session(self):
+        # Pooled sockets must not be shared with a forked gunicorn worker
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # Imported here: the async app and the stub backend never need it
+                    import requests
+                    from requests.adapters import HTTPAdapter
+
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    session.headers.update(self.headers)
+                    self._session = session
+                    self._pid = os.getpid()
+        return self._session
+
+    def generate(self, payload):
+        """POST ``payload`` to the endpoint, retrying while the model is loading"""
+        session = self._get_session()
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.retried += 1
+                time.sleep(backoff_delay(attempt - 1, self.backoff, self.max_backoff))
+            self.requests += 1
+            response = session.post(self.url, json=payload, timeout=self.timeout)
+            if response.status_code == 200:
+                return response.json()
+            if response.status_code != 503:
+                break
+        self.failed += 1
+        return None
+
+    def stream(self, payload, read_timeout=None):
+        """Yield generated text as it arrives; ``read_timeout`` bounds the wait for each chunk"""
+        session = self._get_session()
+        timeout = (self.timeout, read_timeout or self.timeout)
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.retried += 1
+                time.sleep(backoff_delay(attempt - 1, self.backoff, self.max_backoff))
+            self.requests += 1
+            response = session.post(self.url, json=dict(payload, stream=True), timeout=timeout, stream=True)
+            if response.status_code == 200:
+                break
+            response.close()
+            if response.status_code != 503:
+                break
+        if response.status_code != 200:
+            self.failed += 1
+            return
+        try:
+            for line in response.iter_lines():
+                text = parse_stream_line(line.decode("utf-8"))
+                if text:
+                    yield text
+        finally:
+            # Also reached when the caller stops early - drops the connection mid-generation
+            response.close()
+
+    def warm(self):
+        """Build this process's session before the first call needs it"""
+        self._get_session()
+
+    def close(self):
+        if self._session is not None and self._pid == os.getpid():
+            self._session.close()
+
+    def stats(self):
+        return {"requests": self.requests, "retried": self.retried, "failed": self.failed}
+
+
+class AsyncInferenceClient:
+    """Non-blocking counterpart of InferenceClient on one aiohttp session.
+
+    Create it inside the running event loop (e.g. from an aiohttp cleanup
+    context) and ``await close()`` on shutdown.
+    """
+
+    def __init__(self, url, api_key=None, pool_size=100, timeout=10, retries=2, backoff=0.5, max_backoff=4.0):
+        import aiohttp
+
+        self.url = url
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=pool_size, keepalive_timeout=60),
+            timeout=aiohttp.ClientTimeout(total=timeout),
+            headers={"Authorization": f"Bearer {api_key}"} if api_key else None,
+        )
+        self.requests = 0
+        self.retried = 0
+        self.failed = 0
+
+    async def generate(self, payload):
+        """POST ``payload`` to the endpoint, retrying while the model is loading"""
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.retried += 1
+                await asyncio.sleep(backoff_delay(attempt - 1, self.backoff, self.max_backoff))
+            self.requests += 1
+            async with self.session.post(self.url, json=payload) as response:
+                if response.status == 200:
+                    return await response.json(content_type=None)
+                if response.status != 503:
+                    break
+        self.failed += 1
+        return None
+
+    async def stream(self, payload, read_timeout=None):
+        """Async counterpart of InferenceClient.stream()"""
+        import aiohttp
+
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=read_timeout)
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.retried += 1
+                await asyncio.sleep(backoff_delay(attempt - 1, self.backoff, self.max_backoff))
+            self.requests += 1
+            response = await self.session.post(self.url, json=dict(payload, stream=True), timeout=timeout)
+            if response.status == 200:
+                break
+            response.close()
+            if response.status != 503:
+                break
+        if response.status != 200:
+            self.failed += 1
+            return
+        try:
+            async for line in response.content:
+                text = parse_stream_line(line.decode("utf-8").strip())
+                if text:
+                    yield text
+        finally:
+            response.close()
+
+    async def close(self):
+        await self.session.close()
+
+    def stats(self):
+        return {"requests": self.requests, "retried": self.retried, "failed": self.failed}
+
+
+def stub_generation(prompt):
+    """Canned generation echoing the user's part of a Phi-3 prompt"""
+    question = prompt.rsplit("<|user|>", 1)[-1].split("<|end|>", 1)[0]
+    return {"generated_text": f"Stub answer to: {question[:80]}"}
+
+
+def stub_tokens(payload):
+    """The stub answer to a single prompt, split into word-sized tokens"""
+    text = stub_generation(payload["inputs"])["generated_text"]
+    return [word if i == 0 else " " + word for i, word in enumerate(text.split(" "))]
+
+
+class StubInferenceClient:
+    """Answers every prompt locally after ``latency`` seconds, for tests and benchmarks.
+
+    Streams spread the same latency evenly over the answer's tokens.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.requests = 0
+
+    def respond(self, payload):
+        self.requests += 1
+        inputs = payload["inputs"]
+        if isinstance(inputs, list):
+            return [[stub_generation(prompt)] for prompt in inputs]
+        return [stub_generation(inputs)]
+
+    def generate(self, payload):
+        if self.latency:
+            time.sleep(self.latency)
+        return self.respond(payload)
+
+    def stream(self, payload, read_timeout=None):
+        self.requests += 1
+        tokens = stub_tokens(payload)
+        for token in tokens:
+            if self.latency:
+                time.sleep(self.latency / len(tokens))
+            yield token
+
+    def warm(self):
+        pass
+
+    def close(self):
+        pass
+
+    def stats(self):
+        return {"requests": self.requests, "retried": 0, "failed": 0}
+
+
+class AsyncStubInferenceClient(StubInferenceClient):
+    """asyncio counterpart of StubInferenceClient"""
+
+    async def generate(self, payload):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.respond(payload)
+
+    async def stream(self, payload, read_timeout=None):
+        self.requests += 1
+        tokens = stub_tokens(payload)
+        for token in tokens:
+            if self.latency:
+                await asyncio.sleep(self.latency / len(tokens))
+            yield token
+
+    async def close(self):
+        pass
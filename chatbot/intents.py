@@ -0,0 +1,63 @@
+"""Single-pass keyword intent matching for the rule-based chatbot"""
+import re
+
+
+def _trie_pattern(node):
+    """Render a character trie as a regex that prefers the longest keyword"""
+    branches = [re.escape(ch) + _trie_pattern(child) for ch, child in sorted(node.items()) if ch]
+    if not branches:
+        return ""
+    pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    if "" in node:
+        pattern = "(?:" + pattern + ")?"
+    return pattern
+
+
+class IntentMatcher:
+    """Find every intent whose keywords occur in a message, in one scan.
+
+    Keywords keep the semantics of ``keyword in text``: they match as plain
+    substrings anywhere, including overlapping and nested occurrences. All
+    keywords are compiled into a single trie-shaped regex wrapped in a
+    lookahead, so the scan tries every start position once and captures the
+    longest keyword starting there. Shorter keywords that are prefixes of
+    that capture are folded in through a precomputed table, so the cost of
+    a scan depends on the message length rather than the keyword count.
+    """
+
+    def __init__(self, intents):
+        keyword_intents = {}
+        for name, keywords in intents:
+            for keyword in keywords:
+                keyword_intents.setdefault(keyword, set()).add(name)
+
+        trie = {}
+        for keyword in keyword_intents:
+            node = trie
+            for ch in keyword:
+                node = node.setdefault(ch, {})
+            node[""] = True
+
+        self._regex = re.compile("(?=(" + _trie_pattern(trie) + "))")
+        self._intents_for = {
+            keyword: frozenset().union(*(
+                names for prefix, names in keyword_intents.items() if keyword.startswith(prefix)
+            ))
+            for keyword in keyword_intents
+        }
+
+    def match(self, text):
+        """Return the set of intent names with at least one keyword in ``text``"""
+        matched = set()
+        intents_for = self._intents_for
+        for found in self._regex.findall(text):
+            matched |= intents_for[found]
+        return matched
+
+
+def first_intent(matched, priority):
+    """Pick the highest-priority intent from ``priority`` that was matched"""
+    for name in priority:
+        if name in matched:
+            return name
+    return None
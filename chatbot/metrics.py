@@ -0,0 +1,123 @@
+"""Prometheus metrics for the chatbot service.
+
+Under gunicorn, gunicorn.conf.py points PROMETHEUS_MULTIPROC_DIR at a
+scratch directory before any worker starts. Each worker then writes its
+samples to memory-mapped files there, and /metrics merges them, so a scrape
+sees the whole dyno rather than whichever worker answered it.
+"""
+import os
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# Rule matching takes microseconds while the AI call takes seconds, so the
+# buckets span both ends
+STAGE_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+STAGE_SECONDS = Histogram(
+    "chatbot_stage_seconds", "Time spent in each stage of answering a chat message",
+    ["stage"], buckets=STAGE_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "chatbot_request_seconds", "End-to-end request latency by endpoint",
+    ["endpoint"], buckets=STAGE_BUCKETS,
+)
+IN_FLIGHT = Gauge(
+    "chatbot_requests_in_flight", "Chat requests currently being served",
+    ["endpoint"], multiprocess_mode="livesum",
+)
+INTENTS = Counter("chatbot_intents_total", "Rule-based answers by matched intent", ["intent"])
+AI_CALLS = Counter(
+    "chatbot_ai_calls_total",
+    "AI calls by outcome: success or failure once a call completes, budget_exceeded when a "
+    "request stopped waiting for it, rejected when the circuit breaker was open, shed when "
+    "admission control kept the request off the AI path, error when a stream broke off mid-answer, "
+    "cancelled when a streaming client went away",
+    ["outcome"],
+)
+AI_COALESCED = Counter(
+    "chatbot_ai_coalesced_total", "AI calls that joined an identical call already in flight instead of going upstream"
+)
+AI_BATCH_SIZE = Histogram(
+    "chatbot_ai_batch_size", "Prompts per upstream inference request when micro-batching is on",
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+ADMISSION = Counter(
+    "chatbot_admission_total",
+    "Chat messages by admission decision: admitted, degraded (answered without the AI), "
+    "rate_limited (429) or overloaded (503)",
+    ["decision"],
+)
+STREAM_FIRST_BYTE = Histogram(
+    "chatbot_stream_first_byte_seconds",
+    "Time from a /chat/stream request to its first event (first AI token, or the whole local answer), "
+    "to compare with chatbot_request_seconds{endpoint=\"chat\"}",
+    ["source"], buckets=STAGE_BUCKETS,
+)
+RESPONSES = Counter("chatbot_responses_total", "Chat answers by where they came from", ["source"])
+LANGUAGES = Counter("chatbot_messages_total", "Chat messages by requested language", ["language"])
+STARTUP_SECONDS = Gauge(
+    "chatbot_startup_seconds",
+    "Per worker: import (in the process that imported the app, the master when preloaded), warmup, "
+    "ready and first_response, the last two counted from the import or, for a preloaded worker, its fork",
+    ["phase"], multiprocess_mode="liveall",
+)
+
+# Pre-bound children keep the hot path to a single observe/inc call
+AI_STAGE = STAGE_SECONDS.labels("ai_call")
+RULE_STAGE = STAGE_SECONDS.labels("rule_match")
+RETRIEVAL_STAGE = STAGE_SECONDS.labels("retrieval")
+DB_STAGE = STAGE_SECONDS.labels("db_query")
+SERIALIZATION_STAGE = STAGE_SECONDS.labels("serialization")
+
+KNOWN_LANGUAGES = ("en", "ur")
+RESPONSE_SOURCES = ("ai", "cache", "retrieval", "rules")
+AI_OUTCOMES = ("success", "failure", "error", "budget_exceeded", "rejected", "shed", "cancelled")
+ADMISSION_DECISIONS = ("admitted", "degraded", "rate_limited", "overloaded")
+ENDPOINTS = ("chat", "chat_stream", "chat_batch", "tickets_status")
+
+
+def count_language(language):
+    """Count a message by language, folding unknown values to keep labels bounded"""
+    LANGUAGES.labels(language if language in KNOWN_LANGUAGES else "other").inc()
+
+
+def warm(intents=()):
+    """Create this process's series for every known label value, at 0.
+
+    Under gunicorn this also opens the worker's sample files, which would
+    otherwise happen inside its first request.
+    """
+    for language in KNOWN_LANGUAGES + ("other",):
+        LANGUAGES.labels(language)
+    for source in RESPONSE_SOURCES:
+        RESPONSES.labels(source)
+        STREAM_FIRST_BYTE.labels(source)
+    for outcome in AI_OUTCOMES:
+        AI_CALLS.labels(outcome)
+    for decision in ADMISSION_DECISIONS:
+        ADMISSION.labels(decision)
+    for endpoint in ENDPOINTS:
+        REQUEST_SECONDS.labels(endpoint)
+    for endpoint in ("chat", "chat_batch"):
+        IN_FLIGHT.labels(endpoint)
+    for intent in intents:
+        INTENTS.labels(intent)
+
+
+def render_metrics():
+    """Return ``(body, content_type)`` for a /metrics scrape"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
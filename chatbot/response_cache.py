@@ -0,0 +1,182 @@
+"""Bounded LRU + TTL cache for AI chatbot responses"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_message(message):
+    """Fold case and whitespace so trivially different questions share an entry"""
+    return " ".join(message.casefold().split())
+
+
+def make_cache_key(message, language, prompt_version):
+    """Cache key for a question asked in ``language`` under ``prompt_version``"""
+    raw = f"{prompt_version}\x1f{language}\x1f{normalize_message(message)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class SqliteCacheBackend:
+    """Shared cache store in a local sqlite file.
+
+    Every gunicorn worker opens the same file, so an answer fetched by one
+    worker is visible to the others. WAL mode lets readers proceed while a
+    worker writes.
+    """
+
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ai_cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL, stored_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key, now):
+        """Return ``(value, expires_at)`` for a live entry, or None"""
+        row = self._connect().execute(
+            "SELECT value, expires_at FROM ai_cache WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        return row
+
+    def set(self, key, value, expires_at, now):
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO ai_cache (key, value, expires_at, stored_at) VALUES (?, ?, ?, ?)",
+            (key, value, expires_at, now),
+        )
+        # Trim expired and oldest rows now and then rather than on every write
+        self._writes += 1
+        if self._writes % 100 == 0:
+            conn.execute("DELETE FROM ai_cache WHERE expires_at <= ?", (now,))
+            conn.execute(
+                "DELETE FROM ai_cache WHERE key IN ("
+                " SELECT key FROM ai_cache ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def clear(self):
+        self._connect().execute("DELETE FROM ai_cache")
+
+
+class ResponseCache:
+    """In-process LRU cache with a per-entry TTL and a total byte cap.
+
+    An optional shared ``backend`` is consulted on local misses and written
+    through on every ``set``, so workers fill each other's caches.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=4 * 1024 * 1024, ttl=3600, backend=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.backend = backend
+        self._entries = OrderedDict()  # key -> (value, expires_at, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.backend_errors = 0
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def _store(self, key, value, expires_at):
+        size = len(key) + len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, expires_at, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def get(self, key):
+        """Return the cached value for ``key``, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                self._remove(key)
+                self.expirations += 1
+
+        if self.backend is not None:
+            try:
+                row = self.backend.get(key, now)
+            except Exception:
+                row = None
+                with self._lock:
+                    self.backend_errors += 1
+            if row is not None:
+                self._store(key, row[0], row[1])
+                with self._lock:
+                    self.shared_hits += 1
+                return row[0]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, value):
+        """Cache ``value`` under ``key`` for ``ttl`` seconds"""
+        now = time.time()
+        expires_at = now + self.ttl
+        self._store(key, value, expires_at)
+        if self.backend is not None:
+            try:
+                self.backend.set(key, value, expires_at, now)
+            except Exception:
+                with self._lock:
+                    self.backend_errors += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self):
+        """Snapshot of cache counters"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "shared": self.backend is not None,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "backend_errors": self.backend_errors,
+            }
@@ -0,0 +1,117 @@
+"""BM25 retrieval over the chatbot's local knowledge, answering without the AI"""
+import re
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"\w+")
+
+STOPWORDS = frozenset(
+    "a an and are at be can do does for from get how i in is it me my of on or please the to "
+    "what when where which who will with you your"
+    .split()
+) | frozenset("کے کی کا ہے میں اور کیا سے کو پر ہیں یا بھی ہو".split())
+
+
+def tokenize(text):
+    """Casefold, split into words, drop stopwords and trailing English plural 's'"""
+    tokens = []
+    for token in _TOKEN_RE.findall(text.casefold()):
+        if token in STOPWORDS:
+            continue
+        if token.isascii() and len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class Bm25Index:
+    """Inverted index scored with Okapi BM25.
+
+    Each posting list stores the documents containing a term together with
+    that term's precomputed BM25 weight in each of them, so scoring a query
+    is one vectorised scatter-add per query term.
+    """
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.doc_ids = [doc_id for doc_id, _ in documents]
+        tokenized = [tokenize(text) for _, text in documents]
+        n_docs = len(tokenized)
+        lengths = np.array([len(tokens) for tokens in tokenized], dtype=np.float32)
+        avg_length = float(lengths.mean()) if n_docs and lengths.mean() > 0 else 1.0
+
+        term_counts = {}
+        for doc_index, tokens in enumerate(tokenized):
+            for token in tokens:
+                counts = term_counts.setdefault(token, {})
+                counts[doc_index] = counts.get(doc_index, 0) + 1
+
+        self.postings = {}
+        self.idf = {}
+        for term, counts in term_counts.items():
+            docs = np.fromiter(counts.keys(), dtype=np.int32, count=len(counts))
+            tf = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+            idf = float(np.log(1 + (n_docs - len(counts) + 0.5) / (len(counts) + 0.5)))
+            norm = k1 * (1 - b + b * lengths[docs] / avg_length)
+            self.postings[term] = (docs, idf * tf * (k1 + 1) / (tf + norm))
+            self.idf[term] = idf
+        self.n_docs = n_docs
+        # Best weight a single term can reach, used to normalise scores
+        self.max_idf = max(self.idf.values(), default=0.0)
+
+    def search(self, query, top_k=2):
+        """Return ``([(doc_id, score), ...], confidence)`` for the best matches.
+
+        ``confidence`` is the IDF-weighted share of the query's words that
+        the best document contains, with unknown words counted at the
+        highest IDF, so a question that is mostly off-topic scores low even
+        if one word hits.
+        """
+        terms = set(tokenize(query))
+        if not terms or not self.n_docs:
+            return [], 0.0
+
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        matched = []
+        total_idf = 0.0
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is None:
+                total_idf += self.max_idf
+                continue
+            docs, weights = posting
+            scores[docs] += weights
+            matched.append((docs, self.idf[term]))
+            total_idf += self.idf[term]
+
+        top = np.argsort(scores)[::-1][:top_k]
+        results = [(self.doc_ids[i], float(scores[i])) for i in top if scores[i] > 0]
+        if not results:
+            return [], 0.0
+        best = top[0]
+        covered = sum(idf for docs, idf in matched if best in docs)
+        return results, covered / total_idf
+
+
+class KnowledgeRetriever:
+    """Answers questions from indexed documents when the match is confident"""
+
+    def __init__(self, documents, answers, min_confidence=0.55, min_margin=0.1):
+        # documents: [(doc_id, text)], answers: {doc_id: {"en": ..., "ur": ...}}
+        self.index = Bm25Index(documents)
+        self.answers = answers
+        self.min_confidence = min_confidence
+        self.min_margin = min_margin
+
+    def __len__(self):
+        return self.index.n_docs
+
+    def answer(self, message, language="en"):
+        """Return the best local answer, or None if retrieval isn't confident"""
+        results, confidence = self.index.search(message)
+        if not results or confidence < self.min_confidence:
+            return None
+        # Two near-identical scores mean the question is ambiguous
+        if len(results) > 1 and (results[0][1] - results[1][1]) / results[0][1] < self.min_margin:
+            return None
+        answer = self.answers[results[0][0]]
+        return answer.get(language) or answer.get("en")
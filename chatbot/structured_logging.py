@@ -0,0 +1,162 @@
+"""Queue-backed structured (JSON lines) logging for the chatbot service.
+
+Request threads only put records on an in-memory queue; a background
+listener thread formats them and writes to stdout. When the queue is full
+records are dropped and counted rather than blocking the request. Every
+record carries the current request ID so the rule, AI and DB events of one
+request can be tied together.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import uuid
+
+request_id_var = contextvars.ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+
+def new_request_id(incoming=None):
+    """Use the caller's X-Request-ID if it looks sane, otherwise mint one"""
+    if incoming and len(incoming) <= 64 and incoming.isprintable():
+        return incoming
+    return uuid.uuid4().hex[:16]
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with ``extra`` fields inlined"""
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.request_id:
+            entry["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class ContextFilter(logging.Filter):
+    """Stamp the request ID on each record and sample DEBUG records.
+
+    High-volume debug events are kept with probability ``debug_sample_rate``;
+    INFO and above are never sampled away.
+    """
+
+    def __init__(self, debug_sample_rate=1.0):
+        super().__init__()
+        self.debug_sample_rate = debug_sample_rate
+
+    def filter(self, record):
+        if record.levelno <= logging.DEBUG and self.debug_sample_rate < 1.0:
+            if random.random() >= self.debug_sample_rate:
+                return False
+        record.request_id = request_id_var.get()
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops instead of blocking and survives forking.
+
+    A gunicorn worker forked from a preloaded master does not inherit the
+    master's listener thread, so the first record logged in a new process
+    starts a fresh queue and listener there.
+    """
+
+    def __init__(self, target, maxsize=10000):
+        self.target = target
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._pid = None
+        self._listener = None
+        self._lock = threading.Lock()
+        super().__init__(queue.Queue(maxsize))
+        self._ensure_listener()
+
+    def _ensure_listener(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self.queue = queue.Queue(self.maxsize)
+            self._listener = logging.handlers.QueueListener(self.queue, self.target, respect_handler_level=True)
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def prepare(self, record):
+        # Only resolve the message here; JSON formatting happens on the listener thread
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def emit(self, record):
+        self._ensure_listener()
+        super().emit(record)
+
+    def stop(self):
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+
+    def stats(self):
+        return {"queued": self.queue.qsize(), "dropped": self.dropped}
+
+
+def setup_logging(name="chatbot"):
+    """Configure the service logger from LOG_* environment variables"""
+    logger = logging.getLogger(name)
+    if any(isinstance(h, NonBlockingQueueHandler) for h in logger.handlers):
+        return logger
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter())
+    handler = NonBlockingQueueHandler(stream, maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+    handler.addFilter(ContextFilter(float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))))
+
+    logger.addHandler(handler)
+    atexit.register(handler.stop)
+    logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    logger.propagate = False
+    return logger
+
+
+REDACT_MESSAGES = os.getenv("LOG_REDACT_MESSAGES", "true").lower() not in ("0", "false", "no")
+
+
+def redact(text):
+    """User text as it may appear in logs - only its length unless redaction is off"""
+    if text is None or not REDACT_MESSAGES:
+        return text
+    return f"<redacted {len(text)} chars>"
+
+
+def queue_stats(logger):
+    """Drop/queue counters of the logger's queue handler"""
+    for handler in logger.handlers:
+        if isinstance(handler, NonBlockingQueueHandler):
+            return handler.stats()
+    return None
@@ -0,0 +1,147 @@
+"""Tests for admission.py and /chat admission: who a message is rate-limited as
+
+    python -m pytest test_admission.py
+"""
+import os
+
+import pytest
+
+os.environ.setdefault("RETRIEVAL_SERVICES", "false")
+
+import admission  # noqa: E402
+import app  # noqa: E402
+from admission import ADMIT, DEGRADE, REJECT, LoadShedder, TokenBucketLimiter, queued_seconds  # noqa: E402
+
+TOKEN = "test-service-token"
+NEXT_SERVER = "54.1.1.1"  # appended by the chatbot's router
+ROUTER = "10.0.0.2"       # the router's own address, as the chatbot sees it
+
+
+class Clock:
+    """Stands in for the ``time`` module, moved by hand"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def monotonic(self):
+        return self.now
+
+
+def proxied(browser, sent_by_browser=None):
+    """X-Forwarded-For of a call the Next.js server made on behalf of ``browser``"""
+    return ", ".join(filter(None, [sent_by_browser, browser, NEXT_SERVER]))
+
+
+@pytest.fixture
+def chatbot(monkeypatch):
+    """app.py with the default proxy hops, a fresh limiter and no service token"""
+    monkeypatch.setattr(app, "TRUSTED_PROXY_HOPS", 2)
+    monkeypatch.setattr(app, "CHATBOT_SERVICE_TOKEN", "")
+    monkeypatch.setattr(app, "rate_limiter", TokenBucketLimiter(rate=0.001, burst=2))
+    monkeypatch.setattr(app, "load_shedder", LoadShedder())
+    return app
+
+
+def test_proxied_browsers_get_their_own_keys(chatbot):
+    first = chatbot.rate_limit_key({}, ROUTER, proxied("1.2.3.4"))
+    second = chatbot.rate_limit_key({}, ROUTER, proxied("5.6.7.8"))
+    assert (first, second) == ("ip:1.2.3.4", "ip:5.6.7.8")
+
+
+def test_proxied_browser_cannot_pick_its_key(chatbot):
+    assert chatbot.rate_limit_key({}, ROUTER, proxied("1.2.3.4", "9.9.9.9")) == "ip:1.2.3.4"
+
+
+def test_authenticated_calls_key_by_user_or_browser(chatbot, monkeypatch):
+    monkeypatch.setattr(chatbot, "CHATBOT_SERVICE_TOKEN", TOKEN)
+    assert chatbot.rate_limit_key({"userId": 7}, ROUTER, proxied("1.2.3.4"), authenticated=True) == "user:7"
+    assert chatbot.rate_limit_key({}, ROUTER, proxied("1.2.3.4", "9.9.9.9"), authenticated=True) == "ip:1.2.3.4"
+
+
+def test_direct_calls_trust_one_hop_less_once_the_token_is_set(chatbot, monkeypatch):
+    monkeypatch.setattr(chatbot, "CHATBOT_SERVICE_TOKEN", TOKEN)
+    # Straight from a browser through our router only: the first hop is the browser's own claim
+    assert chatbot.rate_limit_key({"userId": 7}, ROUTER, "9.9.9.9, 1.2.3.4") == "ip:1.2.3.4"
+
+
+def test_without_forwarded_for_the_socket_address_is_used(chatbot, monkeypatch):
+    assert chatbot.rate_limit_key({}, "127.0.0.1", None) == "ip:127.0.0.1"
+    monkeypatch.setattr(chatbot, "TRUSTED_PROXY_HOPS", 0)
+    assert chatbot.rate_limit_key({}, "127.0.0.1", proxied("1.2.3.4")) == "ip:127.0.0.1"
+
+
+def test_proxied_chat_limits_each_browser_separately(chatbot):
+    client = chatbot.app.test_client()
+
+    def ask(browser, sent_by_browser=None):
+        return client.post("/chat", json={"message": "hello"}, environ_base={"REMOTE_ADDR": ROUTER},
+                           headers={"X-Forwarded-For": proxied(browser, sent_by_browser)}).status_code
+
+    # Two messages each fit the burst, however many browsers share the Next.js server
+    assert [ask(f"1.2.3.{n}") for n in range(5) for _ in range(2)] == [200] * 10
+    assert ask("1.2.3.0") == 429
+    # A made-up first hop doesn't buy a fresh bucket
+    assert ask("1.2.3.1", "8.8.8.8") == 429
+    assert chatbot.load_shedder.in_flight == 0
+
+
+def test_bucket_refills_at_its_rate_up_to_the_burst(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(admission, "time", clock)
+    limiter = TokenBucketLimiter(rate=2, burst=3)
+    assert [limiter.acquire("a") for _ in range(3)] == [0, 0, 0]
+    assert limiter.acquire("a") == pytest.approx(0.5)
+    clock.now += 0.5
+    assert limiter.acquire("a") == 0
+    # A long pause refills to the burst, not beyond it
+    clock.now += 60
+    assert limiter.acquire("a", cost=3) == 0
+    assert limiter.acquire("a") == pytest.approx(0.5)
+    assert limiter.stats()["limited"] == 2
+
+
+def test_least_recent_keys_are_forgotten_with_a_full_bucket(monkeypatch):
+    monkeypatch.setattr(admission, "time", Clock())
+    limiter = TokenBucketLimiter(rate=1, burst=1, max_keys=2)
+    assert limiter.acquire("a") == 0
+    assert limiter.acquire("a") > 0
+    limiter.acquire("b")
+    limiter.acquire("c")
+    assert limiter.stats()["keys"] == 2
+    assert limiter.acquire("a") == 0
+
+
+def test_shedder_degrades_then_rejects_by_load_and_queue_time():
+    shedder = LoadShedder(max_in_flight=3, degrade_in_flight=1, degrade_queue=0.5, reject_queue=5.0)
+    assert shedder.admit() == ADMIT
+    assert shedder.admit() == DEGRADE
+    assert shedder.admit() == DEGRADE
+    assert shedder.admit() == REJECT
+    for _ in range(3):
+        shedder.release()
+    assert shedder.admit(queued=1.0) == DEGRADE
+    assert shedder.admit(queued=6.0) == REJECT
+    shedder.release()
+    assert shedder.in_flight == 0
+    assert shedder.stats()[REJECT] == 2
+
+
+def test_shedder_weights_are_capped_and_released_in_full():
+    shedder = LoadShedder(max_in_flight=4, degrade_in_flight=4)
+    assert shedder.admit(weight=10) == ADMIT
+    assert shedder.in_flight == 4
+    assert shedder.admit() == REJECT
+    shedder.release(10)
+    assert shedder.in_flight == 0
+
+
+@pytest.mark.parametrize("header, queued", [
+    (None, 0.0),
+    ("garbage", 0.0),
+    ("t=1699999999.5", 0.5),      # nginx seconds
+    ("1699999999500", 0.5),       # Heroku milliseconds
+    ("1699999999500000", 0.5),    # microseconds
+    ("1700000000.5", 0.0),        # a stamp from the future
+])
+def test_queued_seconds(header, queued):
+    assert queued_seconds(header, now=1700000000.0) == pytest.approx(queued)
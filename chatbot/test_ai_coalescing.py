@@ -0,0 +1,143 @@
+"""Tests for ai_coalescing.py
+
+    python -m pytest test_ai_coalescing.py
+"""
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pytest
+
+from ai_coalescing import AsyncMicroBatcher, MicroBatcher, SingleFlight
+
+
+def test_identical_calls_share_one_future_until_it_finishes():
+    flights = SingleFlight()
+    first, joined = flights.submit("key", Future)
+    assert not joined
+    assert flights.submit("key", Future) == (first, True)
+    assert flights.submit("other", Future)[0] is not first
+    first.set_result("answer")
+    second, joined = flights.submit("key", Future)
+    assert second is not first and not joined
+    assert flights.stats()["shared"] == 1
+
+
+def test_failed_call_is_forgotten_too():
+    flights = SingleFlight()
+    first, _ = flights.submit("key", Future)
+    first.set_exception(TimeoutError())
+    assert flights.submit("key", Future)[0] is not first
+
+
+def test_declined_start_is_not_remembered():
+    flights = SingleFlight()
+    assert flights.submit("key", lambda: None) == (None, False)
+    assert flights.stats() == {"in_flight": 0, "started": 0, "shared": 0}
+
+
+def test_single_flight_shares_asyncio_tasks():
+    async def run():
+        flights = SingleFlight()
+        release = asyncio.Event()
+
+        async def call():
+            await release.wait()
+            return "answer"
+
+        flights.submit("key", lambda: asyncio.ensure_future(call()))
+        second, joined = flights.submit("key", lambda: asyncio.ensure_future(call()))
+        release.set()
+        assert joined and await second == "answer"
+        await asyncio.sleep(0)
+        return flights.stats()["in_flight"]
+
+    assert asyncio.run(run()) == 0
+
+
+def run_concurrently(batcher, items):
+    with ThreadPoolExecutor(len(items)) as pool:
+        return list(pool.map(batcher.call, items))
+
+
+def test_concurrent_calls_go_out_as_one_batch():
+    sent = []
+
+    def send_batch(items):
+        sent.append(list(items))
+        return [item.upper() for item in items]
+
+    batcher = MicroBatcher(send_batch, max_batch_size=4, max_wait=1.0)
+    assert run_concurrently(batcher, ["a", "b", "c", "d"]) == ["A", "B", "C", "D"]
+    # A full batch goes out without waiting for max_wait
+    assert [sorted(batch) for batch in sent] == [["a", "b", "c", "d"]]
+
+
+def test_lone_call_goes_out_after_max_wait():
+    batcher = MicroBatcher(lambda items: ["x"] * len(items), max_batch_size=8, max_wait=0.01)
+    assert batcher.call("a") == "x"
+    assert batcher.stats() == {"batches": 1, "items": 1, "avg_batch_size": 1.0}
+
+
+def test_failed_batch_answers_none_and_the_next_batch_starts_fresh():
+    calls = []
+    started = threading.Barrier(2)
+
+    def send_batch(items):
+        calls.append(items)
+        if len(calls) == 1:
+            raise OSError("upstream down")
+        return ["ok"] * len(items)
+
+    batcher = MicroBatcher(send_batch, max_batch_size=2, max_wait=1.0)
+
+    def call(item):
+        started.wait()
+        try:
+            return batcher.call(item)
+        except OSError:
+            return "raised"
+
+    with ThreadPoolExecutor(2) as pool:
+        results = sorted(pool.map(call, ["a", "b"]), key=str)
+    # The leader sees the error, the caller that joined it gets None
+    assert results == [None, "raised"]
+    assert batcher.call("c") == "ok"
+
+
+def test_short_result_list_answers_none_for_the_rest():
+    batcher = MicroBatcher(lambda items: ["only one"], max_batch_size=2, max_wait=1.0)
+    assert sorted(run_concurrently(batcher, ["a", "b"]), key=str) == [None, "only one"]
+
+
+def test_async_batcher_batches_and_survives_errors():
+    async def run():
+        sent = []
+
+        async def send_batch(items):
+            sent.append(items)
+            if "boom" in items:
+                raise OSError("upstream down")
+            return [item.upper() for item in items]
+
+        batcher = AsyncMicroBatcher(send_batch, max_batch_size=3, max_wait=0.01)
+        answers = await asyncio.gather(*(batcher.call(item) for item in ["a", "b", "c", "d"]))
+        failed = await asyncio.gather(batcher.call("e"), batcher.call("boom"))
+        return sent, answers, failed
+
+    sent, answers, failed = asyncio.run(run())
+    assert answers == ["A", "B", "C", "D"]
+    # Three fill a batch at once, the fourth goes out after max_wait
+    assert sent[:2] == [["a", "b", "c"], ["d"]]
+    assert failed == [None, None]
+
+
+@pytest.mark.parametrize("results", [None, []])
+def test_async_batcher_answers_none_for_empty_results(results):
+    async def run():
+        async def send_batch(items):
+            return results
+
+        return await AsyncMicroBatcher(send_batch).call("a")
+
+    assert asyncio.run(run()) is None
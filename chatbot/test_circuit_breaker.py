@@ -0,0 +1,87 @@
+"""Tests for circuit_breaker.py
+
+    python -m pytest test_circuit_breaker.py
+"""
+import time
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+def open_breaker(**kwargs):
+    breaker = CircuitBreaker(failure_threshold=1, slow_call_seconds=5.0, **kwargs)
+    permit = breaker.allow_request()
+    assert permit
+    breaker.record(False, 0.0, permit)
+    assert breaker.state == OPEN
+    return breaker
+
+
+def test_probes_close_the_breaker():
+    breaker = open_breaker(reset_timeout=0.01, half_open_calls=2)
+    time.sleep(0.02)
+    first, second = breaker.allow_request(), breaker.allow_request()
+    assert first and second
+    assert not breaker.allow_request()
+    breaker.record(True, 0.0, first)
+    assert breaker.state == HALF_OPEN
+    breaker.record(True, 0.0, second)
+    assert breaker.state == CLOSED
+
+
+def test_failed_probe_reopens():
+    breaker = open_breaker(reset_timeout=0.01)
+    time.sleep(0.02)
+    probe = breaker.allow_request()
+    assert probe
+    breaker.record(False, 0.0, probe)
+    assert breaker.state == OPEN
+
+
+def test_lost_probe_reopens_after_probe_timeout():
+    breaker = open_breaker(reset_timeout=0.05, half_open_calls=2, probe_timeout=0.05)
+    time.sleep(0.06)
+    first, lost = breaker.allow_request(), breaker.allow_request()
+    assert first and lost
+    # Only one probe reports back; the other is never recorded
+    breaker.record(True, 0.0, first)
+    assert not breaker.allow_request()
+    assert breaker.state == HALF_OPEN
+
+    time.sleep(0.06)
+    assert not breaker.allow_request()
+    assert breaker.state == OPEN
+    assert "unfinished" in breaker.stats()["transitions"][-1]["reason"]
+
+    # A new probe window opens after the reset timeout and can close the breaker
+    time.sleep(0.06)
+    first, second = breaker.allow_request(), breaker.allow_request()
+    assert first and second
+    breaker.record(True, 0.0, first)
+    # The lost probe of the previous window reporting now doesn't count
+    breaker.record(True, 0.0, lost)
+    assert breaker.state == HALF_OPEN
+    breaker.record(True, 0.0, second)
+    assert breaker.state == CLOSED
+
+
+def test_late_success_from_the_closed_generation_does_not_close():
+    breaker = CircuitBreaker(failure_threshold=1, slow_call_seconds=5.0, reset_timeout=0.01)
+    late = breaker.allow_request()
+    failing = breaker.allow_request()
+    breaker.record(False, 0.0, failing)
+    assert breaker.state == OPEN
+    time.sleep(0.02)
+    probe = breaker.allow_request()
+    assert probe
+    # The call admitted while closed finishes during the probe: it neither closes nor re-opens
+    breaker.record(True, 0.0, late)
+    assert breaker.state == HALF_OPEN
+    breaker.record(False, 0.0, late)
+    assert breaker.state == HALF_OPEN
+    breaker.record(True, 0.0, probe)
+    assert breaker.state == CLOSED
+
+
+def test_probe_timeout_defaults_to_reset_or_slow_call_time():
+    assert CircuitBreaker(slow_call_seconds=5.0, reset_timeout=30.0).probe_timeout == 30.0
+    assert CircuitBreaker(slow_call_seconds=5.0, reset_timeout=0.1).probe_timeout == 5.0
@@ -0,0 +1,132 @@
+"""Tests for context_store.py
+
+    python -m pytest test_context_store.py
+"""
+import os
+
+import pytest
+
+import context_store
+import ticket_cache
+from context_store import UserContextStore
+from ticket_cache import SqliteInvalidationLog
+
+SNAPSHOT = [
+    {"id": 3, "service": "Passport", "status": "IN_PROGRESS", "agent": "Sara Khan"},
+    {"id": 2, "service": "CNIC Renewal", "status": "OPEN"},
+    {"id": 1, "service": "Birth Certificate", "status": "COMPLETED", "payment": "PAID"},
+]
+
+
+class Clock:
+    """Stands in for the ``time`` module, moved by hand"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(context_store, "time", clock)
+    return clock
+
+
+def ticket_ids(store, user_id):
+    return [ticket.id for ticket in store.get(user_id).tickets]
+
+
+def test_snapshot_round_trips_and_keeps_the_latest_tickets(clock):
+    store = UserContextStore(max_tickets=2)
+    store.put("7", SNAPSHOT)
+    context = store.get(7)
+    assert [ticket.id for ticket in context.tickets] == [3, 2]
+    assert context.in_progress[0].agent == "Sara Khan"
+    assert context.unassigned[0].id == 2
+
+
+def test_user_ids_must_be_integers():
+    with pytest.raises(ValueError):
+        UserContextStore().put("abc", SNAPSHOT)
+
+
+def test_delta_updates_adds_and_removes_tickets(clock):
+    store = UserContextStore(max_tickets=3)
+    store.put(7, SNAPSHOT)
+    assert store.apply_delta(7, updates=[
+        {"id": 2, "status": "IN_PROGRESS", "agent": "Ali Raza"},
+        {"id": 4, "service": "Passport", "status": "OPEN"},
+        # Not stored and not a full ticket: older than the snapshot, ignored
+        {"id": 0, "status": "CLOSED"},
+    ], removed=[3])
+    context = store.get(7)
+    assert [ticket.id for ticket in context.tickets] == [4, 2, 1]
+    assert (context.tickets[1].status, context.tickets[1].agent) == ("IN_PROGRESS", "Ali Raza")
+
+
+def test_new_ticket_pushes_the_oldest_out(clock):
+    store = UserContextStore(max_tickets=3)
+    store.put(7, SNAPSHOT)
+    store.apply_delta(7, updates=[{"id": 4, "service": "Passport", "status": "OPEN"}])
+    assert ticket_ids(store, 7) == [4, 3, 2]
+
+
+def test_delta_without_a_snapshot_is_not_applied(clock):
+    store = UserContextStore()
+    assert not store.apply_delta(7, updates=[{"id": 4, "service": "Passport", "status": "OPEN"}])
+    assert store.get(7) is None
+
+
+def test_entries_expire_and_deltas_extend_them(clock):
+    store = UserContextStore(ttl=60)
+    store.put(7, SNAPSHOT)
+    clock.now += 50
+    assert store.apply_delta(7, updates=[{"id": 3, "status": "COMPLETED"}])
+    clock.now += 50
+    assert store.get(7) is not None
+    clock.now += 60
+    assert store.get(7) is None
+    # An expired entry is dropped, not revived by a delta
+    store.put(8, SNAPSHOT)
+    clock.now += 60
+    assert not store.apply_delta(8, updates=[{"id": 3, "status": "COMPLETED"}])
+    assert store.stats()["users"] == 0
+
+
+def test_least_recently_used_users_are_evicted(clock):
+    store = UserContextStore(max_users=2)
+    store.put(1, SNAPSHOT)
+    store.put(2, SNAPSHOT)
+    store.get(1)
+    store.put(3, SNAPSHOT)
+    assert store.get(2) is None
+    assert store.get(1) is not None and store.get(3) is not None
+    assert store.stats()["evictions"] == 1
+
+
+def test_delete(clock):
+    store = UserContextStore()
+    store.put(7, SNAPSHOT)
+    store.delete(7)
+    assert store.get(7) is None
+
+
+def test_other_workers_deltas_drop_the_user(tmp_path, monkeypatch):
+    log = SqliteInvalidationLog(str(tmp_path / "invalidations.db"))
+    store = UserContextStore(invalidation_log=log, poll_interval=0)
+    store.put(7, SNAPSHOT)
+    store.put(8, SNAPSHOT)
+    # This worker's own delta stays applied locally
+    store.apply_delta(7, updates=[{"id": 3, "status": "COMPLETED"}])
+    assert store.get(7).tickets[0].status == "COMPLETED"
+
+    other = os.getpid() + 1
+    with monkeypatch.context() as patched:
+        patched.setattr(ticket_cache.os, "getpid", lambda: other)
+        log.append((), [8])
+    assert store.get(8) is None
+    assert store.get(7) is not None
+    assert store.stats()["invalidations"] == 1
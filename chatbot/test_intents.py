@@ -0,0 +1,56 @@
+"""Fuzz IntentMatcher against the plain ``any(keyword in text)`` scan it replaced
+
+    python -m pytest test_intents.py
+"""
+import os
+import random
+
+from intents import IntentMatcher
+
+# Few distinct characters, so keywords often overlap, nest and share prefixes
+ALPHABET = "ab c.*?(\\" + "کا"
+SEEDS = range(200)
+
+
+def baseline(intents, text):
+    """The original per-intent substring scan"""
+    return {name for name, keywords in intents if any(keyword in text for keyword in keywords)}
+
+
+def random_word(rng, low, high):
+    return "".join(rng.choice(ALPHABET) for _ in range(rng.randint(low, high)))
+
+
+def random_intents(rng):
+    return [(f"intent_{i}", [random_word(rng, 1, 5) for _ in range(rng.randint(1, 6))])
+            for i in range(rng.randint(1, 12))]
+
+
+def test_matches_baseline_on_random_keywords():
+    for seed in SEEDS:
+        rng = random.Random(seed)
+        intents = random_intents(rng)
+        matcher = IntentMatcher(intents)
+        for _ in range(50):
+            text = random_word(rng, 0, 40)
+            assert matcher.match(text) == baseline(intents, text), (seed, intents, text)
+
+
+def test_matches_baseline_when_keywords_are_substrings_of_each_other():
+    intents = [("short", ["a"]), ("longer", ["ab"]), ("longest", ["abc"]), ("inner", ["bc", "c"])]
+    matcher = IntentMatcher(intents)
+    for text in ["", "a", "ab", "abc", "xbcx", "cab", "abab", "zzz"]:
+        assert matcher.match(text) == baseline(intents, text), text
+
+
+def test_matches_baseline_on_app_keywords():
+    os.environ.setdefault("RETRIEVAL_SERVICES", "false")
+    import app
+
+    keywords = sorted({keyword for _, words in app.ALL_INTENTS for keyword in words})
+    rng = random.Random(0)
+    for _ in range(500):
+        # Keyword fragments glued together with noise, as a user might type them
+        text = " ".join(rng.choice(keywords)[rng.randint(0, 2):] if rng.random() < 0.7 else random_word(rng, 1, 6)
+                        for _ in range(rng.randint(0, 8)))
+        assert app.INTENT_MATCHER.match(text) == baseline(app.ALL_INTENTS, text), text
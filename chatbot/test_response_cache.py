@@ -0,0 +1,117 @@
+"""Tests for response_cache.py
+
+    python -m pytest test_response_cache.py
+"""
+import pytest
+
+import response_cache
+from response_cache import ResponseCache, SqliteCacheBackend, make_cache_key
+
+
+class Clock:
+    """Stands in for the ``time`` module, moved by hand"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+class BrokenBackend:
+    def get(self, key, now):
+        raise OSError("disk I/O error")
+
+    def set(self, key, value, expires_at, now):
+        raise OSError("disk I/O error")
+
+    def clear(self):
+        pass
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(response_cache, "time", clock)
+    return clock
+
+
+def test_keys_ignore_case_and_spacing_but_not_language_or_prompt():
+    key = make_cache_key("How do I get a  CNIC?", "en", 1)
+    assert key == make_cache_key(" how do i get a cnic? ", "en", 1)
+    assert key != make_cache_key("How do I get a CNIC?", "ur", 1)
+    assert key != make_cache_key("How do I get a CNIC?", "en", 2)
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = ResponseCache(max_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+    cache.set("c", "3")
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == ("1", None, "3")
+    assert cache.stats()["evictions"] == 1
+
+
+def test_byte_cap_evicts_and_skips_oversized_values(clock):
+    cache = ResponseCache(max_entries=10, max_bytes=10)
+    cache.set("a", "1234")
+    cache.set("b", "1234")
+    assert cache.stats()["bytes"] == 10
+    cache.set("c", "1234")
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 10
+    # Larger than the whole cache: not stored, and nothing else is pushed out for it
+    cache.set("d", "x" * 20)
+    assert cache.get("d") is None
+    assert (cache.get("b"), cache.get("c")) == ("1234", "1234")
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = ResponseCache(ttl=60)
+    cache.set("a", "1")
+    clock.now += 59
+    assert cache.get("a") == "1"
+    clock.now += 1
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert (stats["entries"], stats["bytes"], stats["expirations"]) == (0, 0, 1)
+
+
+def test_shared_backend_fills_other_workers(tmp_path, clock):
+    path = str(tmp_path / "cache.db")
+    first = ResponseCache(backend=SqliteCacheBackend(path))
+    second = ResponseCache(backend=SqliteCacheBackend(path))
+    first.set("a", "1")
+    assert second.get("a") == "1"
+    assert second.stats()["shared_hits"] == 1
+    # Now held locally as well
+    assert second.get("a") == "1"
+    assert second.stats()["hits"] == 1
+
+
+def test_shared_entries_expire_too(tmp_path, clock):
+    path = str(tmp_path / "cache.db")
+    first = ResponseCache(ttl=60, backend=SqliteCacheBackend(path))
+    second = ResponseCache(ttl=60, backend=SqliteCacheBackend(path))
+    first.set("a", "1")
+    clock.now += 60
+    assert second.get("a") is None
+
+
+def test_backend_errors_fall_back_to_the_local_cache(clock):
+    cache = ResponseCache(backend=BrokenBackend())
+    cache.set("a", "1")
+    assert cache.get("a") == "1"
+    assert cache.get("b") is None
+    assert cache.stats()["backend_errors"] == 2
+
+
+def test_backend_trims_expired_and_oldest_rows(tmp_path):
+    backend = SqliteCacheBackend(str(tmp_path / "cache.db"), max_entries=50)
+    for n in range(99):
+        backend.set(f"old{n}", "x", expires_at=10.0, now=float(n))
+    backend.set("fresh", "x", expires_at=1000.0, now=100.0)
+    count, = backend._connect().execute("SELECT COUNT(*) FROM ai_cache").fetchone()
+    assert count == 1
+    assert backend.get("fresh", 100.0) == ("x", 1000.0)
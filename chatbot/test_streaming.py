@@ -0,0 +1,134 @@
+"""Tests for /chat/stream in app.py and async_app.py
+
+    python -m pytest test_streaming.py
+"""
+import asyncio
+import json
+import os
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+os.environ.setdefault("RETRIEVAL_SERVICES", "false")
+
+import app  # noqa: E402
+import async_app  # noqa: E402
+from admission import LoadShedder  # noqa: E402
+from circuit_breaker import CLOSED, CircuitBreaker  # noqa: E402
+from response_cache import ResponseCache  # noqa: E402
+
+QUESTION = "can my cousin collect the parcel on my behalf?"
+
+
+class FakeStream:
+    """Streams ``pieces``, then raises ``error`` if one is given"""
+
+    def __init__(self, pieces, error=None):
+        self.pieces = pieces
+        self.error = error
+
+    def stream(self, payload, read_timeout=None):
+        yield from self.pieces
+        if self.error is not None:
+            raise self.error
+
+
+class AsyncFakeStream(FakeStream):
+    async def stream(self, payload, read_timeout=None):
+        for piece in self.pieces:
+            yield piece
+        if self.error is not None:
+            raise self.error
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def chatbot(monkeypatch):
+    """app.py with AI enabled and a fresh cache, breaker and admission state"""
+    monkeypatch.setattr(app, "AI_ENABLED", True)
+    monkeypatch.setattr(app, "ai_cache", ResponseCache())
+    monkeypatch.setattr(app, "ai_breaker", CircuitBreaker(failure_threshold=1))
+    monkeypatch.setattr(app, "rate_limiter", None)
+    monkeypatch.setattr(app, "load_shedder", LoadShedder(max_in_flight=8, degrade_in_flight=8))
+    monkeypatch.setattr(app, "start_warm_up", lambda *args, **kwargs: None)
+    return app
+
+
+def events(body):
+    """``[(event, data)]`` parsed from a text/event-stream body"""
+    parsed = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        parsed.append((fields["event"], json.loads(fields["data"])))
+    return parsed
+
+
+def cache_key(chatbot):
+    return chatbot.lookup_cached_ai_response(QUESTION)[0]
+
+
+def stream_sync(chatbot):
+    response = chatbot.app.test_client().post("/chat/stream", json={"message": QUESTION, "language": "en"})
+    assert response.status_code == 200
+    return events(response.get_data(as_text=True))
+
+
+def test_complete_stream_is_cached(chatbot, monkeypatch):
+    monkeypatch.setattr(chatbot, "ai_client", FakeStream(["To apply ", "you need ", "a CNIC."]))
+    received = stream_sync(chatbot)
+    assert [event for event, _ in received] == ["token", "token", "token", "done"]
+    assert received[-1][1]["source"] == "ai"
+    assert received[-1][1]["response"] == "To apply you need a CNIC."
+    assert chatbot.ai_cache.get(cache_key(chatbot)) == "To apply you need a CNIC."
+    assert chatbot.ai_breaker.state == CLOSED
+
+
+def test_partial_stream_into_timeout_is_not_cached(chatbot, monkeypatch):
+    monkeypatch.setattr(chatbot, "ai_client", FakeStream(["To apply ", "you need"], TimeoutError("read timed out")))
+    received = stream_sync(chatbot)
+    done = received[-1][1]
+    assert done["source"] == "rules"
+    assert done["response"] != "To apply you need"
+    assert chatbot.ai_cache.get(cache_key(chatbot)) is None
+    # The truncated call is a failure, which opens a one-failure breaker
+    assert chatbot.ai_breaker.state != CLOSED
+    assert chatbot.load_shedder.in_flight == chatbot.ai_slots.in_flight == 0
+
+
+def test_closed_stream_counts_as_cancelled(chatbot, monkeypatch):
+    monkeypatch.setattr(chatbot, "ai_client", FakeStream(["To apply ", "you need ", "a CNIC."]))
+    permit = chatbot.ai_breaker.allow_request()
+    pieces = chatbot.stream_ai_pieces(QUESTION, "en", cache_key(chatbot), permit)
+    assert next(pieces) == "To apply "
+    pieces.close()
+    assert chatbot.ai_cache.get(cache_key(chatbot)) is None
+    assert chatbot.ai_breaker.state == CLOSED
+    assert chatbot.ai_slots.in_flight == 0
+
+
+def test_open_breaker_streams_a_local_answer_alone(chatbot, monkeypatch):
+    monkeypatch.setattr(chatbot, "ai_client", FakeStream([], AssertionError("the AI was called")))
+    permit = chatbot.ai_breaker.allow_request()
+    chatbot.ai_breaker.record(False, 0.0, permit)
+    received = stream_sync(chatbot)
+    assert [event for event, _ in received] == ["done"]
+    assert received[0][1]["source"] == "rules"
+    assert chatbot.ai_breaker.stats()["rejected"] == 1
+
+
+def test_async_partial_stream_into_timeout_is_not_cached(chatbot, monkeypatch):
+    monkeypatch.setattr(chatbot, "create_ai_client",
+                        lambda asynchronous=False: AsyncFakeStream(["To apply ", "you need"], TimeoutError()))
+
+    async def stream():
+        async with TestClient(TestServer(async_app.create_app())) as client:
+            response = await client.post("/chat/stream", json={"message": QUESTION, "language": "en"})
+            assert response.status == 200
+            return events(await response.text())
+
+    done = asyncio.run(stream())[-1][1]
+    assert done["source"] == "rules"
+    assert chatbot.ai_cache.get(cache_key(chatbot)) is None
+    assert chatbot.ai_breaker.state != CLOSED
@@ -0,0 +1,75 @@
+"""Tests for the /tickets/status lookup queries and the server version check
+
+    python -m pytest test_ticket_queries.py
+"""
+import os
+
+import pytest
+
+os.environ.setdefault("RETRIEVAL_SERVICES", "false")
+
+import app  # noqa: E402
+import fake_database  # noqa: E402
+
+
+class VersionConnection:
+    """Answers ``SELECT VERSION()`` with ``version``"""
+
+    def __init__(self, version):
+        self.version = version
+        self.queries = []
+
+    def cursor(self, dictionary=False):
+        return self
+
+    def execute(self, query, params=()):
+        self.queries.append(query)
+
+    def fetchone(self):
+        return (self.version,)
+
+    def close(self):
+        pass
+
+
+@pytest.mark.parametrize("version, lateral", [
+    ("8.0.36", True),
+    ("8.0.14-log", True),
+    ("8.4.0", True),
+    ("8.0.13", False),
+    ("5.7.44-log", False),
+    ("10.11.6-MariaDB-0+deb12u1", False),
+    ("unknown", False),
+])
+def test_supports_lateral(version, lateral):
+    assert app.supports_lateral(version) is lateral
+
+
+def test_version_is_checked_once(monkeypatch):
+    monkeypatch.setattr(app, "ticket_queries", None)
+    conn = VersionConnection("5.7.44")
+    assert app.ticket_status_queries(conn) is app.TICKET_STATUS_QUERIES_COMPAT
+    assert app.ticket_status_queries(conn) is app.TICKET_STATUS_QUERIES_COMPAT
+    assert conn.queries == ["SELECT VERSION()"]
+
+
+@pytest.fixture(scope="module")
+def database(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("tickets") / "tickets.db")
+    fake_database.seed(path, users=200, max_tickets=9)
+    conn = fake_database.connect(path)
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize("kind, key_for", [("cnic", fake_database.cnic_for), ("email", fake_database.email_for)])
+def test_compat_lookup_returns_the_latest_tickets(database, kind, key_for):
+    values = [key_for(user_id) for user_id in range(1, 201)]
+    cursor = database.cursor(dictionary=True)
+    compat = app.query_ticket_statuses(cursor, kind, values, app.TICKET_STATUS_QUERIES_COMPAT)
+    expected = app.query_ticket_statuses(cursor, kind, values, fake_database.TICKET_STATUS_QUERIES)
+    cursor.close()
+    assert compat == expected
+    assert max(len(rows) for rows in compat.values()) == app.LATEST_TICKETS
+    # Users without tickets keep their placeholder row
+    assert any(rows == [dict(rows[0], id=None)] for rows in compat.values())
@@ -0,0 +1,190 @@
+"""Short-TTL read-through cache for ticket status lookups.
+
+Entries are keyed by lookup, e.g. ``("id", 42)`` or ``("cnic", "35202...")``,
+and hold the rows the database returned. Each entry is also indexed by the
+ticket and user IDs in its rows, so when a ticket changes every lookup that
+could show it can be dropped at once. With several gunicorn workers, an
+optional ``SqliteInvalidationLog`` carries invalidations to the other
+workers' caches.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class SqliteInvalidationLog:
+    """Append-only log of invalidated ticket and user IDs in a shared sqlite file.
+
+    Entries remember the process that wrote them, so a worker only picks up
+    changes made by the others - its own are applied locally already.
+    """
+
+    def __init__(self, path, keep_seconds=300):
+        self.path = path
+        self.keep_seconds = keep_seconds
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ticket_invalidations ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL,"
+                " id INTEGER NOT NULL, origin INTEGER NOT NULL, at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def latest(self):
+        """Sequence number of the newest entry (0 when empty)"""
+        return self._connect().execute("SELECT COALESCE(MAX(seq), 0) FROM ticket_invalidations").fetchone()[0]
+
+    def append(self, ticket_ids, user_ids):
+        now = time.time()
+        origin = os.getpid()
+        conn = self._connect()
+        conn.executemany(
+            "INSERT INTO ticket_invalidations (kind, id, origin, at) VALUES (?, ?, ?, ?)",
+            [("ticket", i, origin, now) for i in ticket_ids] + [("user", i, origin, now) for i in user_ids],
+        )
+        conn.execute("DELETE FROM ticket_invalidations WHERE at < ?", (now - self.keep_seconds,))
+
+    def since(self, seq):
+        """Other processes' entries after ``seq`` as ``(last_seq, ticket_ids, user_ids)``"""
+        rows = self._connect().execute(
+            "SELECT seq, kind, id, origin FROM ticket_invalidations WHERE seq > ? ORDER BY seq", (seq,)
+        ).fetchall()
+        pid = os.getpid()
+        ticket_ids = [id for _, kind, id, origin in rows if kind == "ticket" and origin != pid]
+        user_ids = [id for _, kind, id, origin in rows if kind == "user" and origin != pid]
+        return (rows[-1][0] if rows else seq), ticket_ids, user_ids
+
+
+class TicketStatusCache:
+    """In-process cache of ticket lookups with a short TTL and explicit invalidation.
+
+    Rows must carry ``id`` (ticket, may be None for a user without tickets)
+    and ``userId`` so the entry can be found again by ``invalidate``. Empty
+    results are cached too, so repeated lookups of unknown keys don't reach
+    the database either.
+    """
+
+    def __init__(self, ttl=15, max_entries=10000, invalidation_log=None, poll_interval=0.25):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.invalidation_log = invalidation_log
+        self.poll_interval = poll_interval
+        self._entries = OrderedDict()  # key -> (rows, expires_at, ticket_ids, user_ids)
+        self._by_ticket = {}
+        self._by_user = {}
+        self._lock = threading.Lock()
+        self._log_seq = invalidation_log.latest() if invalidation_log else 0
+        self._next_poll = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _unindex(self, key, ticket_ids, user_ids):
+        for index, ids in ((self._by_ticket, ticket_ids), (self._by_user, user_ids)):
+            for id in ids:
+                keys = index.get(id)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del index[id]
+
+    def _remove(self, key):
+        _, _, ticket_ids, user_ids = self._entries.pop(key)
+        self._unindex(key, ticket_ids, user_ids)
+
+    def _drop(self, ticket_ids, user_ids):
+        keys = set()
+        for id in ticket_ids:
+            keys |= self._by_ticket.get(id, set())
+            keys.add(("id", id))
+        for id in user_ids:
+            keys |= self._by_user.get(id, set())
+        for key in keys:
+            if key in self._entries:
+                self._remove(key)
+                self.invalidations += 1
+
+    def _poll_log(self, now):
+        # Pick up invalidations made by other workers, at most every poll_interval
+        if self.invalidation_log is None or now < self._next_poll:
+            return
+        self._next_poll = now + self.poll_interval
+        try:
+            seq, ticket_ids, user_ids = self.invalidation_log.since(self._log_seq)
+        except sqlite3.Error:
+            return
+        with self._lock:
+            self._log_seq = max(self._log_seq, seq)
+            self._drop(ticket_ids, user_ids)
+
+    def get_many(self, keys):
+        """Return ``(found, missing)``: cached rows by key, and keys to look up"""
+        now = time.monotonic()
+        self._poll_log(now)
+        found, missing = {}, []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] > now:
+                    self._entries.move_to_end(key)
+                    found[key] = entry[0]
+                    self.hits += 1
+                else:
+                    if entry is not None:
+                        self._remove(key)
+                    missing.append(key)
+                    self.misses += 1
+        return found, missing
+
+    def set(self, key, rows):
+        ticket_ids = {row["id"] for row in rows if row.get("id") is not None}
+        if key[0] == "id":
+            ticket_ids.add(key[1])
+        user_ids = {row["userId"] for row in rows if row.get("userId") is not None}
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (rows, time.monotonic() + self.ttl, ticket_ids, user_ids)
+            for id in ticket_ids:
+                self._by_ticket.setdefault(id, set()).add(key)
+            for id in user_ids:
+                self._by_user.setdefault(id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, ticket_ids=(), user_ids=()):
+        """Drop every lookup that returned (or could return) these tickets or users' tickets"""
+        ticket_ids, user_ids = list(ticket_ids), list(user_ids)
+        with self._lock:
+            self._drop(ticket_ids, user_ids)
+        if self.invalidation_log is not None:
+            self.invalidation_log.append(ticket_ids, user_ids)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_ticket.clear()
+            self._by_user.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "ttl": self.ttl,
+                "shared_invalidation": self.invalidation_log is not None,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,135 @@
+"""Compact, parsed-once view of a dashboard user's recent tickets"""
+import re
+
+TICKET_CONTEXT_MARKER = "User's Recent Tickets:"
+
+_TICKET_ID_RE = re.compile(r"#(\d+)")
+_STATUS_RE = re.compile(r"\(([A-Z_]+)\)")
+
+
+class TicketRecord:
+    """One ticket from the user's context.
+
+    ``text`` is the line shown back to the user, in the same
+    "- Ticket #12: Passport (IN_PROGRESS) | Agent: ..." form the Next.js
+    route has always sent.
+    """
+
+    __slots__ = ("id", "service", "status", "agent", "payment", "delivery", "text")
+
+    def __init__(self, id, service, status, agent=None, payment=None, delivery=None, text=None):
+        self.id = id
+        self.service = service
+        self.status = status
+        self.agent = agent
+        self.payment = payment
+        self.delivery = delivery
+        if text is None:
+            text = f"- Ticket #{id}: {service} ({status})"
+            if agent:
+                text += f" | Agent: {agent}"
+            if payment:
+                text += f" | Payment: {payment}"
+            if delivery:
+                text += f" | Delivery: {delivery}"
+        self.text = text
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a record from a structured ``tickets`` item sent to /chat"""
+        return cls(
+            data.get("id"),
+            data.get("service") or data.get("serviceName"),
+            data.get("status"),
+            agent=data.get("agent") or data.get("agentName"),
+            payment=data.get("payment") or data.get("paymentStatus"),
+            delivery=data.get("delivery") or data.get("deliveryStatus"),
+        )
+
+    @classmethod
+    def from_line(cls, line):
+        """Parse one legacy text line, keeping the line itself for display"""
+        head, *segments = line.split(" | ")
+        fields = {}
+        for segment in segments:
+            key, sep, value = segment.partition(": ")
+            if sep:
+                fields[key.strip().lower()] = value.strip()
+        ticket_id = _TICKET_ID_RE.search(head)
+        status = _STATUS_RE.search(head)
+        service = head.split(": ", 1)[1].rsplit(" (", 1)[0] if ": " in head else None
+        return cls(
+            int(ticket_id.group(1)) if ticket_id else None,
+            service,
+            status.group(1) if status else None,
+            agent=fields.get("agent"),
+            payment=fields.get("payment"),
+            delivery=fields.get("delivery"),
+            text=line,
+        )
+
+
+class TicketContext:
+    """A user's tickets plus the per-status groupings the rule engine asks about.
+
+    Every grouping is built in a single pass when the context is created,
+    so answering an intent never rescans the ticket text.
+    """
+
+    __slots__ = ("tickets", "in_progress", "completed", "open", "pending_payment",
+                 "assigned", "unassigned", "with_delivery")
+
+    def __init__(self, tickets):
+        self.tickets = tickets
+        self.in_progress = []
+        self.completed = []
+        self.open = []
+        self.pending_payment = []
+        self.assigned = []
+        self.unassigned = []
+        self.with_delivery = []
+        for ticket in tickets:
+            status = ticket.status
+            if status == "IN_PROGRESS":
+                self.in_progress.append(ticket)
+            elif status == "COMPLETED":
+                self.completed.append(ticket)
+            elif status == "OPEN":
+                self.open.append(ticket)
+            if ticket.payment == "PENDING":
+                self.pending_payment.append(ticket)
+            if ticket.agent:
+                self.assigned.append(ticket)
+            elif status != "COMPLETED":
+                # Completed tickets whose agent was removed don't need one
+                self.unassigned.append(ticket)
+            if ticket.delivery:
+                self.with_delivery.append(ticket)
+
+    def __len__(self):
+        return len(self.tickets)
+
+    @classmethod
+    def from_dicts(cls, items):
+        """Build a context from the structured ``tickets`` array"""
+        return cls([TicketRecord.from_dict(item) for item in items if isinstance(item, dict)])
+
+    @classmethod
+    def from_text(cls, section):
+        """Build a context from the legacy text block after TICKET_CONTEXT_MARKER"""
+        return cls([TicketRecord.from_line(line.strip()) for line in section.split("\n") if line.strip()])
+
+    def as_text(self):
+        """Render the context in the legacy text form, e.g. for the AI prompt"""
+        return f"\n\n{TICKET_CONTEXT_MARKER}\n" + "".join(f"{ticket.text}\n" for ticket in self.tickets)
+
+
+def split_ticket_context(message):
+    """Split a message into the user's question and its parsed ticket context.
+
+    The context is None when the message carries no ticket block at all.
+    """
+    question, marker, section = message.partition(TICKET_CONTEXT_MARKER)
+    if not marker:
+        return message.strip(), None
+    return question.strip(), TicketContext.from_text(section.split(TICKET_CONTEXT_MARKER)[0])
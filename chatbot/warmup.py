@@ -0,0 +1,107 @@
+"""Startup timing and readiness of a worker process.
+
+A worker is live as soon as it answers /health and ready once its warm-up
+has run: the database pool, inference session and metric files are open
+and the retrieval index is built, so the first real request pays for none
+of it. ``Readiness`` times each warm-up step and records its error instead
+of raising, since a worker that failed to warm up still answers from the
+rule engine. Under gunicorn with ``preload_app`` the app is imported, and
+the shared steps run, once in the master; each forked worker keeps those
+steps but restarts its own clock and readiness at the fork.
+"""
+import os
+import threading
+import time
+
+
+class Readiness:
+    """Warm-up steps and startup timings for one process.
+
+    ``started`` is when the app import began (``time.monotonic()``). Times
+    until ready and until the first response count from it, or from the
+    fork in a worker forked from a process that had already imported the
+    app.
+    """
+
+    def __init__(self, started):
+        self.import_started = started
+        self.import_seconds = None
+        self.preloaded = False
+        self.shared_warm = False
+        self.steps = {}
+        self._reset(started)
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _reset(self, started):
+        self.pid = os.getpid()
+        self.started = started
+        self.ready = False
+        self.warmup_started = None
+        self.warmup_seconds = None
+        self.ready_seconds = None
+        self.first_response_seconds = None
+        self._lock = threading.Lock()
+
+    def _after_fork(self):
+        self.preloaded = True
+        self._reset(time.monotonic())
+
+    def imported(self):
+        """Record the end of the app import; returns its duration in seconds"""
+        self.import_seconds = time.monotonic() - self.import_started
+        return self.import_seconds
+
+    def begin(self):
+        """Claim this process's warm-up; False when it has already started"""
+        with self._lock:
+            if self.warmup_started is not None:
+                return False
+            self.warmup_started = time.monotonic()
+            return True
+
+    def step(self, name, fn, *args):
+        """Run one warm-up step, recording its duration or error; returns its result or None"""
+        started = time.monotonic()
+        try:
+            result = fn(*args)
+        except Exception as e:
+            self.steps[name] = {"seconds": round(time.monotonic() - started, 4), "error": str(e)}
+            return None
+        self.steps[name] = {"seconds": round(time.monotonic() - started, 4)}
+        return result
+
+    def mark_ready(self):
+        """Finish the warm-up; returns ``(warmup_seconds, ready_seconds)``"""
+        now = time.monotonic()
+        with self._lock:
+            self.warmup_seconds = now - (self.warmup_started or now)
+            self.ready_seconds = now - self.started
+            self.ready = True
+        return self.warmup_seconds, self.ready_seconds
+
+    def first_response(self):
+        """Seconds until the first response, on the first call only; None afterwards"""
+        if self.first_response_seconds is not None:
+            return None
+        with self._lock:
+            if self.first_response_seconds is not None:
+                return None
+            self.first_response_seconds = time.monotonic() - self.started
+            return self.first_response_seconds
+
+    def stats(self):
+        """Snapshot for /health/ready and /stats"""
+        def rounded(seconds):
+            return None if seconds is None else round(seconds, 4)
+
+        return {
+            "pid": self.pid,
+            "ready": self.ready,
+            "preloaded": self.preloaded,
+            "import_seconds": rounded(self.import_seconds),
+            "warmup_seconds": rounded(self.warmup_seconds),
+            "ready_seconds": rounded(self.ready_seconds),
+            "first_response_seconds": rounded(self.first_response_seconds),
+            "uptime_seconds": rounded(time.monotonic() - self.started),
+            "steps": dict(self.steps),
+        }
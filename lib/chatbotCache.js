@@ -0,0 +1,47 @@
+// lib/chatbotCache.js
+const FLASK_API_URL = process.env.FLASK_API_URL || "http://localhost:5000";
+
+// Headers for server-side calls to the chatbot. The shared CHATBOT_SERVICE_TOKEN
+// is what lets it trust the userId we send; never expose it to the browser.
+export function chatbotHeaders(extra = {}) {
+  const token = process.env.CHATBOT_SERVICE_TOKEN;
+  return {
+    "Content-Type": "application/json",
+    ...(token ? { Authorization: `Bearer ${token}` } : {}),
+    ...extra,
+  };
+}
+
+// Tell the chatbot to drop its cached status lookups for these tickets/users.
+// Fire-and-forget: if it fails, the chatbot's cache expires within seconds anyway.
+export function invalidateChatbotTickets({ ticketIds = [], userIds = [] }) {
+  fetch(`${FLASK_API_URL}/tickets/invalidate`, {
+    method: "POST",
+    headers: chatbotHeaders(),
+    body: JSON.stringify({ ticketIds, userIds }),
+  }).catch((err) => console.error("Chatbot cache invalidation failed:", err.message));
+}
+
+// A ticket (with service, agent, payment and delivery included) in the shape
+// the chatbot keeps as a dashboard user's context
+export function toChatbotTicket(t) {
+  return {
+    id: t.id,
+    service: t.service.name,
+    status: t.status,
+    agent: t.agent?.name ?? null,
+    payment: t.payment?.status ?? null,
+    delivery: t.delivery?.status ?? null,
+  };
+}
+
+// Push changed ticket fields, e.g. [{ id: 12, status: "COMPLETED" }], into the
+// user's stored chatbot context. Fire-and-forget: a chatbot worker that misses
+// it asks for a fresh snapshot, and stored contexts expire within minutes anyway.
+export function updateChatbotContext(userId, updates) {
+  fetch(`${FLASK_API_URL}/context/${userId}`, {
+    method: "PATCH",
+    headers: chatbotHeaders(),
+    body: JSON.stringify({ updates }),
+  }).catch((err) => console.error("Chatbot context update failed:", err.message));
+}
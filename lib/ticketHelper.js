@@ -2,6 +2,7 @@
 import prisma from "@/lib/prisma";
 import nodemailer from "nodemailer";
 import { assignQueuePosition } from "@/lib/queueHelper";
+import { invalidateChatbotTickets, toChatbotTicket, updateChatbotContext } from "@/lib/chatbotCache";
 
 function priorityToNumber(priority) {
   if (priority === "HIGH" || priority === "URGENT") return 3;
@@ -22,6 +23,8 @@ export async function assignTicketToAgent(ticket, agent) {
   await prisma.ticketLog.create({
     data: { ticketId: updatedTicket.id, message: `Auto-assigned to Agent ${agent.name}` },
   });
+  invalidateChatbotTickets({ ticketIds: [updatedTicket.id], userIds: [updatedTicket.userId] });
+  updateChatbotContext(updatedTicket.userId, [{ id: updatedTicket.id, status: updatedTicket.status, agent: agent.name }]);
 
   // Email (non-blocking)
   setImmediate(async () => {
@@ -176,6 +179,8 @@ export async function createTicket({ serviceId, customerPriority, userId }) {
 
   // Assign queue position
   await assignQueuePosition(ticketWithPayment.id);
+  invalidateChatbotTickets({ ticketIds: [ticket.id], userIds: [ticket.userId] });
+  updateChatbotContext(ticket.userId, [toChatbotTicket(ticketWithPayment)]);
 
   // Email (non-blocking - run in background)
   setImmediate(async () => {